@@ -52,12 +52,8 @@ else:
 
 app.config.from_object('app.config')
 
-# Serve uploaded photos
-from werkzeug.middleware.shared_data import SharedDataMiddleware
-uploads_path = os.path.join(app.root_path, '..', 'uploads')
-app.wsgi_app = SharedDataMiddleware(app.wsgi_app, {
-    '/uploads': uploads_path
-})
+# Uploaded photos are served by the /uploads/photos route in routes.py so
+# they can be transcoded to WebP/AVIF based on the Accept header
 
 # Initialize database
 from app import db
@@ -66,6 +62,35 @@ db.init_app(app)
 # Import routes
 from app import routes
 
+# Register maintenance CLI commands
+from app import commands
+
+
+def start_background_services():
+    """
+    Start this process's job workers and background index loads.
+
+    Servers call this once per process (see wsgi.py); CLI commands and
+    tests only import the app, which starts nothing.
+    """
+    from app.job_queue import job_queue
+    from app.gazetteer import gazetteer
+    from app.boundaries import place_resolver
+    from app.config import RECLAIM_ENABLED
+
+    # Start background job workers and requeue jobs left over from a restart
+    job_queue.start()
+
+    # Periodically quarantine and then delete photo files no Photos row
+    # references (opt-in: RECLAIM_ENABLED)
+    if RECLAIM_ENABLED:
+        job_queue.enqueue_once('storage_reconcile', {})
+
+    # Build the offline reverse geocoder's and boundary indexes in the background
+    gazetteer.preload()
+    place_resolver.preload()
+
+
 # Serve React frontend for all non-API routes
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -0,0 +1,372 @@
+"""Offline country, state and city lookup from bundled boundary polygons."""
+import json
+import math
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from app.gazetteer import gazetteer, Gazetteer
+from app.config import (
+    BOUNDARY_COUNTRIES_FILE,
+    BOUNDARY_STATES_FILE,
+    BOUNDARY_SIMPLIFY_TOLERANCE,
+)
+
+# (min_x, min_y, max_x, max_y) in degrees, x being longitude
+Box = Tuple[float, float, float, float]
+
+
+def simplify_ring(coordinates: Sequence[Sequence[float]], tolerance: float) -> array:
+    """
+    Douglas-Peucker simplification of a closed ring, as a flat x, y array.
+
+    Rings that would collapse below a triangle are kept as they are.
+    """
+    points = [(float(point[0]), float(point[1])) for point in coordinates]
+    if tolerance <= 0 or len(points) <= 4:
+        return array('d', [value for point in points for value in point])
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    squared_tolerance = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        farthest, farthest_distance = None, squared_tolerance
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length == 0:
+                distance = (px - x1) ** 2 + (py - y1) ** 2
+            else:
+                cross = dx * (py - y1) - dy * (px - x1)
+                distance = cross * cross / length
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    kept = [point for point, flag in zip(points, keep) if flag]
+    if len(kept) < 4:
+        kept = points
+    return array('d', [value for point in kept for value in point])
+
+
+def ring_box(ring: array) -> Box:
+    xs, ys = ring[0::2], ring[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def point_in_rings(x: float, y: float, rings: List[array]) -> bool:
+    """Even-odd test across a polygon's outer ring and holes."""
+    inside = False
+    for ring in rings:
+        count = len(ring) // 2
+        xj, yj = ring[2 * count - 2], ring[2 * count - 1]
+        for i in range(count):
+            xi, yi = ring[2 * i], ring[2 * i + 1]
+            if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+                inside = not inside
+            xj, yj = xi, yi
+    return inside
+
+
+class STRTree:
+    """
+    Static R-tree over bounding boxes, packed with Sort-Tile-Recursive.
+
+    Boxes are sorted into vertical slabs by center x, each slab by center
+    y, and cut into nodes of node_capacity; the node boxes are packed the
+    same way until one level fits in a single node.
+    """
+
+    def __init__(self, boxes: List[Box], node_capacity: int = 16):
+        self.boxes = boxes
+        self.node_capacity = node_capacity
+        # Root level first; each node is (box, indexes into the level below
+        # or, on the last level, into boxes)
+        self.levels = []
+        level_boxes = boxes
+        while level_boxes:
+            nodes = [
+                (self._union([level_boxes[i] for i in group]), group)
+                for group in self._pack(level_boxes)
+            ]
+            self.levels.insert(0, nodes)
+            if len(nodes) == 1:
+                break
+            level_boxes = [box for box, _ in nodes]
+
+    @staticmethod
+    def _union(boxes: List[Box]) -> Box:
+        return (
+            min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes),
+        )
+
+    def _pack(self, boxes: List[Box]) -> List[List[int]]:
+        capacity = self.node_capacity
+        slab_count = math.ceil(math.sqrt(math.ceil(len(boxes) / capacity)))
+        slab_size = slab_count * capacity
+        by_x = sorted(range(len(boxes)), key=lambda i: boxes[i][0] + boxes[i][2])
+        groups = []
+        for start in range(0, len(by_x), slab_size):
+            slab = sorted(by_x[start:start + slab_size], key=lambda i: boxes[i][1] + boxes[i][3])
+            groups.extend(slab[i:i + capacity] for i in range(0, len(slab), capacity))
+        return groups
+
+    def query(self, x: float, y: float) -> List[int]:
+        """Indexes of the boxes containing a point."""
+        if not self.levels:
+            return []
+        found = []
+        last_level = len(self.levels) - 1
+        stack = [(0, i) for i in range(len(self.levels[0]))]
+        while stack:
+            depth, index = stack.pop()
+            (min_x, min_y, max_x, max_y), children = self.levels[depth][index]
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                continue
+            if depth == last_level:
+                found.extend(
+                    i for i in children
+                    if self.boxes[i][0] <= x <= self.boxes[i][2] and self.boxes[i][1] <= y <= self.boxes[i][3]
+                )
+            else:
+                stack.extend((depth + 1, i) for i in children)
+        return found
+
+
+class BoundaryIndex:
+    """
+    Which feature of a GeoJSON polygon layer contains a point.
+
+    Every polygon of every feature is simplified on load and its bounding
+    box goes into an STR-tree, so a lookup only runs the point-in-polygon
+    test against the few polygons whose boxes contain the point.
+    """
+
+    def __init__(self, path: str, fields: Dict[str, Tuple[str, ...]], tolerance: float = 0.0):
+        """
+        Args:
+            path: GeoJSON FeatureCollection of Polygon/MultiPolygon features
+            fields: Output key -> feature properties to try, in order
+            tolerance: Simplification tolerance in degrees (0 keeps every vertex)
+        """
+        self.path = Path(path)
+        self.fields = fields
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.load_seconds = None
+        self.features: List[dict] = []
+        # Per polygon: index into features, and its rings
+        self._owners: List[int] = []
+        self._rings: List[List[array]] = []
+        self._tree = STRTree([])
+        self.vertices = 0
+
+    @property
+    def available(self) -> bool:
+        return self.path.is_file()
+
+    @property
+    def ready(self) -> bool:
+        """Whether lookups can run without waiting on load()."""
+        # load() sets _loaded first and holds the lock until it is done
+        return not self.available or (self._loaded and not self._lock.locked())
+
+    def _properties(self, properties: dict) -> dict:
+        values = {}
+        for key, names in self.fields.items():
+            values[key] = next(
+                (properties[name] for name in names if properties.get(name) not in (None, '', '-99')),
+                None
+            )
+        return values
+
+    def load(self) -> bool:
+        """Read and index the layer once. Returns whether any polygons are loaded."""
+        with self._lock:
+            if self._loaded:
+                return bool(self._rings)
+            self._loaded = True
+            if not self.available:
+                print(f"⚠️  No boundaries at {self.path}; offline place lookups limited")
+                return False
+
+            started = time.time()
+            with open(self.path, encoding='utf-8') as f:
+                collection = json.load(f)
+
+            boxes = []
+            for feature in collection.get('features', []):
+                geometry = feature.get('geometry') or {}
+                if geometry.get('type') == 'Polygon':
+                    polygons = [geometry['coordinates']]
+                elif geometry.get('type') == 'MultiPolygon':
+                    polygons = geometry['coordinates']
+                else:
+                    continue
+
+                owner = len(self.features)
+                self.features.append(self._properties(feature.get('properties') or {}))
+                for polygon in polygons:
+                    rings = [simplify_ring(ring, self.tolerance) for ring in polygon if len(ring) >= 4]
+                    if not rings:
+                        continue
+                    self._owners.append(owner)
+                    self._rings.append(rings)
+                    boxes.append(ring_box(rings[0]))
+                    self.vertices += sum(len(ring) // 2 for ring in rings)
+
+            self._tree = STRTree(boxes)
+            self.load_seconds = round(time.time() - started, 2)
+            print(f"🗺️  Indexed {len(self._rings)} polygons ({self.vertices} vertices) "
+                  f"from {self.path.name} in {self.load_seconds}s")
+            return bool(self._rings)
+
+    def _polygon_at(self, longitude: float, latitude: float, hint: Optional[int] = None) -> Optional[int]:
+        """Index of the polygon containing a point, trying hint first."""
+        if hint is not None:
+            min_x, min_y, max_x, max_y = self._tree.boxes[hint]
+            if (min_x <= longitude <= max_x and min_y <= latitude <= max_y
+                    and point_in_rings(longitude, latitude, self._rings[hint])):
+                return hint
+        for polygon in self._tree.query(longitude, latitude):
+            if polygon != hint and point_in_rings(longitude, latitude, self._rings[polygon]):
+                return polygon
+        return None
+
+    def locate(self, latitude: float, longitude: float) -> Optional[dict]:
+        """The fields of the feature containing a point, or None."""
+        return self.locate_many([(latitude, longitude)])[0]
+
+    def locate_many(self, points: Iterable[Tuple[float, float]]) -> List[Optional[dict]]:
+        """
+        locate() for many (latitude, longitude) points.
+
+        Photos come in runs from the same place, so each point is first
+        tested against the polygon that matched the one before it.
+        """
+        if not self.load():
+            return [None for _ in points]
+        results = []
+        last = None
+        for latitude, longitude in points:
+            polygon = self._polygon_at(longitude, latitude, last)
+            if polygon is not None:
+                last = polygon
+            results.append(self.features[self._owners[polygon]] if polygon is not None else None)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            'available': self.available,
+            'features': len(self.features),
+            'polygons': len(self._rings),
+            'vertices': self.vertices,
+            'load_seconds': self.load_seconds,
+        }
+
+
+class PlaceResolver:
+    """
+    Country, state and city for coordinates, without any network calls.
+
+    Country and state come from boundary polygons, city from the nearest
+    gazetteer place in the same country. With no boundary files installed,
+    the gazetteer's country and state are used instead.
+    """
+
+    def __init__(self, countries: BoundaryIndex, states: BoundaryIndex, places: Gazetteer):
+        self.countries = countries
+        self.states = states
+        self.places = places
+
+    @property
+    def available(self) -> bool:
+        return self.countries.available or self.states.available or self.places.available
+
+    @property
+    def ready(self) -> bool:
+        """Whether resolve() can answer now instead of waiting on preload()."""
+        return self.countries.ready and self.states.ready and self.places.ready
+
+    def preload(self):
+        """Index the boundary layers on a background thread."""
+        def load():
+            self.countries.load()
+            self.states.load()
+        if self.countries.available or self.states.available:
+            threading.Thread(target=load, name='boundaries-load', daemon=True).start()
+
+    def resolve(self, latitude: float, longitude: float) -> dict:
+        """
+        Place names for one coordinate.
+
+        Returns:
+            Dictionary with country, country_code (lowercase ISO 3166-1),
+            state and city; any of them None when unknown
+        """
+        return self.resolve_many([(latitude, longitude)])[0]
+
+    def resolve_many(self, points: Sequence[Tuple[float, float]]) -> List[dict]:
+        """
+        resolve() for a batch of (latitude, longitude) points.
+
+        Repeated coordinates (every photo at one location) are resolved once.
+        """
+        unique = list(dict.fromkeys((round(lat, 5), round(lon, 5)) for lat, lon in points))
+        countries = self.countries.locate_many(unique)
+        states = self.states.locate_many(unique)
+
+        resolved = {}
+        for point, country, state in zip(unique, countries, states):
+            country_code = (country or {}).get('code') or (state or {}).get('country_code')
+            place = {
+                'country': (country or {}).get('name') or (state or {}).get('country'),
+                'country_code': country_code.lower() if country_code else None,
+                'state': (state or {}).get('name'),
+                'city': None,
+            }
+
+            nearest = self.places.nearest(*point)
+            if nearest and nearest['distance_km'] <= self.places.max_distance_km:
+                if place['country_code'] in (None, nearest['country_code']):
+                    place['city'] = nearest['name']
+                if place['country_code'] is None:
+                    place['country'] = nearest['country']
+                    place['country_code'] = nearest['country_code']
+                    place['state'] = place['state'] or nearest['state'] or None
+            resolved[point] = place
+
+        return [resolved[(round(lat, 5), round(lon, 5))] for lat, lon in points]
+
+    def stats(self) -> dict:
+        return {
+            'countries': self.countries.stats(),
+            'states': self.states.stats(),
+            'gazetteer': self.places.stats(),
+        }
+
+
+# Singleton instance
+place_resolver = PlaceResolver(
+    BoundaryIndex(
+        BOUNDARY_COUNTRIES_FILE,
+        {'name': ('NAME', 'ADMIN', 'name'), 'code': ('ISO_A2_EH', 'ISO_A2', 'iso_a2')},
+        tolerance=BOUNDARY_SIMPLIFY_TOLERANCE,
+    ),
+    BoundaryIndex(
+        BOUNDARY_STATES_FILE,
+        {'name': ('name', 'NAME'), 'country': ('admin', 'ADMIN'), 'country_code': ('iso_a2', 'ISO_A2')},
+        tolerance=BOUNDARY_SIMPLIFY_TOLERANCE,
+    ),
+    gazetteer,
+)
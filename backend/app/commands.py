@@ -0,0 +1,72 @@
+"""Flask CLI commands for maintenance tasks (run with `flask --app app <command>`)."""
+import click
+from app import app
+from app.db import get_db
+from app.photo_service import photo_service
+from app.storage_reconciler import storage_reconciler
+from app.derivative_backfill import DERIVATIVES, create_backfill, format_duration
+from app.config import PHOTO_MIGRATION_BATCH_SIZE
+
+
+@app.cli.command('migrate-storage')
+@click.option('--batch-size', default=PHOTO_MIGRATION_BATCH_SIZE, show_default=True,
+              help='Photos rows rewritten per commit.')
+def migrate_storage(batch_size):
+    """Move uploaded photos into the sharded uploads/photos/ab/cd/ layout."""
+    stats = photo_service.migrate_photo_storage(get_db(), batch_size=batch_size)
+    print(f"✅ Moved {stats['files_moved']} photo files, rewrote {stats['rows_rewritten']} rows")
+    if stats['unreferenced_moved']:
+        print(f"   Moved {stats['unreferenced_moved']} files no photo references")
+    if stats['files_missing']:
+        print(f"⚠️  {stats['files_missing']} photos point at files that don't exist")
+
+
+@app.cli.command('sync-storage')
+@click.option('--batch-size', default=PHOTO_MIGRATION_BATCH_SIZE, show_default=True,
+              help='Photos rows checked per batch.')
+def sync_storage(batch_size):
+    """Upload photos the PHOTO_STORAGE backend doesn't have yet."""
+    stats = photo_service.sync_photo_storage(get_db(), batch_size=batch_size)
+    print(f"✅ Uploaded {stats['files_uploaded']} photo files, {stats['files_present']} already stored")
+    if stats['files_missing']:
+        print(f"⚠️  {stats['files_missing']} photos could not be uploaded or have no file")
+
+
+@app.cli.command('reconcile-storage')
+@click.option('--dry-run', is_flag=True, help='Report orphans without quarantining or deleting anything.')
+def reconcile_storage(dry_run):
+    """Quarantine photo files no Photos row references and purge expired ones."""
+    stats = storage_reconciler.run(get_db(), dry_run=dry_run)
+    verb = 'Would quarantine' if dry_run else 'Quarantined'
+    print(f"✅ Scanned {stats['files_scanned']} files: {stats['files_orphaned']} orphaned")
+    if stats['refused']:
+        print(f"⚠️  Refused to quarantine: {stats['refused']}")
+    else:
+        count = stats['files_orphaned'] if dry_run else stats['files_quarantined']
+        print(f"   {verb} {count} files")
+    print(f"   {'Would purge' if dry_run else 'Purged'} {stats['files_purged']} expired quarantined files "
+          f"({stats['bytes_reclaimed'] / (1024 * 1024):.1f}MB)")
+
+
+@app.cli.command('backfill-derivatives')
+@click.option('--only', 'derivatives', multiple=True, type=click.Choice(DERIVATIVES),
+              help='Derivative to fill in (repeatable; default all).')
+@click.option('--workers', type=int, help='Decode worker processes (default BACKFILL_WORKERS).')
+@click.option('--batch-size', type=int, help='Photos per checkpointed batch.')
+@click.option('--max-photos-per-second', type=float, help='Cap on photos processed per second (0 = none).')
+@click.option('--max-mb-per-second', type=float, help='Cap on photo bytes read per second (0 = none).')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first photo.')
+def backfill_derivatives(derivatives, workers, batch_size, max_photos_per_second, max_mb_per_second, restart):
+    """Compute hashes, placeholders, metadata and tile pyramids missing from existing photos."""
+    backfill = create_backfill(
+        derivatives,
+        workers=workers,
+        batch_size=batch_size,
+        max_photos_per_second=max_photos_per_second,
+        max_mb_per_second=max_mb_per_second,
+    )
+    stats = backfill.run(get_db(), restart=restart)
+    updated = ', '.join(f"{stats[name]} {name}" for name in backfill.derivatives)
+    print(f"✅ Scanned {stats['photos_scanned']} photos in {format_duration(stats['seconds'])}: {updated}")
+    if stats['files_missing'] or stats['failed']:
+        print(f"⚠️  {stats['files_missing']} photos have no file, {stats['failed']} derivatives failed")
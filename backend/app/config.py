@@ -11,8 +11,167 @@ DATABASE_FILENAME = APP_ROOT / 'sql' / 'JourniTag.db'  # Fixed!
 
 # Photo upload configuration
 UPLOAD_FOLDER = APP_ROOT / 'uploads' / 'photos'
+PHOTO_MIGRATION_BATCH_SIZE = 500  # Rows per commit when moving photos into the sharded layout
 MAX_CONTENT_LENGTH = 32 * 1024 * 1024  # 32MB max file size
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'heic', 'heif', 'gif'}
+EXIF_READ_LIMIT = 256 * 1024  # Max bytes scanned for EXIF before falling back to Pillow
+
+# Durable photo storage: 'local' keeps files in UPLOAD_FOLDER and the app
+# serves them; 's3' copies them to an S3-compatible bucket and redirects
+# clients to presigned URLs; 'fake-s3' runs an in-process S3 stand-in
+PHOTO_STORAGE = os.environ.get('PHOTO_STORAGE', 'local')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')  # Defaults to AWS for S3_REGION
+S3_BUCKET = os.environ.get('S3_BUCKET', 'journitag-photos')
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+# Required for PHOTO_STORAGE=s3; fake-s3 falls back to throwaway dev keys
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY', '')
+S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024  # Files above this are uploaded in parts
+S3_MULTIPART_PART_SIZE = 8 * 1024 * 1024
+S3_UPLOAD_CONCURRENCY = 4  # Parallel uploads per batch
+S3_PRESIGN_EXPIRES = 60 * 60  # Lifetime of presigned GET URLs in seconds
+FAKE_S3_FOLDER = APP_ROOT / 'uploads' / 'fake-s3'
+
+# Orphaned photo files (no Photos row) are quarantined, then deleted. The
+# daily scan only runs when enabled; `flask reconcile-storage --dry-run`
+# shows what it would do first
+RECLAIM_ENABLED = os.environ.get('RECLAIM_ENABLED', '').lower() in ('1', 'true', 'yes')
+RECLAIM_DRY_RUN = os.environ.get('RECLAIM_DRY_RUN', '').lower() in ('1', 'true', 'yes')
+# A scan finding more orphans than this share of all files quarantines
+# nothing (a wrong database or upload folder looks like mass orphaning)
+RECLAIM_MAX_ORPHAN_FRACTION = float(os.environ.get('RECLAIM_MAX_ORPHAN_FRACTION', 0.1))
+RECLAIM_GRACE_SECONDS = 7 * 24 * 60 * 60  # Time in quarantine before deletion
+RECLAIM_MIN_AGE_SECONDS = 60 * 60  # Newer files may belong to an upload in progress
+RECLAIM_INTERVAL_SECONDS = 24 * 60 * 60  # Between full reconciliation runs
+RECLAIM_BATCH_SIZE = 500  # Files checked per Photos lookup
+
+# Rows of a deleted trip removed per commit by the background purge
+TRIP_PURGE_BATCH_SIZE = 500
+
+# Raw bytes of async uploads wait here until their job processes them
+UPLOAD_INCOMING_FOLDER = APP_ROOT / 'uploads' / 'incoming'
+
+# Streaming multipart parsing of /api/photos/batch-upload
+STREAM_CHUNK_SIZE = 256 * 1024  # Bytes read from the request body at a time
+STREAM_MAX_FIELD_BYTES = 64 * 1024  # Largest non-file form field kept in memory
+
+# Files staged by /api/photos/extract-exif, committed later by token
+UPLOAD_STAGED_FOLDER = APP_ROOT / 'uploads' / 'staged'
+UPLOAD_STAGED_TTL = 60 * 60  # Tokens not used within an hour are discarded
+UPLOAD_STAGED_MAX_CONTENT_LENGTH = 1024 * 1024 * 1024  # Largest extract-exif selection (1GB)
+
+# Resumable chunked uploads (UploadSessions table)
+UPLOAD_SESSION_FOLDER = APP_ROOT / 'uploads' / 'sessions'
+UPLOAD_CHUNK_MAX_BYTES = 8 * 1024 * 1024  # Largest chunk accepted by one PATCH
+UPLOAD_FILE_MAX_BYTES = 200 * 1024 * 1024  # Largest single file a session may declare
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # Unfinished sessions are discarded after a day
+
+# Background job queue (Jobs table)
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 2))
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 5.0  # Seconds before the first retry, doubled each attempt
+JOB_LEASE_SECONDS = 600  # Running jobs locked longer than this are requeued
+JOB_POLL_INTERVAL = 1.0
+
+# Upload previews from /api/photos/extract-exif, cached by content hash
+PREVIEW_CACHE_FOLDER = APP_ROOT / 'uploads' / 'previews'
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+PREVIEW_MAX_SIZE = 800
+PREVIEW_QUALITY = 85
+PREVIEW_HEIF_THUMBNAIL_MIN = 320  # Use embedded HEIF thumbnails at least this large
+
+# Near-duplicate detection: photos whose dHashes differ in at most this many bits
+DHASH_MAX_DISTANCE = 6
+
+# Inline placeholder stored with each photo (tiny JPEG data URI, ~450 chars)
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+
+# Most files one preflight or link request may reference
+PREFLIGHT_MAX_FILES = 1000
+
+# Photos rows per multi-row INSERT (14 columns each stays well under
+# SQLite's 32766 bound-parameter limit)
+PHOTO_INSERT_BATCH_SIZE = 500
+
+# Server processes sharing this machine; gunicorn starts this many workers
+# when WEB_CONCURRENCY is set. Machine-wide limits below are split evenly
+# between them, since each process enforces its own share.
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+# Worker processes for HEIC conversion and previews, machine-wide (0 runs
+# them inline); each server process gets its share, at least one
+IMAGE_WORKERS_TOTAL = int(os.environ.get('IMAGE_WORKER_POOL_SIZE', os.cpu_count() or 2))
+IMAGE_WORKER_POOL_SIZE = max(1, IMAGE_WORKERS_TOTAL // WEB_CONCURRENCY) if IMAGE_WORKERS_TOTAL else 0
+IMAGE_TASK_TIMEOUT = 120  # Seconds before a single image task is abandoned
+
+# HEIC uploads are stored as-is and transcoded into the image cache on first
+# view; set to convert them to JPEG at upload time instead
+HEIC_EAGER_TRANSCODE = os.environ.get('HEIC_EAGER_TRANSCODE', '').lower() in ('1', 'true', 'yes')
+
+# Pixel memory all in-flight decodes on the machine may use, split evenly
+# between the WEB_CONCURRENCY server processes; work beyond a process's share
+# queues. Estimated from the image header as width x height x bands.
+DECODE_MEMORY_TOTAL = int(os.environ.get('DECODE_MEMORY_BUDGET', 768 * 1024 * 1024))
+DECODE_MEMORY_BUDGET = DECODE_MEMORY_TOTAL // WEB_CONCURRENCY
+DECODE_MAX_PIXELS = 120_000_000  # Larger images are rejected before decoding
+DECODE_WAIT_TIMEOUT = 60  # Seconds a decode may queue before giving up
+
+# On-demand image variants (/api/images/<photo_id>)
+IMAGE_CACHE_FOLDER = APP_ROOT / 'uploads' / 'cache'
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB
+# All server processes share the cache directory; each re-reads it this
+# often (in seconds) so eviction counts the others' variants too
+IMAGE_CACHE_RESCAN_INTERVAL = 60
+IMAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # Browser cache lifetime in seconds
+IMAGE_VARIANT_MAX_DIMENSION = 4096
+IMAGE_VARIANT_QUALITY = 82
+IMAGE_WEBP_QUALITY = 80
+IMAGE_AVIF_QUALITY = 60
+
+# Deep Zoom (DZI) tile pyramids for panoramas and very large photos
+DEEPZOOM_FOLDER = APP_ROOT / 'uploads' / 'tiles'
+# Photos at least this many pixels, or this long on one side (panoramas),
+# get a pyramid; smaller ones are served whole
+DEEPZOOM_MIN_PIXELS = 40_000_000
+DEEPZOOM_MIN_DIMENSION = 10_000
+DEEPZOOM_TILE_SIZE = 256
+DEEPZOOM_TILE_OVERLAP = 1
+DEEPZOOM_TILE_QUALITY = 85
+DEEPZOOM_TILE_MAX_AGE = 365 * 24 * 60 * 60  # Tiles never change for a stored file
+
+# `flask backfill-derivatives`: recompute derivatives for existing photos.
+# Rate caps keep it from starving live traffic (0 means uncapped).
+BACKFILL_BATCH_SIZE = 200  # Photos per checkpointed batch
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', IMAGE_WORKER_POOL_SIZE))
+BACKFILL_MAX_PHOTOS_PER_SECOND = float(os.environ.get('BACKFILL_MAX_PHOTOS_PER_SECOND', 0))
+BACKFILL_MAX_MB_PER_SECOND = float(os.environ.get('BACKFILL_MAX_MB_PER_SECOND', 0))
+
+# Reverse geocoding cache. Its own SQLite file, so lookups made while a
+# request holds a write transaction on the main database never wait on it.
+GEOCODE_CACHE_FILENAME = APP_ROOT / 'sql' / 'geocode_cache.db'
+GEOCODE_CACHE_PRECISION = 4  # Decimal places kept in the key (1e-4 degrees is about 11m)
+GEOCODE_CACHE_TTL = 90 * 24 * 60 * 60  # Places found
+GEOCODE_NOT_FOUND_TTL = 7 * 24 * 60 * 60  # Coordinates Nominatim has no address for
+GEOCODE_ERROR_TTL = 5 * 60  # Timeouts and API errors, so an outage isn't hammered
+GEOCODE_MEMORY_CACHE_SIZE = 10_000  # Entries kept in the in-process LRU
+
+# Offline reverse geocoder built from GeoNames dumps (download with
+# `bin/JourniTagDB gazetteer`). Names new upload locations without waiting
+# on Nominatim, and stands in for it when it is down or finds nothing.
+GAZETTEER_FOLDER = pathlib.Path(os.environ.get('GAZETTEER_FOLDER', APP_ROOT / 'data' / 'geonames'))
+GAZETTEER_PLACES_FILE = GAZETTEER_FOLDER / os.environ.get('GAZETTEER_PLACES', 'cities15000.txt')
+GAZETTEER_ADMIN1_FILE = GAZETTEER_FOLDER / 'admin1CodesASCII.txt'
+GAZETTEER_COUNTRY_FILE = GAZETTEER_FOLDER / 'countryInfo.txt'
+GAZETTEER_MAX_DISTANCE_KM = 50  # Farther than this from any place counts as no match
+
+# Offline country and state boundaries (Natural Earth GeoJSON, download with
+# `bin/JourniTagDB boundaries`) for filling in trip places and per-country stats
+BOUNDARIES_FOLDER = pathlib.Path(os.environ.get('BOUNDARIES_FOLDER', APP_ROOT / 'data' / 'boundaries'))
+BOUNDARY_COUNTRIES_FILE = BOUNDARIES_FOLDER / 'ne_50m_admin_0_countries.geojson'
+BOUNDARY_STATES_FILE = BOUNDARIES_FOLDER / 'ne_10m_admin_1_states_provinces.geojson'
+BOUNDARY_SIMPLIFY_TOLERANCE = 0.01  # Degrees (about 1km); vertices closer than this to a ring's line are dropped
+BOUNDARY_RESOLVE_MAX_POINTS = 10_000  # Points accepted per POST /api/places/resolve
 
 # Secret key for sessions
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-this-in-production')
\ No newline at end of file
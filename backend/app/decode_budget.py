@@ -0,0 +1,168 @@
+"""Admission control for image decodes, bounded by an estimate of their pixel memory."""
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Tuple
+from PIL import Image
+from app.config import DECODE_MEMORY_BUDGET, DECODE_MAX_PIXELS, DECODE_WAIT_TIMEOUT
+
+# Direct Image.open() calls warn past this and refuse twice it
+Image.MAX_IMAGE_PIXELS = DECODE_MAX_PIXELS
+
+
+class ImageTooLargeError(ValueError):
+    """The image has more pixels than any decode may allocate."""
+
+
+class DecodeBudgetTimeout(TimeoutError):
+    """A decode waited too long for room in the memory budget."""
+
+
+class DecodeBudget:
+    """
+    Process-wide budget for the pixel memory of in-flight image decodes.
+
+    Each decode reserves its estimated cost before it starts and gives it
+    back when it finishes; decodes that don't fit wait in FIFO order, so a
+    burst of large uploads slows down instead of exhausting memory. A
+    single decode larger than the whole budget runs once nothing else is.
+    """
+
+    def __init__(self, max_bytes: int, max_pixels: int, wait_timeout: float = 60):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._in_use = 0
+        self._active = 0
+        self._peak = 0
+        self._admitted = 0
+        self._timed_out = 0
+        self._rejected = 0
+
+    def estimate(self, source_path: str, box: Optional[Tuple[Optional[int], Optional[int]]] = None) -> int:
+        """
+        Estimate the bytes decoding an image needs, reading only its header.
+
+        Args:
+            source_path: Image file on disk
+            box: (width, height) the decode will be drafted down to, if the
+                caller uses Image.draft(); None on either side means full size
+
+        Returns:
+            width x height x bands of the decoded image
+
+        Raises:
+            ImageTooLargeError: If the image exceeds max_pixels
+        """
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+        except ImportError:
+            pass
+
+        try:
+            with Image.open(source_path) as img:
+                width, height = img.size
+                image_format = img.format
+                bands = len(img.getbands())
+        except Image.DecompressionBombError as e:
+            self._count_rejected()
+            raise ImageTooLargeError(str(e))
+
+        if width * height > self.max_pixels:
+            self._count_rejected()
+            raise ImageTooLargeError(
+                f"Image is {width}x{height} ({width * height} pixels); the limit is {self.max_pixels}"
+            )
+
+        # Only JPEG can decode at a reduced scale: 1/2, 1/4 or 1/8, whichever
+        # still covers the box (the same choice Image.draft() makes)
+        if image_format == 'JPEG' and box is not None:
+            box_width, box_height = box[0] or width, box[1] or height
+            scale = min(width // box_width, height // box_height)
+            for factor in (8, 4, 2):
+                if scale >= factor:
+                    width, height = -(-width // factor), -(-height // factor)
+                    break
+
+        return width * height * bands
+
+    def _count_rejected(self):
+        with self._cond:
+            self._rejected += 1
+
+    def acquire(self, cost: int, timeout: Optional[float] = None) -> int:
+        """
+        Wait until cost bytes fit in the budget and reserve them.
+
+        Returns:
+            The bytes reserved, to hand back to release()
+
+        Raises:
+            DecodeBudgetTimeout: If no room opened up within timeout seconds
+        """
+        cost = min(cost, self.max_bytes)
+        timeout = self.wait_timeout if timeout is None else timeout
+        ticket = object()
+
+        with self._cond:
+            self._waiting.append(ticket)
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: self._waiting[0] is ticket and self._in_use + cost <= self.max_bytes,
+                    timeout
+                )
+            finally:
+                self._waiting.remove(ticket)
+                # The next decode in line may fit now
+                self._cond.notify_all()
+
+            if not admitted:
+                self._timed_out += 1
+                raise DecodeBudgetTimeout(
+                    f"Server is busy decoding images; waited {timeout}s for "
+                    f"{cost / (1024 * 1024):.0f}MB of decode memory"
+                )
+
+            self._in_use += cost
+            self._active += 1
+            self._admitted += 1
+            self._peak = max(self._peak, self._in_use)
+        return cost
+
+    def release(self, cost: int):
+        """Give back bytes reserved by acquire()."""
+        with self._cond:
+            self._in_use -= cost
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, source_path: str, box: Optional[Tuple[Optional[int], Optional[int]]] = None):
+        """Hold a reservation for decoding source_path for the duration of the block."""
+        cost = self.acquire(self.estimate(source_path, box))
+        try:
+            yield cost
+        finally:
+            self.release(cost)
+
+    def stats(self) -> dict:
+        """Current reservations, queue depth and lifetime counters."""
+        with self._cond:
+            return {
+                'budget_bytes': self.max_bytes,
+                'max_pixels': self.max_pixels,
+                'in_use_bytes': self._in_use,
+                'peak_bytes': self._peak,
+                'active': self._active,
+                'queued': len(self._waiting),
+                'admitted': self._admitted,
+                'timed_out': self._timed_out,
+                'rejected': self._rejected,
+            }
+
+
+# Singleton instance
+decode_budget = DecodeBudget(DECODE_MEMORY_BUDGET, DECODE_MAX_PIXELS, DECODE_WAIT_TIMEOUT)
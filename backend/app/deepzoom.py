@@ -0,0 +1,102 @@
+"""Deep Zoom (DZI) tile pyramids so viewers load large photos a tile at a time."""
+import hashlib
+import math
+import shutil
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Optional
+from app.image_workers import image_worker_pool, render_tile_pyramid
+from app.config import (
+    DEEPZOOM_FOLDER,
+    DEEPZOOM_MIN_PIXELS,
+    DEEPZOOM_MIN_DIMENSION,
+    DEEPZOOM_TILE_SIZE,
+    DEEPZOOM_TILE_OVERLAP,
+    DEEPZOOM_TILE_QUALITY,
+)
+
+
+class DeepZoom:
+    """
+    Render and locate tile pyramids for photos above a size threshold.
+
+    Pyramids are derived from the stored file, so they are keyed by its
+    filename and shared by every row pointing at that file.
+    """
+
+    def __init__(
+        self,
+        tiles_dir: str,
+        min_pixels: int = 40_000_000,
+        min_dimension: int = 10_000,
+        tile_size: int = 256,
+        overlap: int = 1,
+        quality: int = 85
+    ):
+        self.tiles_dir = Path(tiles_dir)
+        self.tiles_dir.mkdir(parents=True, exist_ok=True)
+        self.min_pixels = min_pixels
+        self.min_dimension = min_dimension
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.quality = quality
+
+    def wants_pyramid(self, width: Optional[int], height: Optional[int]) -> bool:
+        """Whether a photo is large enough to be worth tiling."""
+        if not width or not height:
+            return False
+        return width * height >= self.min_pixels or max(width, height) >= self.min_dimension
+
+    def pyramid_dir(self, file_url: str) -> Path:
+        """Directory holding a stored file's pyramid, sharded two levels deep."""
+        filename = Path(file_url).name
+        digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+        return self.tiles_dir / digest[:2] / digest[2:4] / Path(filename).stem
+
+    def descriptor_path(self, file_url: str) -> Optional[Path]:
+        """The .dzi descriptor for a stored file, if its pyramid has been rendered."""
+        path = self.pyramid_dir(file_url) / 'image.dzi'
+        return path if path.is_file() else None
+
+    def tile_path(self, file_url: str, level: int, col: int, row: int) -> Optional[Path]:
+        """A rendered tile, or None if the pyramid or that tile doesn't exist."""
+        path = self.pyramid_dir(file_url) / str(level) / f"{col}_{row}.jpg"
+        return path if path.is_file() else None
+
+    def describe(self, file_url: str) -> Optional[dict]:
+        """Width, height and level count of an already rendered pyramid, or None."""
+        path = self.descriptor_path(file_url)
+        if path is None:
+            return None
+        size = ET.parse(path).getroot().find('{http://schemas.microsoft.com/deepzoom/2008}Size')
+        width, height = int(size.get('Width')), int(size.get('Height'))
+        return {'width': width, 'height': height, 'levels': math.ceil(math.log2(max(width, height))) + 1}
+
+    def render(self, source_path: Path, file_url: str) -> dict:
+        """
+        Tile a stored photo on the image worker pool.
+
+        Returns:
+            Dictionary with width, height, levels and tiles
+        """
+        pyramid = image_worker_pool.run(
+            render_tile_pyramid, str(source_path), str(self.pyramid_dir(file_url)),
+            self.tile_size, self.overlap, self.quality
+        )
+        print(f"🧩 Rendered {pyramid['tiles']} tiles in {pyramid['levels']} levels for {file_url}")
+        return pyramid
+
+    def remove(self, file_url: str):
+        """Delete the pyramid of a stored file that is being purged."""
+        shutil.rmtree(self.pyramid_dir(file_url), ignore_errors=True)
+
+
+# Singleton instance
+deep_zoom = DeepZoom(
+    DEEPZOOM_FOLDER,
+    min_pixels=DEEPZOOM_MIN_PIXELS,
+    min_dimension=DEEPZOOM_MIN_DIMENSION,
+    tile_size=DEEPZOOM_TILE_SIZE,
+    overlap=DEEPZOOM_TILE_OVERLAP,
+    quality=DEEPZOOM_TILE_QUALITY,
+)
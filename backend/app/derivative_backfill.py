@@ -0,0 +1,317 @@
+"""Bring photos uploaded before a derivative existed up to date, in resumable batches."""
+import json
+import time
+from typing import Iterable, List, Optional
+from PIL import Image
+from app.photo_service import photo_service, IMAGE_FIELDS
+from app.image_workers import ImageWorkerPool, analyze_photo, render_tile_pyramid
+from app.deepzoom import deep_zoom
+from app.config import (
+    PLACEHOLDER_SIZE,
+    PLACEHOLDER_QUALITY,
+    IMAGE_TASK_TIMEOUT,
+    BACKFILL_BATCH_SIZE,
+    BACKFILL_WORKERS,
+    BACKFILL_MAX_PHOTOS_PER_SECOND,
+    BACKFILL_MAX_MB_PER_SECOND,
+)
+
+# What the backfill can fill in, in the order each batch computes them
+DERIVATIVES = (
+    'image',     # dhash, width, height and placeholder on Photos
+    'metadata',  # the PhotoMetadata row
+    'deepzoom',  # tile pyramids for photos above the Deep Zoom threshold
+)
+
+
+def format_duration(seconds: float) -> str:
+    """Render a duration like 2h05m, 4m30s or 12s."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class RateLimiter:
+    """Pace a loop to at most rate units per second; 0 disables the cap."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = time.monotonic()
+
+    def wait(self, units: float = 1):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        # Idle time doesn't bank a burst allowance
+        self._next = max(self._next, now) + units / self.rate
+
+
+class DerivativeBackfill:
+    """
+    Walk Photos in id order and compute whichever derivatives each row lacks.
+
+    Decoding fans out across a dedicated image worker pool. Each batch's
+    results are committed together with a checkpoint (the last photo id
+    done), so an interrupted run picks up where it stopped. Photos per
+    second and MB read per second can be capped so the backfill can run
+    next to production traffic.
+    """
+
+    def __init__(
+        self,
+        service,
+        derivatives: Iterable[str] = DERIVATIVES,
+        workers: int = 2,
+        batch_size: int = 200,
+        max_photos_per_second: float = 0,
+        max_mb_per_second: float = 0
+    ):
+        unknown = set(derivatives) - set(DERIVATIVES)
+        if unknown:
+            raise ValueError(f"Unknown derivatives: {', '.join(sorted(unknown))}")
+        self.service = service
+        self.derivatives = [name for name in DERIVATIVES if name in derivatives]
+        self.batch_size = batch_size
+        self.pool = ImageWorkerPool(workers, IMAGE_TASK_TIMEOUT)
+        self.photo_rate = RateLimiter(max_photos_per_second)
+        self.byte_rate = RateLimiter(max_mb_per_second * 1024 * 1024)
+
+    @property
+    def checkpoint_name(self) -> str:
+        """Each combination of derivatives keeps its own checkpoint."""
+        return '+'.join(self.derivatives)
+
+    def load_checkpoint(self, connection) -> int:
+        cursor = connection.execute(
+            "SELECT last_photo_id FROM BackfillCheckpoints WHERE name = ?",
+            (self.checkpoint_name,)
+        )
+        checkpoint = cursor.fetchone()
+        return checkpoint['last_photo_id'] if checkpoint else 0
+
+    def save_checkpoint(self, connection, last_photo_id: int, stats: dict):
+        """Record progress (without committing; it commits with the batch's results)."""
+        connection.execute(
+            """
+            INSERT INTO BackfillCheckpoints (name, last_photo_id, stats, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                last_photo_id = excluded.last_photo_id,
+                stats = excluded.stats,
+                updated_at = excluded.updated_at
+            """,
+            (self.checkpoint_name, last_photo_id, json.dumps(stats), int(time.time()))
+        )
+
+    def run(self, connection, restart: bool = False) -> dict:
+        """
+        Backfill every photo after the checkpoint.
+
+        Args:
+            connection: SQLite database connection
+            restart: Ignore the checkpoint and start from the first photo
+
+        Returns:
+            Dictionary with photos scanned and updated per derivative, plus
+            photos skipped as up to date, missing files and failures
+        """
+        last_id = 0 if restart else self.load_checkpoint(connection)
+        cursor = connection.execute(
+            "SELECT COUNT(*) AS n FROM Photos WHERE id > ? AND deleted_at IS NULL",
+            (last_id,)
+        )
+        total = cursor.fetchone()['n']
+        print(f"🔁 Backfilling {', '.join(self.derivatives)} for {total} photos after id {last_id}")
+
+        stats = {'photos_scanned': 0, 'up_to_date': 0, 'files_missing': 0, 'failed': 0, 'bytes_read': 0}
+        stats.update({name: 0 for name in self.derivatives})
+        started = time.time()
+
+        try:
+            while True:
+                cursor = connection.execute(
+                    """
+                    SELECT p.*, m.photo_id IS NOT NULL AS has_metadata
+                    FROM Photos p
+                    LEFT JOIN PhotoMetadata m ON m.photo_id = p.id
+                    WHERE p.id > ? AND p.deleted_at IS NULL
+                    ORDER BY p.id
+                    LIMIT ?
+                    """,
+                    (last_id, self.batch_size)
+                )
+                photos = cursor.fetchall()
+                if not photos:
+                    break
+
+                self.process_batch(connection, photos, stats)
+                last_id = photos[-1]['id']
+                stats['photos_scanned'] += len(photos)
+                self.save_checkpoint(connection, last_id, stats)
+                connection.commit()
+                self.report(stats, total, started)
+        finally:
+            self.pool.shutdown()
+
+        stats['seconds'] = round(time.time() - started, 1)
+        return stats
+
+    def report(self, stats: dict, total: int, started: float):
+        """Print throughput and the time left at the current rate."""
+        elapsed = max(time.time() - started, 1e-6)
+        done = stats['photos_scanned']
+        rate = done / elapsed
+        eta = format_duration((total - done) / rate) if rate > 0 else '?'
+        print(
+            f"📈 {done}/{total} photos ({100 * done / max(total, 1):.1f}%), "
+            f"{rate:.1f} photos/s, {stats['bytes_read'] / elapsed / (1024 * 1024):.1f} MB/s, ETA {eta}"
+        )
+
+    def process_batch(self, connection, photos: List[dict], stats: dict):
+        """Compute and store the missing derivatives of one batch (without committing)."""
+        wanted = []
+        for photo in photos:
+            needs_image = 'image' in self.derivatives and any(photo[field] is None for field in IMAGE_FIELDS)
+            needs_metadata = 'metadata' in self.derivatives and not photo['has_metadata']
+            # Unknown dimensions may still turn out to need a pyramid once analyzed
+            needs_deepzoom = 'deepzoom' in self.derivatives and not photo['deepzoom_levels'] and (
+                needs_image or deep_zoom.wants_pyramid(photo['width'], photo['height'])
+            )
+            if not (needs_image or needs_metadata or needs_deepzoom):
+                stats['up_to_date'] += 1
+                continue
+
+            path = self.service.get_photo_path(photo['file_url'])
+            if not path.exists():
+                stats['files_missing'] += 1
+                continue
+
+            self.photo_rate.wait()
+            size = path.stat().st_size
+            self.byte_rate.wait(size)
+            stats['bytes_read'] += size
+            wanted.append((photo, path, needs_image, needs_metadata, needs_deepzoom))
+
+        # Image analysis first: metadata orientation and the Deep Zoom
+        # threshold both depend on the dimensions it finds
+        analyses = iter(self.pool.gather([
+            self.pool.submit(
+                analyze_photo, str(path), 8, PLACEHOLDER_SIZE, PLACEHOLDER_QUALITY,
+                decode_size=max(8 * 8, PLACEHOLDER_SIZE * 4)
+            )
+            for _, path, needs_image, _, _ in wanted if needs_image
+        ]))
+
+        metadata_rows = []
+        pyramids = {}
+        for photo, path, needs_image, needs_metadata, needs_deepzoom in wanted:
+            if needs_image:
+                analysis = next(analyses)
+                if isinstance(analysis, Exception):
+                    print(f"⚠️ Could not analyze photo {photo['id']}: {analysis}")
+                    stats['failed'] += 1
+                else:
+                    connection.execute(
+                        """
+                        UPDATE Photos SET
+                            dhash = COALESCE(dhash, ?), width = COALESCE(width, ?),
+                            height = COALESCE(height, ?), placeholder = COALESCE(placeholder, ?)
+                        WHERE id = ?
+                        """,
+                        (analysis['dhash'], analysis['width'], analysis['height'],
+                         analysis['placeholder'], photo['id'])
+                    )
+                    for field in IMAGE_FIELDS:
+                        if photo[field] is None:
+                            photo[field] = analysis[field]
+                    stats['image'] += 1
+
+            if needs_metadata:
+                try:
+                    details = self.service.extract_camera_details(self.service.extract_exif_data(str(path)))
+                except Exception as e:
+                    print(f"⚠️ Could not read metadata for photo {photo['id']}: {e}")
+                    details = {}
+                if not photo['width'] or not photo['height']:
+                    # Photos from before dimensions were stored, when 'image'
+                    # isn't being filled: orientation needs the size
+                    self.fill_dimensions(connection, photo, path, details.get('exif_orientation'))
+                details['orientation'] = self.service.photo_orientation(photo['width'], photo['height'])
+                details['format'] = self.service.photo_format(photo['original_filename'] or photo['file_url'])
+                metadata_rows.append((photo['id'], details))
+
+            if needs_deepzoom and deep_zoom.wants_pyramid(photo['width'], photo['height']):
+                # Rows sharing a file share its pyramid
+                pyramids.setdefault(photo['file_url'], path)
+
+        if metadata_rows:
+            self.service.record_photo_metadata(connection, metadata_rows)
+            stats['metadata'] += len(metadata_rows)
+
+        self.render_pyramids(connection, pyramids, stats)
+
+    def fill_dimensions(self, connection, photo: dict, path, exif_orientation: Optional[int]):
+        """Store a photo's displayed width and height, read from its header without decoding."""
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+        except Exception as e:
+            print(f"⚠️ Could not read dimensions of photo {photo['id']}: {e}")
+            return
+        # Orientations 5-8 rotate by 90 degrees
+        if exif_orientation in (5, 6, 7, 8):
+            width, height = height, width
+        connection.execute(
+            "UPDATE Photos SET width = COALESCE(width, ?), height = COALESCE(height, ?) WHERE id = ?",
+            (width, height, photo['id'])
+        )
+        photo['width'], photo['height'] = photo['width'] or width, photo['height'] or height
+
+    def render_pyramids(self, connection, pyramids: dict, stats: dict):
+        """Tile the batch's large photos across the pool and record their level counts."""
+        rendered = {}
+        pending = []
+        for file_url, path in pyramids.items():
+            # Linked rows may point at a file that is already tiled
+            existing = deep_zoom.describe(file_url)
+            if existing:
+                rendered[file_url] = existing
+            else:
+                pending.append((file_url, path))
+
+        results = self.pool.gather([
+            self.pool.submit(
+                render_tile_pyramid, str(path), str(deep_zoom.pyramid_dir(file_url)),
+                deep_zoom.tile_size, deep_zoom.overlap, deep_zoom.quality
+            )
+            for file_url, path in pending
+        ])
+        rendered.update(zip([file_url for file_url, _ in pending], results))
+
+        for file_url, pyramid in rendered.items():
+            if isinstance(pyramid, Exception):
+                print(f"⚠️ Could not tile {file_url}: {pyramid}")
+                stats['failed'] += 1
+                continue
+            connection.execute(
+                "UPDATE Photos SET deepzoom_levels = ? WHERE file_url IN (?, ?)",
+                (pyramid['levels'], *self.service.photo_urls(file_url))
+            )
+            stats['deepzoom'] += 1
+
+
+def create_backfill(derivatives: Optional[Iterable[str]] = None, **overrides) -> DerivativeBackfill:
+    """A backfill configured from BACKFILL_* settings, with CLI overrides."""
+    options = {
+        'workers': BACKFILL_WORKERS,
+        'batch_size': BACKFILL_BATCH_SIZE,
+        'max_photos_per_second': BACKFILL_MAX_PHOTOS_PER_SECOND,
+        'max_mb_per_second': BACKFILL_MAX_MB_PER_SECOND,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return DerivativeBackfill(photo_service, derivatives or DERIVATIVES, **options)
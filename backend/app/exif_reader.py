@@ -0,0 +1,373 @@
+"""Header-only EXIF reader for JPEG and HEIC that never decodes pixel data."""
+import struct
+from typing import BinaryIO, Optional, Tuple
+from app.config import EXIF_READ_LIMIT
+
+# TIFF tags we care about, by IFD
+IFD0_TAGS = {
+    0x010F: 'Make',
+    0x0110: 'Model',
+    0x0112: 'Orientation',
+    0x0132: 'DateTime',
+}
+EXIF_IFD_TAGS = {
+    0x829A: 'ExposureTime',
+    0x829D: 'FNumber',
+    0x8827: 'ISOSpeedRatings',
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'DateTimeDigitized',
+    0x920A: 'FocalLength',
+    0xA434: 'LensModel',
+}
+GPS_IFD_TAGS = {
+    0x0001: 'GPSLatitudeRef',
+    0x0002: 'GPSLatitude',
+    0x0003: 'GPSLongitudeRef',
+    0x0004: 'GPSLongitude',
+    0x0005: 'GPSAltitudeRef',
+    0x0006: 'GPSAltitude',
+}
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+# TIFF field type -> (struct code, size in bytes)
+TIFF_TYPES = {
+    1: ('B', 1),   # BYTE
+    2: ('s', 1),   # ASCII
+    3: ('H', 2),   # SHORT
+    4: ('I', 4),   # LONG
+    5: ('II', 8),  # RATIONAL
+    7: ('B', 1),   # UNDEFINED
+    9: ('i', 4),   # SLONG
+    10: ('ii', 8), # SRATIONAL
+}
+
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif'}
+
+
+class ExifFormatError(Exception):
+    """Raised when a file's metadata layout can't be parsed from its header."""
+
+
+class ExifReader:
+    """Read GPS, timestamps and camera tags straight from the container headers."""
+
+    def __init__(self, read_limit: int = 256 * 1024):
+        # Never look further than this many bytes into a file for metadata
+        self.read_limit = read_limit
+
+    def read(self, image_path: str) -> Optional[dict]:
+        """
+        Extract EXIF metadata without opening the image with Pillow.
+
+        Returns:
+            Dictionary shaped like PhotoService.extract_exif_data (tag names
+            as keys, GPS tags under 'GPSInfo'), an empty dict if the file
+            has no EXIF, or None if the container could not be parsed and
+            the caller should fall back to a full decode.
+        """
+        try:
+            with open(image_path, 'rb') as f:
+                head = f.read(12)
+                if head[:2] == b'\xff\xd8':
+                    tiff = self._find_jpeg_exif(f)
+                elif head[4:8] == b'ftyp' and head[8:12] in HEIF_BRANDS:
+                    tiff = self._find_heif_exif(f)
+                else:
+                    return None
+
+            if tiff is None:
+                return {}
+            return self._parse_tiff(tiff)
+        except (ExifFormatError, struct.error, OSError, ValueError) as e:
+            print(f"Fast EXIF read failed for {image_path}: {e}")
+            return None
+
+    def _find_jpeg_exif(self, f: BinaryIO) -> Optional[bytes]:
+        """Walk JPEG marker segments until the Exif APP1 payload or start of scan."""
+        f.seek(2)
+        while f.tell() < self.read_limit:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ExifFormatError("Invalid JPEG marker")
+
+            marker_type = marker[1]
+            if marker_type == 0xFF:
+                # Fill byte; the real marker follows
+                f.seek(-1, 1)
+                continue
+            if marker_type in (0xD9, 0xDA):
+                # End of image or start of scan: no EXIF before pixel data
+                return None
+            if 0xD0 <= marker_type <= 0xD7 or marker_type == 0x01:
+                continue
+
+            (length,) = struct.unpack('>H', f.read(2))
+            if length < 2:
+                raise ExifFormatError("Invalid JPEG segment length")
+
+            if marker_type == 0xE1:
+                payload = f.read(length - 2)
+                if payload[:6] == b'Exif\x00\x00':
+                    return payload[6:]
+                # XMP also lives in APP1; keep looking
+                continue
+
+            f.seek(length - 2, 1)
+
+        # Segments before the Exif one (big XMP, ICC or maker blocks) ran past
+        # the limit; the EXIF may still be there, so let the caller decode
+        raise ExifFormatError("No start of scan within read limit")
+
+    def _read_box_header(self, f: BinaryIO, end: int) -> Optional[Tuple[bytes, int, int]]:
+        """Read an ISO-BMFF box header; returns (type, payload_start, box_end)."""
+        start = f.tell()
+        if start + 8 > end:
+            return None
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        if size == 1:
+            (size,) = struct.unpack('>Q', f.read(8))
+        elif size == 0:
+            size = end - start
+        if size < 8 or start + size > end:
+            raise ExifFormatError(f"Invalid {box_type!r} box size")
+        return box_type, f.tell(), start + size
+
+    def _find_heif_exif(self, f: BinaryIO) -> Optional[bytes]:
+        """Locate the Exif item through the HEIF meta box and read only its extent."""
+        f.seek(0, 2)
+        file_size = f.tell()
+        f.seek(0)
+
+        meta = None
+        while f.tell() < min(file_size, self.read_limit):
+            header = self._read_box_header(f, file_size)
+            if header is None:
+                break
+            box_type, payload_start, box_end = header
+            if box_type == b'meta':
+                if box_end - payload_start > self.read_limit:
+                    raise ExifFormatError("meta box exceeds read limit")
+                meta = (payload_start, f.read(box_end - payload_start))
+                break
+            f.seek(box_end)
+
+        if meta is None:
+            raise ExifFormatError("No meta box found")
+
+        meta_start, meta_data = meta
+        exif_item_ids = set()
+        locations = {}
+        idat_offset = None
+
+        # meta is a FullBox: skip version and flags
+        position = 4
+        while position + 8 <= len(meta_data):
+            size, box_type = struct.unpack_from('>I4s', meta_data, position)
+            header_size = 8
+            if size == 1:
+                (size,) = struct.unpack_from('>Q', meta_data, position + 8)
+                header_size = 16
+            elif size == 0:
+                size = len(meta_data) - position
+            if size < header_size:
+                raise ExifFormatError(f"Invalid {box_type!r} box size")
+
+            body = meta_data[position + header_size:position + size]
+            if box_type == b'iinf':
+                exif_item_ids = self._parse_iinf(body)
+            elif box_type == b'iloc':
+                locations = self._parse_iloc(body)
+            elif box_type == b'idat':
+                idat_offset = meta_start + position + header_size
+            position += size
+
+        for item_id in exif_item_ids:
+            if item_id not in locations:
+                continue
+            construction_method, extents = locations[item_id]
+            if construction_method == 1:
+                if idat_offset is None:
+                    continue
+                base = idat_offset
+            elif construction_method == 0:
+                base = 0
+            else:
+                continue
+
+            data = b''
+            for offset, length in extents:
+                if len(data) + length > self.read_limit:
+                    raise ExifFormatError("Exif item exceeds read limit")
+                f.seek(base + offset)
+                data += f.read(length)
+
+            # Exif item payload starts with the offset to the TIFF header
+            (tiff_offset,) = struct.unpack_from('>I', data, 0)
+            return data[4 + tiff_offset:]
+
+        return None
+
+    def _parse_iinf(self, body: bytes) -> set:
+        """Return the ids of items whose type is 'Exif'."""
+        version = body[0]
+        if version == 0:
+            (count,) = struct.unpack_from('>H', body, 4)
+            position = 6
+        else:
+            (count,) = struct.unpack_from('>I', body, 4)
+            position = 8
+
+        exif_ids = set()
+        for _ in range(count):
+            size, box_type = struct.unpack_from('>I4s', body, position)
+            if size < 8:
+                raise ExifFormatError("Invalid infe box size")
+            if box_type == b'infe':
+                infe_version = body[position + 8]
+                cursor = position + 12
+                if infe_version >= 2:
+                    if infe_version == 2:
+                        (item_id,) = struct.unpack_from('>H', body, cursor)
+                        cursor += 2
+                    else:
+                        (item_id,) = struct.unpack_from('>I', body, cursor)
+                        cursor += 4
+                    cursor += 2  # item_protection_index
+                    if body[cursor:cursor + 4] == b'Exif':
+                        exif_ids.add(item_id)
+            position += size
+        return exif_ids
+
+    def _parse_iloc(self, body: bytes) -> dict:
+        """Return item_id -> (construction_method, [(offset, length), ...])."""
+        version = body[0]
+        offset_size = body[4] >> 4
+        length_size = body[4] & 0x0F
+        base_offset_size = body[5] >> 4
+        index_size = body[5] & 0x0F if version in (1, 2) else 0
+        position = 6
+
+        def read_uint(size):
+            nonlocal position
+            if size == 0:
+                return 0
+            code = {4: '>I', 8: '>Q'}.get(size)
+            if code is None:
+                raise ExifFormatError(f"Unsupported iloc field size {size}")
+            (value,) = struct.unpack_from(code, body, position)
+            position += size
+            return value
+
+        if version < 2:
+            (item_count,) = struct.unpack_from('>H', body, position)
+            position += 2
+        else:
+            item_count = read_uint(4)
+
+        locations = {}
+        for _ in range(item_count):
+            if version < 2:
+                (item_id,) = struct.unpack_from('>H', body, position)
+                position += 2
+            else:
+                item_id = read_uint(4)
+
+            construction_method = 0
+            if version in (1, 2):
+                (method,) = struct.unpack_from('>H', body, position)
+                construction_method = method & 0x0F
+                position += 2
+
+            position += 2  # data_reference_index
+            base_offset = read_uint(base_offset_size)
+            (extent_count,) = struct.unpack_from('>H', body, position)
+            position += 2
+
+            extents = []
+            for _ in range(extent_count):
+                if index_size:
+                    read_uint(index_size)
+                extent_offset = read_uint(offset_size)
+                extent_length = read_uint(length_size)
+                extents.append((base_offset + extent_offset, extent_length))
+            locations[item_id] = (construction_method, extents)
+
+        return locations
+
+    def _parse_tiff(self, tiff: bytes) -> dict:
+        """Decode the handful of tags we use from a TIFF-structured EXIF block."""
+        byte_order = tiff[:2]
+        if byte_order == b'II':
+            endian = '<'
+        elif byte_order == b'MM':
+            endian = '>'
+        else:
+            raise ExifFormatError("Invalid TIFF byte order")
+
+        (ifd0_offset,) = struct.unpack_from(endian + 'I', tiff, 4)
+        ifd0 = self._read_ifd(tiff, ifd0_offset, endian)
+
+        metadata = {}
+        for tag, name in IFD0_TAGS.items():
+            if tag in ifd0:
+                metadata[name] = ifd0[tag]
+
+        if EXIF_IFD_POINTER in ifd0:
+            exif_ifd = self._read_ifd(tiff, ifd0[EXIF_IFD_POINTER], endian)
+            for tag, name in EXIF_IFD_TAGS.items():
+                if tag in exif_ifd:
+                    metadata[name] = exif_ifd[tag]
+
+        if GPS_IFD_POINTER in ifd0:
+            gps_ifd = self._read_ifd(tiff, ifd0[GPS_IFD_POINTER], endian)
+            gps_info = {
+                name: gps_ifd[tag]
+                for tag, name in GPS_IFD_TAGS.items()
+                if tag in gps_ifd
+            }
+            if gps_info:
+                metadata['GPSInfo'] = gps_info
+
+        return metadata
+
+    def _read_ifd(self, tiff: bytes, offset: int, endian: str) -> dict:
+        """Read one IFD into {tag: value}, skipping types we don't decode."""
+        (count,) = struct.unpack_from(endian + 'H', tiff, offset)
+        values = {}
+        for index in range(count):
+            entry = offset + 2 + index * 12
+            tag, field_type, value_count = struct.unpack_from(endian + 'HHI', tiff, entry)
+            if field_type not in TIFF_TYPES:
+                continue
+
+            code, unit_size = TIFF_TYPES[field_type]
+            total_size = unit_size * value_count
+            if total_size <= 4:
+                data_offset = entry + 8
+            else:
+                (data_offset,) = struct.unpack_from(endian + 'I', tiff, entry + 8)
+            if data_offset + total_size > len(tiff):
+                continue
+
+            raw = tiff[data_offset:data_offset + total_size]
+            if field_type == 2:
+                value = raw.split(b'\x00', 1)[0].decode('ascii', errors='replace').strip()
+            elif field_type in (5, 10):
+                pairs = struct.unpack(endian + code * value_count, raw)
+                value = tuple(
+                    pairs[i] / pairs[i + 1] if pairs[i + 1] else 0.0
+                    for i in range(0, len(pairs), 2)
+                )
+            else:
+                value = struct.unpack(endian + code * value_count, raw)
+                if field_type == 7:
+                    value = bytes(value)
+            if isinstance(value, tuple) and len(value) == 1:
+                value = value[0]
+            values[tag] = value
+        return values
+
+
+# Singleton instance
+exif_reader = ExifReader(read_limit=EXIF_READ_LIMIT)
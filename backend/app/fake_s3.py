@@ -0,0 +1,224 @@
+"""In-process S3-compatible server for developing against S3Storage without a bucket."""
+import hashlib
+import hmac
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
+from app.storage import sign_v4, UNSIGNED_PAYLOAD
+
+AUTHORIZATION_RE = re.compile(
+    r'AWS4-HMAC-SHA256 Credential=([^/]+)/[^,]+, SignedHeaders=([^,]+), Signature=([0-9a-f]+)'
+)
+
+
+class FakeS3Server:
+    """
+    Serve the subset of the S3 API that S3Storage uses from a local directory.
+
+    Objects live at {root}/{bucket}/{key}. Header signatures and presigned
+    URLs are verified like S3 does, so signing bugs show up in development.
+    """
+
+    def __init__(self, root: str, access_key: str, secret_key: str, region: str = 'us-east-1', port: int = 0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.port = port
+        self._server = None
+
+    def start(self) -> str:
+        """Start serving in a daemon thread and return the endpoint URL."""
+        handler = type('FakeS3Handler', (FakeS3Handler,), {'fake': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name='fake-s3', daemon=True)
+        thread.start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def object_path(self, path: str):
+        """Map /bucket/key to a file under root, rejecting anything that escapes it."""
+        parts = path.lstrip('/').split('/')
+        if len(parts) < 2 or any(part in ('', '.', '..') for part in parts):
+            return None
+        return self.root.joinpath(*parts)
+
+    def multipart_dir(self, upload_id: str):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+            return None
+        return self.root / '.multipart' / upload_id
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    fake: FakeS3Server = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        self.object_key = unquote(url.path)
+        self.query = dict(parse_qsl(url.query, keep_blank_values=True))
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+    def _send(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status: int, code: str, message: str):
+        body = f"<Error><Code>{code}</Code><Message>{message}</Message></Error>".encode('utf-8')
+        self._send(status, body, {'Content-Type': 'application/xml'})
+
+    def _authorized(self) -> bool:
+        """Check the SigV4 header signature or presigned query string."""
+        fake = self.fake
+        query = dict(self.query)
+
+        if 'X-Amz-Signature' in query:
+            signature = query.pop('X-Amz-Signature')
+            access_key = query.get('X-Amz-Credential', '').split('/')[0]
+            signed_names = query.get('X-Amz-SignedHeaders', '').split(';')
+            amz_date = query.get('X-Amz-Date', '')
+            payload_hash = UNSIGNED_PAYLOAD
+            try:
+                issued = datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+                expires = int(query.get('X-Amz-Expires', '0'))
+            except ValueError:
+                return False
+            if (datetime.now(timezone.utc) - issued).total_seconds() > expires:
+                return False
+        else:
+            match = AUTHORIZATION_RE.match(self.headers.get('Authorization', ''))
+            if not match:
+                return False
+            access_key, signed_names, signature = match.group(1), match.group(2).split(';'), match.group(3)
+            amz_date = self.headers.get('x-amz-date', '')
+            payload_hash = self.headers.get('x-amz-content-sha256', '')
+            if payload_hash != UNSIGNED_PAYLOAD and payload_hash != hashlib.sha256(self.body).hexdigest():
+                return False
+
+        if access_key != fake.access_key:
+            return False
+        headers = {name: self.headers.get(name, '') for name in signed_names}
+        expected = sign_v4(
+            fake.secret_key, fake.region, self.command, self.object_key,
+            query, headers, payload_hash, amz_date
+        )
+        return hmac.compare_digest(expected, signature)
+
+    def _handle(self):
+        self._parse()
+        if not self._authorized():
+            return self._error(403, 'SignatureDoesNotMatch', 'Signature or credentials are invalid')
+
+        path = self.fake.object_path(self.object_key)
+        if path is None:
+            return self._error(400, 'InvalidURI', 'Bucket and key required')
+
+        if 'uploadId' in self.query:
+            return self._multipart(path, self.query['uploadId'])
+        if self.command == 'POST' and 'uploads' in self.query:
+            upload_id = uuid.uuid4().hex
+            self.fake.multipart_dir(upload_id).mkdir(parents=True)
+            body = (
+                "<InitiateMultipartUploadResult>"
+                f"<Key>{self.object_key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            ).encode('utf-8')
+            return self._send(200, body, {'Content-Type': 'application/xml'})
+
+        if self.command == 'PUT':
+            etag = self._write(path, [self.body])
+            return self._send(200, headers={'ETag': etag})
+
+        if self.command in ('GET', 'HEAD'):
+            if not path.is_file():
+                return self._error(404, 'NoSuchKey', 'The specified key does not exist')
+            data = path.read_bytes()
+            content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+            return self._send(200, data, {
+                'Content-Type': content_type,
+                'ETag': f'"{hashlib.md5(data).hexdigest()}"',
+            })
+
+        if self.command == 'DELETE':
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return self._send(204)
+
+        return self._error(405, 'MethodNotAllowed', 'Unsupported request')
+
+    def _write(self, path: Path, chunks) -> str:
+        """Write an object atomically and return its ETag."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        digest = hashlib.md5()
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(temp_path, path)
+        return f'"{digest.hexdigest()}"'
+
+    def _multipart(self, path: Path, upload_id: str):
+        """UploadPart, CompleteMultipartUpload and AbortMultipartUpload."""
+        parts_dir = self.fake.multipart_dir(upload_id)
+        if parts_dir is None or not parts_dir.is_dir():
+            return self._error(404, 'NoSuchUpload', 'The specified upload does not exist')
+
+        if self.command == 'PUT':
+            try:
+                part_number = int(self.query.get('partNumber', ''))
+            except ValueError:
+                return self._error(400, 'InvalidArgument', 'partNumber must be an integer')
+            etag = self._write(parts_dir / str(part_number), [self.body])
+            return self._send(200, headers={'ETag': etag})
+
+        if self.command == 'DELETE':
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            return self._send(204)
+
+        if self.command == 'POST':
+            parts = []
+            for part in ET.fromstring(self.body).iter('Part'):
+                number = part.findtext('PartNumber')
+                part_path = parts_dir / str(number)
+                if not part_path.is_file() or f'"{hashlib.md5(part_path.read_bytes()).hexdigest()}"' != part.findtext('ETag'):
+                    return self._error(400, 'InvalidPart', f"Part {number} is missing or its ETag doesn't match")
+                parts.append(part_path)
+            self._write(path, (part_path.read_bytes() for part_path in parts))
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            body = (
+                "<CompleteMultipartUploadResult>"
+                f"<Key>{self.object_key}</Key>"
+                "</CompleteMultipartUploadResult>"
+            ).encode('utf-8')
+            return self._send(200, body, {'Content-Type': 'application/xml'})
+
+        return self._error(405, 'MethodNotAllowed', 'Unsupported request')
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _handle
@@ -0,0 +1,271 @@
+"""Offline reverse geocoding against a GeoNames places dump, via a KD-tree."""
+import math
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from app.config import (
+    GAZETTEER_PLACES_FILE,
+    GAZETTEER_ADMIN1_FILE,
+    GAZETTEER_COUNTRY_FILE,
+    GAZETTEER_MAX_DISTANCE_KM,
+)
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def unit_vector(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    """
+    A point on the unit sphere.
+
+    Straight-line distance between these vectors orders points the same way
+    as great-circle distance, without special cases at the poles or the
+    antimeridian.
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(squared_chord: float) -> float:
+    """Great-circle distance for a squared straight-line distance between unit vectors."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+class Gazetteer:
+    """
+    Nearest populated place for a coordinate, answered from memory.
+
+    Places are read from a GeoNames dump (cities15000.txt or any file in
+    the same tab-separated layout) into a KD-tree stored implicitly in flat
+    arrays: the median of each range is that subtree's root, so there are
+    no node objects and a lookup is a few dozen float comparisons.
+    Admin1 and country names come from admin1CodesASCII.txt and
+    countryInfo.txt when present.
+    """
+
+    def __init__(
+        self,
+        places_file: str,
+        admin1_file: Optional[str] = None,
+        country_file: Optional[str] = None,
+        max_distance_km: float = 50
+    ):
+        self.places_file = Path(places_file)
+        self.admin1_file = Path(admin1_file) if admin1_file else None
+        self.country_file = Path(country_file) if country_file else None
+        self.max_distance_km = max_distance_km
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.load_seconds = None
+        # Unit vectors (x, y, z per place) in tree order
+        self._points = array('d')
+        # Per place, in tree order
+        self._names: List[str] = []
+        self._states: List[str] = []
+        self._countries: List[str] = []
+        self.country_names: Dict[str, str] = {}
+
+    @property
+    def available(self) -> bool:
+        """Whether a places file is installed."""
+        return self.places_file.is_file()
+
+    @property
+    def ready(self) -> bool:
+        """Whether lookups can run without waiting on load()."""
+        # load() sets _loaded first and holds the lock until it is done
+        return not self.available or (self._loaded and not self._lock.locked())
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def preload(self):
+        """Build the index on a background thread so the first lookup doesn't wait."""
+        if self.available:
+            threading.Thread(target=self.load, name='gazetteer-load', daemon=True).start()
+
+    def load(self) -> bool:
+        """Read the dumps and build the tree once. Returns whether any places are loaded."""
+        with self._lock:
+            if self._loaded:
+                return len(self) > 0
+            self._loaded = True
+            if not self.available:
+                print(f"⚠️  No gazetteer at {self.places_file}; offline geocoding disabled")
+                return False
+
+            started = time.time()
+            self.country_names = self._read_countries()
+            admin1_names = self._read_admin1()
+
+            coords = array('d')
+            names, states, countries = [], [], []
+            with open(self.places_file, encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) < 11:
+                        continue
+                    try:
+                        latitude, longitude = float(fields[4]), float(fields[5])
+                    except ValueError:
+                        continue
+                    coords.extend(unit_vector(latitude, longitude))
+                    names.append(fields[1])
+                    states.append(admin1_names.get(f"{fields[8]}.{fields[10]}", ''))
+                    countries.append(fields[8])
+
+            order = self._build(coords, len(names))
+            for i in order:
+                self._points.extend(coords[3 * i:3 * i + 3])
+                self._names.append(names[i])
+                self._states.append(states[i])
+                self._countries.append(countries[i])
+
+            self.load_seconds = round(time.time() - started, 2)
+            print(f"🗺️  Loaded {len(self)} gazetteer places in {self.load_seconds}s")
+            return len(self) > 0
+
+    def _read_countries(self) -> Dict[str, str]:
+        """ISO code -> country name from countryInfo.txt."""
+        names = {}
+        if self.country_file and self.country_file.is_file():
+            with open(self.country_file, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('#'):
+                        continue
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) > 4:
+                        names[fields[0]] = fields[4]
+        return names
+
+    def _read_admin1(self) -> Dict[str, str]:
+        """'US.CA'-style code -> state or province name from admin1CodesASCII.txt."""
+        names = {}
+        if self.admin1_file and self.admin1_file.is_file():
+            with open(self.admin1_file, encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) > 1:
+                        names[fields[0]] = fields[1]
+        return names
+
+    @staticmethod
+    def _build(coords: array, count: int) -> array:
+        """
+        Order place indexes into an implicit KD-tree.
+
+        Each range is sorted on its axis (x, y, z in turn) so its median
+        splits it, then both halves are ordered the same way.
+        """
+        order = array('i', range(count))
+        stack = [(0, count, 0)]
+        while stack:
+            lo, hi, axis = stack.pop()
+            if hi - lo < 2:
+                continue
+            order[lo:hi] = array('i', sorted(order[lo:hi], key=lambda i: coords[3 * i + axis]))
+            mid = (lo + hi) // 2
+            next_axis = (axis + 1) % 3
+            stack.append((lo, mid, next_axis))
+            stack.append((mid + 1, hi, next_axis))
+        return order
+
+    def _nearest(self, target: Tuple[float, float, float]) -> Tuple[int, float]:
+        """Tree position and squared chord distance of the place closest to a unit vector."""
+        points = self._points
+        best, best_distance = -1, math.inf
+        # (lo, hi, axis, squared distance from target to this range's half-space)
+        stack = [(0, len(self._names), 0, 0.0)]
+        while stack:
+            lo, hi, axis, bound = stack.pop()
+            if lo >= hi or bound >= best_distance:
+                continue
+            mid = (lo + hi) // 2
+            base = 3 * mid
+            dx = points[base] - target[0]
+            dy = points[base + 1] - target[1]
+            dz = points[base + 2] - target[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best_distance:
+                best, best_distance = mid, distance
+
+            split = target[axis] - points[base + axis]
+            next_axis = (axis + 1) % 3
+            below, above = (lo, mid, next_axis), (mid + 1, hi, next_axis)
+            near, far = (below, above) if split < 0 else (above, below)
+            # Far side first, so the near side is searched (and tightens best) first
+            stack.append((*far, split * split))
+            stack.append((*near, 0.0))
+        return best, best_distance
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[dict]:
+        """
+        The populated place closest to a coordinate, however far away.
+
+        Returns:
+            Dictionary with name, state, country, country_code and
+            distance_km, or None if no gazetteer is loaded
+        """
+        if not self.load():
+            return None
+        position, distance = self._nearest(unit_vector(latitude, longitude))
+        code = self._countries[position]
+        return {
+            'name': self._names[position],
+            'state': self._states[position],
+            'country': self.country_names.get(code, code),
+            'country_code': code.lower(),
+            'distance_km': round(chord_to_km(distance), 2),
+        }
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> Optional[Dict]:
+        """
+        City-level location info for a coordinate, shaped like GeocodingService results.
+
+        Returns:
+            Dictionary with name, address, city, state, country and the rest
+            of the Nominatim fields, plus distance_km and source; None if no
+            place is within max_distance_km
+        """
+        place = self.nearest(latitude, longitude)
+        if place is None or place['distance_km'] > self.max_distance_km:
+            return None
+
+        address = ', '.join(part for part in (place['name'], place['state'], place['country']) if part)
+        return {
+            'name': place['name'],
+            'address': address,
+            'city': place['name'],
+            'state': place['state'],
+            'country': place['country'],
+            'country_code': place['country_code'],
+            'postcode': '',
+            'full_address': {
+                'city': place['name'],
+                'state': place['state'],
+                'country': place['country'],
+                'country_code': place['country_code'],
+            },
+            'display_name': address,
+            'distance_km': place['distance_km'],
+            'source': 'gazetteer',
+        }
+
+    def stats(self) -> dict:
+        return {
+            'available': self.available,
+            'places': len(self),
+            'load_seconds': self.load_seconds,
+        }
+
+
+# Singleton instance
+gazetteer = Gazetteer(
+    GAZETTEER_PLACES_FILE,
+    admin1_file=GAZETTEER_ADMIN1_FILE,
+    country_file=GAZETTEER_COUNTRY_FILE,
+    max_distance_km=GAZETTEER_MAX_DISTANCE_KM,
+)
@@ -1,13 +1,43 @@
 """Geocoding service using Nominatim (OpenStreetMap) API."""
+import json
+import sqlite3
 import requests
+import threading
 import time
-from typing import Optional, Dict
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+from app.gazetteer import gazetteer
+from app.config import (
+    GEOCODE_CACHE_FILENAME,
+    GEOCODE_CACHE_PRECISION,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_NOT_FOUND_TTL,
+    GEOCODE_ERROR_TTL,
+    GEOCODE_MEMORY_CACHE_SIZE,
+)
 
 
 class GeocodingService:
-    """Service for reverse geocoding using Nominatim API."""
+    """
+    Service for reverse geocoding using Nominatim API.
     
-    def __init__(self):
+    Answers are cached by coordinates rounded to `precision` decimal
+    places: in an LRU in memory, backed by a SQLite file shared by every
+    server process. Misses and failures are cached too, with shorter
+    lifetimes, so Nominatim's 1 request/second budget goes to new places.
+    When Nominatim has no answer, the offline gazetteer supplies the
+    nearest city instead.
+    """
+    
+    def __init__(
+        self,
+        cache_path: str = str(GEOCODE_CACHE_FILENAME),
+        precision: int = 4,
+        ttl: int = 90 * 24 * 60 * 60,
+        not_found_ttl: int = 7 * 24 * 60 * 60,
+        error_ttl: int = 5 * 60,
+        memory_size: int = 10_000
+    ):
         self.base_url = "https://nominatim.openstreetmap.org/reverse"
         # Nominatim requires a User-Agent header
         self.headers = {
@@ -16,20 +46,215 @@ class GeocodingService:
         # Rate limiting: Nominatim allows max 1 request per second
         self.last_request_time = 0
         self.min_request_interval = 1.0  # seconds
+        self._rate_lock = threading.Lock()
+        
+        self.cache_path = cache_path
+        self.precision = precision
+        # Seconds each kind of answer stays cached
+        self.ttls = {'found': ttl, 'not_found': not_found_ttl, 'error': error_ttl}
+        self.memory_size = memory_size
+        
+        # Guards the LRU, the in-flight map and the counters
+        self._lock = threading.Lock()
+        # Cache key -> (expires_at, result or None), least recently used first
+        self._memory = OrderedDict()
+        # Cache key -> Event set once the lookup finishes
+        self._inflight = {}
+        self._local = threading.local()
+        self.counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'api_errors': 0, 'offline_answers': 0}
     
     def _rate_limit(self):
         """Ensure we don't exceed Nominatim's rate limit (1 req/sec)."""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
+        with self._rate_lock:
+            current_time = time.time()
+            time_since_last = current_time - self.last_request_time
+            
+            if time_since_last < self.min_request_interval:
+                sleep_time = self.min_request_interval - time_since_last
+                print(f"Rate limiting: sleeping for {sleep_time:.2f}s")
+                time.sleep(sleep_time)
+            
+            self.last_request_time = time.time()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection to the cache database, created on first use."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.cache_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS GeocodeCache (
+                    lat_key INTEGER NOT NULL,
+                    lon_key INTEGER NOT NULL,
+                    precision INTEGER NOT NULL,
+                    status VARCHAR(10) NOT NULL,
+                    result TEXT,
+                    created_at INTEGER NOT NULL,
+                    expires_at INTEGER NOT NULL,
+                    PRIMARY KEY (precision, lat_key, lon_key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_geocode_cache_expires ON GeocodeCache(expires_at);
+            """)
+            connection.execute("DELETE FROM GeocodeCache WHERE expires_at < ?", (int(time.time()),))
+            connection.commit()
+            self._local.connection = connection
+        return connection
+    
+    def cache_key(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        """Coordinates rounded to the cache precision, as integers."""
+        scale = 10 ** self.precision
+        return round(latitude * scale), round(longitude * scale)
+    
+    def _remember(self, key: Tuple[int, int], expires_at: int, result: Optional[Dict]):
+        """Put an answer in the in-process LRU (caller holds self._lock)."""
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+    
+    def _cached(self, key: Tuple[int, int]) -> Tuple[bool, Optional[Dict]]:
+        """
+        Look a key up in memory, then in the cache database.
         
-        if time_since_last < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last
-            print(f"Rate limiting: sleeping for {sleep_time:.2f}s")
-            time.sleep(sleep_time)
+        Returns:
+            Tuple of (hit, result); a hit may carry None for a cached miss
+        """
+        now = int(time.time())
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return True, entry[1]
+        
+        try:
+            cursor = self._connect().execute(
+                """
+                SELECT result, expires_at FROM GeocodeCache
+                WHERE precision = ? AND lat_key = ? AND lon_key = ? AND expires_at > ?
+                """,
+                (self.precision, key[0], key[1], now)
+            )
+            row = cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"Geocode cache read failed: {e}")
+            row = None
+        
+        if row is None:
+            return False, None
         
-        self.last_request_time = time.time()
+        result = json.loads(row[0]) if row[0] else None
+        with self._lock:
+            self._remember(key, row[1], result)
+            self.counters['db_hits'] += 1
+        return True, result
+    
+    def _store(self, key: Tuple[int, int], status: str, result: Optional[Dict]):
+        """Cache an answer in memory and in the cache database."""
+        now = int(time.time())
+        expires_at = now + self.ttls[status]
+        with self._lock:
+            self._remember(key, expires_at, result)
+        
+        try:
+            connection = self._connect()
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO GeocodeCache
+                (lat_key, lon_key, precision, status, result, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key[0], key[1], self.precision, status,
+                 json.dumps(result) if result else None, now, expires_at)
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"Geocode cache write failed: {e}")
+    
+    def reverse_geocode(self, latitude: float, longitude: float, offline: bool = False) -> Optional[Dict]:
+        """
+        Get location information for coordinates, from the cache or Nominatim.
+        
+        Concurrent lookups of the same cache key share one API request.
+        When Nominatim finds nothing or fails, the nearest gazetteer city
+        is returned instead (with 'source': 'gazetteer').
+        
+        Args:
+            latitude: Latitude coordinate
+            longitude: Longitude coordinate
+            offline: Answer from the cache or the gazetteer only, never
+                waiting on Nominatim
+            
+        Returns:
+            Dictionary with location info (see _fetch) or None if nothing
+            was found
+        """
+        key = self.cache_key(latitude, longitude)
+        
+        while True:
+            hit, result = self._cached(key)
+            if hit:
+                return result or self._offline(latitude, longitude)
+            if offline:
+                return self._offline(latitude, longitude)
+            
+            with self._lock:
+                pending = self._inflight.get(key)
+                if pending is None:
+                    # We own the lookup; others will wait on this event
+                    pending = threading.Event()
+                    self._inflight[key] = pending
+                    self.counters['misses'] += 1
+                    break
+            
+            # Another thread is asking Nominatim about this spot; wait and re-check
+            pending.wait()
+        
+        try:
+            status, result = self._fetch(latitude, longitude)
+            if status == 'error':
+                with self._lock:
+                    self.counters['api_errors'] += 1
+            self._store(key, status, result)
+            return result or self._offline(latitude, longitude)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+    
+    def _offline(self, latitude: float, longitude: float) -> Optional[Dict]:
+        """City-level answer from the gazetteer, or None if it has no place nearby."""
+        result = gazetteer.reverse_geocode(latitude, longitude)
+        if result:
+            with self._lock:
+                self.counters['offline_answers'] += 1
+        return result
+    
+    def stats(self) -> dict:
+        """Hit and miss counters for this process, plus cache sizes."""
+        try:
+            cursor = self._connect().execute(
+                "SELECT status, COUNT(*) FROM GeocodeCache WHERE expires_at > ? GROUP BY status",
+                (int(time.time()),)
+            )
+            stored = dict(cursor.fetchall())
+        except sqlite3.Error:
+            stored = {}
+        
+        with self._lock:
+            counters = dict(self.counters)
+            memory_entries = len(self._memory)
+        lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+        return {
+            **counters,
+            'hit_rate': round((lookups - counters['misses']) / lookups, 3) if lookups else None,
+            'memory_entries': memory_entries,
+            'stored_entries': stored,
+            'precision': self.precision,
+            'gazetteer': gazetteer.stats(),
+        }
     
-    def reverse_geocode(self, latitude: float, longitude: float) -> Optional[Dict]:
+    def _fetch(self, latitude: float, longitude: float) -> Tuple[str, Optional[Dict]]:
         """
         Get location information from coordinates using Nominatim.
         
@@ -38,9 +263,10 @@ class GeocodingService:
             longitude: Longitude coordinate
             
         Returns:
-            Dictionary with location info or None if request fails
+            Tuple of ('found', location info), ('not_found', None) or
+            ('error', None) if the request failed
             
-        Example return:
+        Example location info:
         {
             'name': 'Lummus Park',
             'address': '1130 Ocean Drive, Miami Beach, FL 33139',
@@ -83,13 +309,13 @@ class GeocodingService:
             
             if response.status_code != 200:
                 print(f"Nominatim API error: {response.status_code}")
-                return None
+                return 'error', None
             
             data = response.json()
             
             if not data or 'error' in data:
                 print(f"No location found for coordinates: ({latitude}, {longitude})")
-                return None
+                return 'not_found', None
             
             # Extract useful information
             address = data.get('address', {})
@@ -146,18 +372,25 @@ class GeocodingService:
                 'postcode': postcode,
                 'full_address': address,
                 'display_name': data.get('display_name'),
+                'source': 'nominatim',
             }
             
             print(f"📍 Found: {name} at {formatted_address}")
-            return result
+            return 'found', result
             
         except requests.exceptions.Timeout:
             print("Nominatim API timeout")
-            return None
+            return 'error', None
         except Exception as e:
             print(f"Error in reverse geocoding: {e}")
-            return None
+            return 'error', None
 
 
 # Singleton instance
-geocoding_service = GeocodingService()
\ No newline at end of file
+geocoding_service = GeocodingService(
+    precision=GEOCODE_CACHE_PRECISION,
+    ttl=GEOCODE_CACHE_TTL,
+    not_found_ttl=GEOCODE_NOT_FOUND_TTL,
+    error_ttl=GEOCODE_ERROR_TTL,
+    memory_size=GEOCODE_MEMORY_CACHE_SIZE,
+)
\ No newline at end of file
@@ -0,0 +1,430 @@
+"""On-demand image variants with a size-capped LRU disk cache."""
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+from PIL import Image, ImageOps
+from app.decode_budget import decode_budget
+from app.config import (
+    IMAGE_CACHE_FOLDER,
+    IMAGE_CACHE_MAX_BYTES,
+    IMAGE_CACHE_RESCAN_INTERVAL,
+    IMAGE_VARIANT_MAX_DIMENSION,
+    IMAGE_VARIANT_QUALITY,
+    IMAGE_WEBP_QUALITY,
+    IMAGE_AVIF_QUALITY,
+)
+
+try:
+    # Older Pillow releases only encode AVIF through this plugin
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+
+def _encoder_available(pil_format: str) -> bool:
+    """Check whether this Pillow build can write the given format."""
+    Image.init()
+    return pil_format in Image.SAVE
+
+
+def _supported_formats() -> dict:
+    """Map fmt query values to (Pillow format, mimetype, file extension)."""
+    formats = {
+        'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+        'png': ('PNG', 'image/png', '.png'),
+    }
+    if _encoder_available('WEBP'):
+        formats['webp'] = ('WEBP', 'image/webp', '.webp')
+    if _encoder_available('AVIF'):
+        formats['avif'] = ('AVIF', 'image/avif', '.avif')
+    return formats
+
+
+class ImageCache:
+    """Render resized photo variants lazily and keep them on disk with LRU eviction."""
+
+    FITS = ('contain', 'cover', 'fill')
+
+    FORMATS = _supported_formats()
+
+    # Modern formats in order of preference when the client accepts several
+    NEGOTIATED_FORMATS = ('avif', 'webp')
+
+    # Originals browsers can't display; they are always served transcoded
+    TRANSCODED_SUFFIXES = ('.heic', '.heif')
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int,
+        max_dimension: int = 4096,
+        quality: int = 82,
+        webp_quality: int = 80,
+        avif_quality: int = 60,
+        rescan_interval: float = 60
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.webp_quality = webp_quality
+        self.avif_quality = avif_quality
+        self.rescan_interval = rescan_interval
+
+        # Guards the index, byte total and in-flight map below
+        self._lock = threading.Lock()
+        # Variant filename -> access stats, least recently used first
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        # Variant filename -> Event set once the render finishes
+        self._inflight = {}
+        # When _load_index() last read the directory
+        self._scanned_at = 0.0
+
+        if self._load_index():
+            print(f"🗂️  Image cache loaded {len(self._entries)} variants ({self._total_bytes} bytes)")
+
+    def _load_index(self) -> int:
+        """
+        Rebuild the LRU index and byte total from the files in the cache directory.
+
+        Every server process renders into the same directory, so only the
+        directory itself counts all of their variants; stats this process
+        collected are kept for files that are still there.
+
+        Returns:
+            Number of variants found
+        """
+        files = []
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith('.'):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Evicted by another process mid-scan
+                continue
+            if path.is_file():
+                files.append((stat.st_mtime, path.name, stat.st_size))
+
+        # mtime is bumped on every hit, so it doubles as the last access time
+        entries = OrderedDict()
+        total_bytes = 0
+        for mtime, name, size in sorted(files):
+            entry = self._entries.get(name)
+            if entry is None or entry['size'] != size:
+                entry = {
+                    'size': size,
+                    'hits': 0,
+                    'created_at': int(mtime),
+                    'last_access': int(mtime),
+                    'render_ms': None,
+                }
+            entries[name] = entry
+            total_bytes += size
+
+        self._entries = entries
+        self._total_bytes = total_bytes
+        self._scanned_at = time.time()
+        return len(files)
+
+    def parse_variant_args(self, args) -> Tuple[Optional[int], Optional[int], str, Optional[str]]:
+        """
+        Validate the w/h/fit/fmt query parameters of an image request.
+
+        Raises:
+            ValueError: if any parameter is out of range or unknown
+        """
+        dimensions = []
+        for name in ('w', 'h'):
+            raw = args.get(name)
+            if raw in (None, ''):
+                dimensions.append(None)
+                continue
+            try:
+                value = int(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be an integer")
+            if value < 1 or value > self.max_dimension:
+                raise ValueError(f"{name} must be between 1 and {self.max_dimension}")
+            dimensions.append(value)
+
+        fit = args.get('fit') or 'contain'
+        if fit not in self.FITS:
+            raise ValueError(f"fit must be one of: {', '.join(self.FITS)}")
+
+        fmt = args.get('fmt') or None
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt is not None and fmt not in self.FORMATS:
+            raise ValueError(f"fmt must be one of: {', '.join(self.FORMATS)}")
+
+        return dimensions[0], dimensions[1], fit, fmt
+
+    def variant_name(
+        self,
+        source_path: Path,
+        width: Optional[int],
+        height: Optional[int],
+        fit: str,
+        fmt: str
+    ) -> str:
+        """Build the cache filename for a variant of a source file."""
+        extension = self.FORMATS[fmt][2]
+        return f"{source_path.stem}_{width or 0}x{height or 0}_{fit}{extension}"
+
+    def default_format(self, source_path: Path) -> str:
+        """Keep PNGs lossless, serve everything else as JPEG."""
+        return 'png' if source_path.suffix.lower() == '.png' else 'jpeg'
+
+    def needs_transcode(self, filename) -> bool:
+        """Whether the original has to be transcoded before a browser can show it."""
+        return Path(filename).suffix.lower() in self.TRANSCODED_SUFFIXES
+
+    def negotiate_format(self, accept_mimetypes, source_path: Path) -> Optional[str]:
+        """
+        Pick the best modern format the client explicitly accepts.
+
+        Wildcards like */* are ignored so old browsers keep getting the
+        original format. GIFs are never transcoded to keep animation.
+
+        Returns:
+            'avif', 'webp' or None if the source format should be kept
+        """
+        if source_path.suffix.lower() == '.gif':
+            return None
+
+        accepted = {mimetype for mimetype, quality in accept_mimetypes if quality > 0}
+        for fmt in self.NEGOTIATED_FORMATS:
+            if fmt in self.FORMATS and self.FORMATS[fmt][1] in accepted:
+                return fmt
+        return None
+
+    def get_variant(
+        self,
+        source_path: Path,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        fit: str = 'contain',
+        fmt: Optional[str] = None
+    ) -> Tuple[Path, str]:
+        """
+        Return the cached variant for a source image, rendering it if needed.
+
+        Concurrent requests for the same variant wait for a single render.
+
+        Returns:
+            Tuple of (variant_path, mimetype)
+        """
+        fmt = fmt or self.default_format(source_path)
+        name = self.variant_name(source_path, width, height, fit, fmt)
+        variant_path = self.cache_dir / name
+        mimetype = self.FORMATS[fmt][1]
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and variant_path.exists():
+                    self._record_hit(name, entry, variant_path)
+                    return variant_path, mimetype
+
+                pending = self._inflight.get(name)
+                if pending is None:
+                    # We own the render; others will wait on this event
+                    pending = threading.Event()
+                    self._inflight[name] = pending
+                    break
+
+            # Another request is rendering this variant; wait and re-check
+            pending.wait()
+
+        try:
+            started = time.time()
+            size = self._render(source_path, variant_path, width, height, fit, fmt)
+            render_ms = int((time.time() - started) * 1000)
+
+            with self._lock:
+                previous = self._entries.pop(name, None)
+                if previous is not None:
+                    self._total_bytes -= previous['size']
+                now = int(time.time())
+                self._entries[name] = {
+                    'size': size,
+                    'hits': 0,
+                    'created_at': now,
+                    'last_access': now,
+                    'render_ms': render_ms,
+                }
+                self._total_bytes += size
+                self._evict()
+
+            print(f"🖼️  Rendered {name} ({size} bytes) in {render_ms}ms")
+            return variant_path, mimetype
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+            pending.set()
+
+    def _record_hit(self, name: str, entry: dict, variant_path: Path):
+        """Move a variant to the most-recently-used end and update its stats."""
+        entry['hits'] += 1
+        entry['last_access'] = int(time.time())
+        self._entries.move_to_end(name)
+        try:
+            # Persist recency so eviction order survives restarts
+            os.utime(variant_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drop least recently used variants until the cache fits its budget."""
+        # Pick up variants other server processes rendered (or evicted) since the last look
+        if time.time() - self._scanned_at >= self.rescan_interval:
+            self._load_index()
+
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry['size']
+            try:
+                os.remove(self.cache_dir / name)
+            except FileNotFoundError:
+                pass
+            print(f"🧹 Evicted {name} from image cache")
+
+    def _render(
+        self,
+        source_path: Path,
+        variant_path: Path,
+        width: Optional[int],
+        height: Optional[int],
+        fit: str,
+        fmt: str
+    ) -> int:
+        """Resize a source image and write it atomically into the cache."""
+        draft_box = self._draft_box(source_path, width, height)
+        # Wait for room in the decode budget before allocating any pixels
+        with decode_budget.admit(str(source_path), draft_box):
+            return self._render_admitted(source_path, variant_path, width, height, fit, fmt, draft_box)
+
+    def _draft_box(
+        self,
+        source_path: Path,
+        width: Optional[int],
+        height: Optional[int]
+    ) -> Optional[Tuple[int, int]]:
+        """
+        The requested size in stored pixels, for draft() and the decode budget.
+
+        Both work before EXIF orientation is applied, so the box is swapped
+        for orientations 5-8 (rotated by 90 degrees). Returns None for a
+        full-size render.
+        """
+        if not width and not height:
+            return None
+        try:
+            with Image.open(source_path) as img:
+                stored_size = img.size
+                orientation = img.getexif().get(0x0112)
+        except Image.DecompressionBombError:
+            # Leave it to the decode budget to reject
+            return width, height
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        return self._target_size(stored_size, width, height)
+
+    def _render_admitted(
+        self,
+        source_path: Path,
+        variant_path: Path,
+        width: Optional[int],
+        height: Optional[int],
+        fit: str,
+        fmt: str,
+        draft_box: Optional[Tuple[int, int]] = None
+    ) -> int:
+        img = Image.open(source_path)
+
+        # Let the JPEG decoder downscale with DCT scaling before full decode
+        if draft_box:
+            img.draft('RGB', draft_box)
+
+        img = ImageOps.exif_transpose(img)
+        target = self._target_size(img.size, width, height)
+
+        if target != img.size:
+            if fit == 'cover' and width and height:
+                img = ImageOps.fit(img, target, Image.LANCZOS)
+            elif fit == 'fill' and width and height:
+                img = img.resize(target, Image.LANCZOS)
+            else:
+                img.thumbnail(target, Image.LANCZOS)
+
+        pil_format = self.FORMATS[fmt][0]
+        save_kwargs = {}
+        if pil_format == 'JPEG':
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            save_kwargs = {'quality': self.quality, 'optimize': True, 'progressive': True}
+        elif pil_format == 'PNG':
+            save_kwargs = {'optimize': True}
+        elif pil_format in ('WEBP', 'AVIF'):
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.mode else 'RGB')
+            if pil_format == 'WEBP':
+                save_kwargs = {'quality': self.webp_quality, 'method': 4}
+            else:
+                save_kwargs = {'quality': self.avif_quality}
+
+        temp_path = variant_path.with_name(f".{variant_path.name}.{os.getpid()}.tmp")
+        img.save(str(temp_path), pil_format, **save_kwargs)
+        os.replace(temp_path, variant_path)
+        return variant_path.stat().st_size
+
+    def _target_size(
+        self,
+        source_size: Tuple[int, int],
+        width: Optional[int],
+        height: Optional[int]
+    ) -> Tuple[int, int]:
+        """Work out the output box, scaling missing sides and never upscaling."""
+        source_width, source_height = source_size
+        if not width and not height:
+            return source_size
+        if not height:
+            height = max(1, round(source_height * width / source_width))
+        if not width:
+            width = max(1, round(source_width * height / source_height))
+        # Shrink the whole box (keeping its aspect ratio) rather than upscale
+        scale = min(1.0, source_width / width, source_height / height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def stats(self) -> dict:
+        """Summarize cache usage along with per-variant access stats."""
+        with self._lock:
+            variants = [
+                {'name': name, **entry}
+                for name, entry in reversed(self._entries.items())
+            ]
+            return {
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'variant_count': len(variants),
+                'rendering': len(self._inflight),
+                'variants': variants,
+            }
+
+
+# Singleton instance
+image_cache = ImageCache(
+    IMAGE_CACHE_FOLDER,
+    IMAGE_CACHE_MAX_BYTES,
+    max_dimension=IMAGE_VARIANT_MAX_DIMENSION,
+    quality=IMAGE_VARIANT_QUALITY,
+    webp_quality=IMAGE_WEBP_QUALITY,
+    avif_quality=IMAGE_AVIF_QUALITY,
+    rescan_interval=IMAGE_CACHE_RESCAN_INTERVAL,
+)
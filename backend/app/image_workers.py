@@ -0,0 +1,376 @@
+"""Process pool for CPU-bound image work (HEIC conversion, previews, tiles)."""
+import base64
+import io
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+from app.decode_budget import decode_budget
+from app.config import IMAGE_WORKER_POOL_SIZE, IMAGE_TASK_TIMEOUT
+
+
+# ----------------------------------------------------------------------------
+# Tasks - module-level so they can be pickled into worker processes
+# ----------------------------------------------------------------------------
+
+def _register_heif_opener():
+    """Enable HEIC/HEIF decoding in this process if pillow-heif is installed."""
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def convert_heic_to_jpeg(source_path: str, dest_path: str, quality: int = 95) -> str:
+    """Convert a HEIC/HEIF file to JPEG, preserving its EXIF block."""
+    from PIL import Image
+    _register_heif_opener()
+
+    img = Image.open(source_path)
+    exif_data = img.info.get('exif')
+    if exif_data:
+        img.save(dest_path, 'JPEG', quality=quality, exif=exif_data)
+    else:
+        img.save(dest_path, 'JPEG', quality=quality)
+    return dest_path
+
+
+def _heif_embedded_thumbnail(source_path: str, min_size: int):
+    """Return the smallest embedded HEIF thumbnail at least min_size on its long side, if any."""
+    try:
+        import pillow_heif
+    except ImportError:
+        return None
+
+    heif_file = pillow_heif.open_heif(source_path)
+    image = heif_file[heif_file.primary_index]
+    if hasattr(image, 'get_thumbnail'):
+        # pillow-heif >= 0.14 lists thumbnails in info and decodes them on request
+        thumbnails = [image.get_thumbnail(i) for i in range(len(image.info.get('thumbnails', [])))]
+    else:
+        thumbnails = list(getattr(image, 'thumbnails', []))
+
+    candidates = [thumb for thumb in thumbnails if max(thumb.size) >= min_size]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda thumb: max(thumb.size)).to_pillow()
+
+
+def render_jpeg_preview(
+    source_path: str,
+    max_size: int = 800,
+    quality: int = 85,
+    min_thumbnail_size: int = 0
+) -> bytes:
+    """
+    Return a downscaled JPEG preview, decoding as few pixels as possible.
+
+    JPEGs are decoded at a reduced DCT scale via draft(), and HEIF files
+    use an embedded thumbnail when one of at least min_thumbnail_size
+    exists (0 disables the shortcut).
+    """
+    from PIL import Image, ImageOps
+    _register_heif_opener()
+
+    img = None
+    if min_thumbnail_size and source_path.lower().endswith(('.heic', '.heif')):
+        img = _heif_embedded_thumbnail(source_path, min_thumbnail_size)
+
+    if img is None:
+        img = Image.open(source_path)
+        # JPEG only: let libjpeg scale by 1/2, 1/4 or 1/8 while decoding
+        img.draft('RGB', (max_size, max_size))
+        img = ImageOps.exif_transpose(img)
+
+    img.thumbnail((max_size, max_size))
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def compute_dhash(source_path: str, hash_size: int = 8) -> str:
+    """
+    Difference hash: compare neighbouring pixels of a tiny grayscale copy.
+
+    Returns the hash_size * hash_size bit hash as a hex string.
+    """
+    from PIL import Image, ImageOps
+    _register_heif_opener()
+
+    img = Image.open(source_path)
+    # JPEG only: decode at a reduced scale (RGB, like analyze_photo, so hashes agree)
+    img.draft('RGB', (hash_size * 8, hash_size * 8))
+    img = ImageOps.exif_transpose(img)
+    return _dhash(img, hash_size)
+
+
+def _dhash(img, hash_size: int) -> str:
+    """dHash of an already-oriented image."""
+    from PIL import Image
+
+    img = img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+
+    pixels = img.load()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[col, row] > pixels[col + 1, row])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def analyze_photo(
+    source_path: str,
+    hash_size: int = 8,
+    placeholder_size: int = 16,
+    placeholder_quality: int = 30
+) -> dict:
+    """
+    Decode a stored photo once for everything the Photos row needs.
+
+    Returns:
+        Dictionary with width and height (as displayed, after EXIF
+        orientation), dhash, and placeholder: a tiny JPEG as a data URI
+        that clients can show while the full image loads
+    """
+    from PIL import Image, ImageOps
+    _register_heif_opener()
+
+    img = Image.open(source_path)
+    width, height = img.size
+    # Orientations 5-8 rotate by 90 degrees
+    if img.getexif().get(0x0112) in (5, 6, 7, 8):
+        width, height = height, width
+
+    # JPEG only: decode at the smallest DCT scale that still covers both outputs
+    reduced = max(hash_size * 8, placeholder_size * 4)
+    img.draft('RGB', (reduced, reduced))
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    placeholder = img.copy()
+    placeholder.thumbnail((placeholder_size, placeholder_size), Image.LANCZOS)
+    buf = io.BytesIO()
+    placeholder.save(buf, format='JPEG', quality=placeholder_quality, optimize=True)
+
+    return {
+        'width': width,
+        'height': height,
+        'dhash': _dhash(img, hash_size),
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii'),
+    }
+
+
+def render_tile_pyramid(
+    source_path: str,
+    dest_dir: str,
+    tile_size: int = 256,
+    overlap: int = 1,
+    quality: int = 85
+) -> dict:
+    """
+    Cut a Deep Zoom (DZI) tile pyramid for a large image.
+
+    The top level is the full image (after EXIF orientation) and each level
+    below halves it, down to a single pixel. Tiles are written to
+    {dest_dir}/{level}/{col}_{row}.jpg beside the {dest_dir}/image.dzi
+    descriptor, built in a temporary directory and moved into place so
+    readers never see a partial pyramid.
+
+    Returns:
+        Dictionary with width, height, levels and tiles
+    """
+    from PIL import Image, ImageOps
+    _register_heif_opener()
+
+    img = ImageOps.exif_transpose(Image.open(source_path))
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    width, height = img.size
+    max_level = math.ceil(math.log2(max(width, height)))
+
+    dest = Path(dest_dir)
+    temp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    shutil.rmtree(temp, ignore_errors=True)
+
+    tiles = 0
+    for level in range(max_level, -1, -1):
+        scale = 2 ** (max_level - level)
+        level_width, level_height = -(-width // scale), -(-height // scale)
+        if img.size != (level_width, level_height):
+            # Each level is resampled from the one above, not the original
+            img = img.resize((level_width, level_height), Image.LANCZOS)
+
+        level_dir = temp / str(level)
+        level_dir.mkdir(parents=True)
+        for row in range(-(-level_height // tile_size)):
+            for col in range(-(-level_width // tile_size)):
+                box = (
+                    max(0, col * tile_size - overlap),
+                    max(0, row * tile_size - overlap),
+                    min(level_width, (col + 1) * tile_size + overlap),
+                    min(level_height, (row + 1) * tile_size + overlap),
+                )
+                img.crop(box).save(level_dir / f"{col}_{row}.jpg", 'JPEG', quality=quality)
+                tiles += 1
+
+    (temp / 'image.dzi').write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+        f'Format="jpg" Overlap="{overlap}" TileSize="{tile_size}">'
+        f'<Size Width="{width}" Height="{height}"/></Image>\n'
+    )
+
+    shutil.rmtree(dest, ignore_errors=True)
+    os.replace(temp, dest)
+    return {'width': width, 'height': height, 'levels': max_level + 1, 'tiles': tiles}
+
+
+# ----------------------------------------------------------------------------
+# Pool
+# ----------------------------------------------------------------------------
+
+class ImageWorkerPool:
+    """
+    Shared ProcessPoolExecutor with per-task timeouts and crash recovery.
+
+    Every task decodes the image at its first argument, so each one is
+    admitted through the decode budget before it is handed to a worker.
+    """
+
+    def __init__(self, max_workers: int, task_timeout: float, budget=None):
+        # max_workers == 0 runs tasks inline on the calling thread
+        self.max_workers = max_workers
+        self.task_timeout = task_timeout
+        self.budget = budget or decode_budget
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the worker processes on first use."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                print(f"⚙️  Started image worker pool ({self.max_workers} processes)")
+            return self._executor
+
+    def _reset(self, broken: ProcessPoolExecutor):
+        """Replace a pool whose worker died so later tasks get a fresh one."""
+        with self._lock:
+            if self._executor is broken:
+                print("⚠️  Image worker crashed, restarting pool")
+                self._executor = None
+                broken.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, decode_size: Optional[int] = None):
+        """Run a single task in a worker and wait for its result."""
+        result = self.map(fn, [args], timeout=timeout, decode_size=decode_size)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def submit(self, fn: Callable, *args, decode_size: Optional[int] = None) -> Future:
+        """
+        Start a task without waiting for it; collect it later with gather().
+
+        Blocks while the decode budget is full. A task that can't be
+        admitted (too many pixels, or no room before the wait timeout)
+        gets a future holding that error instead.
+
+        Args:
+            decode_size: Box the task drafts its decode down to, if it
+                only needs a downscaled copy
+        """
+        try:
+            box = (decode_size, decode_size) if decode_size else None
+            cost = self.budget.acquire(self.budget.estimate(args[0], box))
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+
+        if self.max_workers == 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.budget.release(cost)
+            return future
+
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._reset(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+        except Exception:
+            self.budget.release(cost)
+            raise
+
+        def task_done(done: Future):
+            self.budget.release(cost)
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                self._reset(executor)
+
+        future.add_done_callback(task_done)
+        return future
+
+    def gather(self, futures: Iterable[Future], timeout: Optional[float] = None) -> List:
+        """
+        Wait for submitted tasks and collect results in submission order.
+
+        The timeout is one deadline for the whole batch, not per task. A
+        failing, crashing or timed-out task does not affect the others: its
+        slot in the returned list holds the exception instead of a result.
+        Timed-out tasks are cancelled, which marks them abandoned even if a
+        worker is already running them.
+        """
+        timeout = timeout or self.task_timeout
+        futures = list(futures)
+        done, _ = wait(futures, timeout=timeout)
+        results = []
+        for future in futures:
+            if future not in done:
+                future.cancel()
+                results.append(TimeoutError(f"Image task timed out after {timeout}s"))
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def map(
+        self,
+        fn: Callable,
+        arg_tuples: Iterable[tuple],
+        timeout: Optional[float] = None,
+        decode_size: Optional[int] = None
+    ) -> List:
+        """Fan tasks out across the pool and gather their results in order."""
+        return self.gather(
+            [self.submit(fn, *args, decode_size=decode_size) for args in arg_tuples],
+            timeout=timeout
+        )
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+# Singleton instance
+image_worker_pool = ImageWorkerPool(IMAGE_WORKER_POOL_SIZE, IMAGE_TASK_TIMEOUT)
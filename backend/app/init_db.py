@@ -22,6 +22,7 @@ def init_database():
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='Users'")
     if cursor.fetchone():
         print(f"✅ Database already initialized at {db_path}")
+        apply_migrations(connection)
         connection.close()
         return
     
@@ -129,5 +130,157 @@ def init_database():
     """)
     
     connection.commit()
+    apply_migrations(connection)
     connection.close()
     print("✅ Database initialized successfully!")
+
+
+def apply_migrations(connection):
+    """Create tables added after the initial schema (safe to run on every startup)."""
+    cursor = connection.cursor()
+    cursor.executescript("""
+        CREATE TABLE IF NOT EXISTS Jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_type VARCHAR(50) NOT NULL,
+            user_id INTEGER,
+            payload TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after INTEGER NOT NULL DEFAULT (strftime('%s','now')),
+            locked_by TEXT,
+            locked_at INTEGER,
+            result TEXT,
+            error TEXT,
+            created_at INTEGER DEFAULT (strftime('%s','now')),
+            updated_at INTEGER DEFAULT (strftime('%s','now')),
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON Jobs(status, run_after);
+
+        CREATE TABLE IF NOT EXISTS UploadSessions (
+            id VARCHAR(64) PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            location_id INTEGER,
+            filename VARCHAR(255) NOT NULL,
+            upload_length INTEGER NOT NULL,
+            upload_offset INTEGER NOT NULL DEFAULT 0,
+            status VARCHAR(20) NOT NULL DEFAULT 'uploading',
+            created_at INTEGER DEFAULT (strftime('%s','now')),
+            updated_at INTEGER DEFAULT (strftime('%s','now')),
+            expires_at INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires ON UploadSessions(expires_at);
+
+        CREATE TABLE IF NOT EXISTS StagedUploads (
+            token VARCHAR(64) PRIMARY KEY,
+            user_id INTEGER,
+            filename VARCHAR(255) NOT NULL,
+            path TEXT NOT NULL,
+            metadata TEXT NOT NULL,
+            created_at INTEGER DEFAULT (strftime('%s','now')),
+            expires_at INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_staged_uploads_expires ON StagedUploads(expires_at);
+
+        CREATE TABLE IF NOT EXISTS PhotoMetadata (
+            photo_id INTEGER PRIMARY KEY,
+            camera_make VARCHAR(100) COLLATE NOCASE,
+            camera_model VARCHAR(100) COLLATE NOCASE,
+            lens_model VARCHAR(255) COLLATE NOCASE,
+            focal_length REAL,
+            f_number REAL,
+            exposure_time REAL,
+            iso INTEGER,
+            altitude REAL,
+            exif_orientation INTEGER,
+            orientation VARCHAR(10),
+            format VARCHAR(10),
+            FOREIGN KEY (photo_id) REFERENCES Photos(id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_photo_metadata_make ON PhotoMetadata(camera_make);
+        CREATE INDEX IF NOT EXISTS idx_photo_metadata_model ON PhotoMetadata(camera_model);
+        CREATE INDEX IF NOT EXISTS idx_photo_metadata_lens ON PhotoMetadata(lens_model);
+        CREATE INDEX IF NOT EXISTS idx_photo_metadata_orientation ON PhotoMetadata(orientation);
+        CREATE INDEX IF NOT EXISTS idx_photo_metadata_format ON PhotoMetadata(format);
+        CREATE INDEX IF NOT EXISTS idx_photos_taken_at ON Photos(taken_at);
+        CREATE INDEX IF NOT EXISTS idx_photos_file_url ON Photos(file_url);
+
+        CREATE TABLE IF NOT EXISTS BackfillCheckpoints (
+            name VARCHAR(50) PRIMARY KEY,
+            last_photo_id INTEGER NOT NULL DEFAULT 0,
+            stats TEXT,
+            updated_at INTEGER DEFAULT (strftime('%s','now'))
+        );
+    """)
+
+    # Columns added to existing tables
+    add_column_if_missing(connection, 'Photos', 'dhash', 'VARCHAR(16)')
+    add_column_if_missing(connection, 'Photos', 'content_hash', 'VARCHAR(64)')
+    add_column_if_missing(connection, 'Photos', 'file_size', 'INTEGER')
+    add_column_if_missing(connection, 'Photos', 'width', 'INTEGER')
+    add_column_if_missing(connection, 'Photos', 'height', 'INTEGER')
+    add_column_if_missing(connection, 'Photos', 'placeholder', 'TEXT')
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_photos_content_hash ON Photos(content_hash, file_size)"
+    )
+    add_column_if_missing(connection, 'Trips', 'deleted_at', 'INTEGER')
+    add_column_if_missing(connection, 'Locations', 'deleted_at', 'INTEGER')
+    add_column_if_missing(connection, 'Photos', 'deleted_at', 'INTEGER')
+    add_column_if_missing(connection, 'Jobs', 'progress', 'TEXT')
+    connection.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_locations_trip ON Locations(trip_id);
+        CREATE INDEX IF NOT EXISTS idx_photos_location ON Photos(location_id);
+    """)
+    add_column_if_missing(connection, 'Photos', 'deepzoom_levels', 'INTEGER')
+    if add_column_if_missing(connection, 'Photos', 'dhash_seq', 'INTEGER'):
+        connection.execute("UPDATE Photos SET dhash_seq = id WHERE dhash IS NOT NULL")
+    # Number every dhash write so PerceptualIndex can pick up hashes filled
+    # in after insert, including by other processes (sql/add_dhash_seq.sql)
+    connection.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_photos_dhash_seq ON Photos(dhash_seq);
+        CREATE INDEX IF NOT EXISTS idx_photos_user_dhash_seq ON Photos(user_id, dhash_seq);
+
+        CREATE TRIGGER IF NOT EXISTS photos_dhash_inserted
+        AFTER INSERT ON Photos WHEN NEW.dhash IS NOT NULL
+        BEGIN
+            UPDATE Photos SET dhash_seq = (SELECT COALESCE(MAX(dhash_seq), 0) + 1 FROM Photos)
+            WHERE id = NEW.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS photos_dhash_updated
+        AFTER UPDATE OF dhash ON Photos WHEN NEW.dhash IS NOT NULL AND NEW.dhash IS NOT OLD.dhash
+        BEGIN
+            UPDATE Photos SET dhash_seq = (SELECT COALESCE(MAX(dhash_seq), 0) + 1 FROM Photos)
+            WHERE id = NEW.id;
+        END;
+    """)
+
+    connection.commit()
+
+    # PhotoMetadata is only written at upload, so photos from before it
+    # existed are left out of the /api/photos metadata filters until backfilled
+    cursor = connection.execute("""
+        SELECT 1 FROM Photos p
+        LEFT JOIN PhotoMetadata m ON m.photo_id = p.id
+        WHERE m.photo_id IS NULL AND p.deleted_at IS NULL
+        LIMIT 1
+    """)
+    if cursor.fetchone():
+        print("⚠️  Some photos have no PhotoMetadata yet; run `flask backfill-derivatives --only metadata`")
+
+
+def add_column_if_missing(connection, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists. Returns whether it was added."""
+    cursor = connection.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        print(f"➕ Added {table}.{column}")
+        return True
+    return False
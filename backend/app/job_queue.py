@@ -0,0 +1,407 @@
+"""Durable SQLite-backed job queue with worker threads, retries and backoff."""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+from app.config import (
+    DATABASE_FILENAME,
+    JOB_WORKER_THREADS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_INTERVAL,
+)
+from app.db import dict_factory
+
+
+class JobQueue:
+    """Run registered job handlers in background threads from the Jobs table."""
+
+    def __init__(
+        self,
+        db_path: str,
+        num_workers: int = 2,
+        max_attempts: int = 5,
+        retry_backoff: float = 5.0,
+        lease_seconds: int = 600,
+        poll_interval: float = 1.0
+    ):
+        self.db_path = str(db_path)
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        # Delay before retry N is retry_backoff * 2 ** (N - 1) seconds
+        self.retry_backoff = retry_backoff
+        # A running job whose lock is older than this is assumed orphaned;
+        # workers refresh the lock of the job they run every third of it
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+        self.handlers: Dict[str, Callable] = {}
+        self.failure_handlers: Dict[str, Callable] = {}
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # Job each worker thread is running, for report_progress()
+        self._current = threading.local()
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a dedicated connection (sqlite3 connections aren't shared across threads)."""
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.row_factory = dict_factory
+        return connection
+
+    def register(self, job_type: str, handler: Callable, on_failure: Optional[Callable] = None):
+        """
+        Register the handler for a job type.
+
+        Handlers are called as handler(connection, payload) and return a
+        JSON-serializable result. Raising an exception schedules a retry.
+        on_failure(payload), if given, is called once the job has failed
+        its last attempt, to clean up what the job would have consumed.
+        """
+        self.handlers[job_type] = handler
+        if on_failure is not None:
+            self.failure_handlers[job_type] = on_failure
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: dict,
+        user_id: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        delay: float = 0,
+        connection=None
+    ) -> int:
+        """
+        Persist a job and wake a worker. Returns the job id.
+
+        Given the caller's connection, the job is inserted without
+        committing, so it only becomes visible (and runnable) if the
+        caller's transaction commits.
+        """
+        now = int(time.time())
+        own_connection = connection is None
+        if own_connection:
+            connection = self._connect()
+        try:
+            cursor = connection.execute(
+                """
+                INSERT INTO Jobs
+                (job_type, user_id, payload, status, attempts, max_attempts, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+                """,
+                (job_type, user_id, json.dumps(payload), max_attempts or self.max_attempts,
+                 int(now + delay), now, now)
+            )
+            job_id = cursor.lastrowid
+            if own_connection:
+                connection.commit()
+        finally:
+            if own_connection:
+                connection.close()
+
+        print(f"📥 Queued {job_type} job {job_id}")
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def enqueue_once(self, job_type: str, payload: dict, delay: float = 0) -> int:
+        """Enqueue a job unless one of the same type is already queued or running."""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                "SELECT id FROM Jobs WHERE job_type = ? AND status IN ('queued', 'running') LIMIT 1",
+                (job_type,)
+            )
+            existing = cursor.fetchone()
+        finally:
+            connection.close()
+
+        if existing:
+            return existing['id']
+        return self.enqueue(job_type, payload, delay=delay)
+
+    def latest_job(self, job_type: str, status: str = 'succeeded') -> Optional[dict]:
+        """Most recently updated job of a type in the given status, decoded like get_job()."""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                "SELECT id FROM Jobs WHERE job_type = ? AND status = ? ORDER BY updated_at DESC, id DESC LIMIT 1",
+                (job_type, status)
+            )
+            job = cursor.fetchone()
+        finally:
+            connection.close()
+
+        return self.get_job(job['id']) if job else None
+
+    def report_progress(self, connection, progress: dict):
+        """
+        Record progress of the job running on this thread and commit.
+
+        Long handlers call this between batches so GET /api/jobs/<id>
+        shows how far along they are.
+        """
+        job_id = getattr(self._current, 'job_id', None)
+        if job_id is None:
+            return
+        connection.execute(
+            "UPDATE Jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(progress), int(time.time()), job_id)
+        )
+        connection.commit()
+
+    def finish_current(self, connection, result: dict):
+        """
+        Mark the job running on this thread succeeded, without committing.
+
+        Handlers whose work isn't safe to repeat call this just before
+        their final commit, so the job and its effects commit together and
+        a crash afterwards can't run it again.
+        """
+        job_id = getattr(self._current, 'job_id', None)
+        if job_id is None:
+            return
+        connection.execute(
+            """
+            UPDATE Jobs
+            SET status = 'succeeded', result = ?, error = NULL,
+                locked_by = NULL, locked_at = NULL, updated_at = ?
+            WHERE id = ?
+            """,
+            (json.dumps(result), int(time.time()), job_id)
+        )
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        """Fetch a job with its payload and result decoded."""
+        connection = self._connect()
+        try:
+            cursor = connection.execute("SELECT * FROM Jobs WHERE id = ?", (job_id,))
+            job = cursor.fetchone()
+        finally:
+            connection.close()
+
+        if job:
+            job['payload'] = json.loads(job['payload']) if job['payload'] else None
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            job['progress'] = json.loads(job['progress']) if job.get('progress') else None
+        return job
+
+    def start(self):
+        """Start worker threads once per process and recover orphaned jobs."""
+        with self._lock:
+            if self._threads or self.num_workers <= 0:
+                return
+            self.recover_orphaned_jobs()
+            for index in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(f"{self._worker_prefix}:{index}",),
+                    name=f"job-worker-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            print(f"👷 Started {self.num_workers} job worker threads")
+
+    def stop(self):
+        """Ask workers to exit after their current job."""
+        self._stopping.set()
+        self._wakeup.set()
+
+    def recover_orphaned_jobs(self) -> int:
+        """
+        Requeue running jobs whose worker is gone, e.g. after a crash or restart.
+
+        A job locked by a live process on this host is never orphaned.
+        Otherwise it is if its process on this host is gone, or if its
+        lease expired (no heartbeat, e.g. another host crashed).
+        """
+        cutoff = int(time.time()) - self.lease_seconds
+        hostname = socket.gethostname()
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                "SELECT id, locked_by, locked_at FROM Jobs WHERE status = 'running'"
+            )
+            orphaned = []
+            for job in cursor.fetchall():
+                host, _, rest = (job['locked_by'] or '').partition(':')
+                pid = rest.split(':')[0]
+                if host == hostname and pid.isdigit():
+                    if not self._process_alive(int(pid)):
+                        orphaned.append(job['id'])
+                elif (job['locked_at'] or 0) < cutoff:
+                    orphaned.append(job['id'])
+
+            for job_id in orphaned:
+                connection.execute(
+                    """
+                    UPDATE Jobs
+                    SET status = 'queued', locked_by = NULL, locked_at = NULL,
+                        updated_at = strftime('%s','now')
+                    WHERE id = ? AND status = 'running'
+                    """,
+                    (job_id,)
+                )
+            connection.commit()
+        except sqlite3.OperationalError as e:
+            # Jobs table not created yet (e.g. database init failed)
+            print(f"Could not recover jobs: {e}")
+            orphaned = []
+        finally:
+            connection.close()
+
+        if orphaned:
+            print(f"♻️  Requeued {len(orphaned)} orphaned jobs")
+        return len(orphaned)
+
+    def _process_alive(self, pid: int) -> bool:
+        """Check whether a local process id is still running."""
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _claim_next(self, connection, worker_id: str) -> Optional[dict]:
+        """Atomically mark the oldest runnable job as ours."""
+        now = int(time.time())
+        cursor = connection.execute(
+            """
+            UPDATE Jobs
+            SET status = 'running', locked_by = ?, locked_at = ?,
+                attempts = attempts + 1, updated_at = ?
+            WHERE id = (
+                SELECT id FROM Jobs
+                WHERE status = 'queued' AND run_after <= ?
+                ORDER BY run_after, id
+                LIMIT 1
+            )
+            RETURNING *
+            """,
+            (worker_id, now, now, now)
+        )
+        rows = cursor.fetchall()
+        connection.commit()
+        return rows[0] if rows else None
+
+    def _worker_loop(self, worker_id: str):
+        """Claim and run jobs until stopped."""
+        last_recovery = time.time()
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                job = self._claim_next(connection, worker_id)
+                if job:
+                    self._run_job(connection, job)
+                    continue
+            except Exception as e:
+                print(f"Job worker {worker_id} error: {e}")
+            finally:
+                if connection is not None:
+                    connection.close()
+
+            # Periodically pick up jobs orphaned by other crashed processes
+            if time.time() - last_recovery > self.lease_seconds:
+                self.recover_orphaned_jobs()
+                last_recovery = time.time()
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _heartbeat(self, job_id: int, worker_id: str, done: threading.Event):
+        """Refresh a running job's lock until done is set, so its lease never expires mid-run."""
+        while not done.wait(self.lease_seconds / 3):
+            connection = self._connect()
+            try:
+                connection.execute(
+                    "UPDATE Jobs SET locked_at = ? WHERE id = ? AND status = 'running' AND locked_by = ?",
+                    (int(time.time()), job_id, worker_id)
+                )
+                connection.commit()
+            except sqlite3.OperationalError as e:
+                # Busy behind the handler's own write; the next beat retries
+                print(f"Could not refresh lease of job {job_id}: {e}")
+            finally:
+                connection.close()
+
+    def _run_job(self, connection, job: dict):
+        """Run one claimed job and record success, retry or failure."""
+        handler = self.handlers.get(job['job_type'])
+        started = time.time()
+        heartbeat_done = threading.Event()
+        threading.Thread(
+            target=self._heartbeat,
+            args=(job['id'], job['locked_by'], heartbeat_done),
+            name=f"job-heartbeat-{job['id']}",
+            daemon=True,
+        ).start()
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job type {job['job_type']}")
+
+            self._current.job_id = job['id']
+            result = handler(connection, json.loads(job['payload']))
+            connection.commit()
+
+            self.finish_current(connection, result)
+            connection.commit()
+            print(f"✅ Job {job['id']} ({job['job_type']}) finished in {time.time() - started:.1f}s")
+
+        except Exception as e:
+            connection.rollback()
+            traceback.print_exc()
+
+            if job['attempts'] < job['max_attempts']:
+                delay = self.retry_backoff * (2 ** (job['attempts'] - 1))
+                status = 'queued'
+                run_after = int(time.time() + delay)
+                print(f"🔁 Job {job['id']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {e}")
+            else:
+                status = 'failed'
+                run_after = job['run_after']
+                print(f"❌ Job {job['id']} failed permanently: {e}")
+                on_failure = self.failure_handlers.get(job['job_type'])
+                if on_failure is not None:
+                    try:
+                        on_failure(json.loads(job['payload']))
+                    except Exception as cleanup_error:
+                        print(f"Cleanup after job {job['id']} failed: {cleanup_error}")
+
+            connection.execute(
+                """
+                UPDATE Jobs
+                SET status = ?, error = ?, run_after = ?,
+                    locked_by = NULL, locked_at = NULL, updated_at = ?
+                WHERE id = ?
+                """,
+                (status, str(e), run_after, int(time.time()), job['id'])
+            )
+            connection.commit()
+
+        finally:
+            heartbeat_done.set()
+            self._current.job_id = None
+
+
+# Singleton instance
+job_queue = JobQueue(
+    DATABASE_FILENAME,
+    num_workers=JOB_WORKER_THREADS,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retry_backoff=JOB_RETRY_BACKOFF,
+    lease_seconds=JOB_LEASE_SECONDS,
+    poll_interval=JOB_POLL_INTERVAL,
+)
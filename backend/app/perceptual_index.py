@@ -0,0 +1,153 @@
+"""BK-tree index of photo dHashes for sub-linear near-duplicate lookups."""
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.config import DHASH_MAX_DISTANCE
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+
+    Each child edge is labelled with its distance to the parent, so a
+    search for radius r only descends into edges within r of the query's
+    distance to the node (triangle inequality).
+    """
+
+    def __init__(self):
+        # Node: [hash, [items], {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item):
+        """Insert an item under its hash; identical hashes share a node."""
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """Return (distance, item) for every item within max_distance, closest first."""
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class PerceptualIndex:
+    """
+    Per-user BK-trees of Photos.dhash, loaded lazily and topped up incrementally.
+
+    Every dhash write gets the next Photos.dhash_seq (set by a trigger),
+    so refreshing from the highest value seen also picks up hashes filled
+    in after insert, by this process or another (e.g. the backfill CLI).
+    New photos are only indexed by that refresh, never while their insert
+    could still be rolled back.
+    """
+
+    def __init__(self, max_distance: int = 6):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        # user_id -> {'tree': BKTree, 'hashes': photo id -> indexed dhash, 'max_seq': int}
+        self._users: Dict[int, dict] = {}
+
+    def _refresh(self, connection, user_id: int) -> dict:
+        """Index any of the user's photos hashed since this process last looked."""
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = {'tree': BKTree(), 'hashes': {}, 'max_seq': 0}
+            self._users[user_id] = entry
+
+        cursor = connection.execute(
+            """
+            SELECT id, dhash, dhash_seq FROM Photos
+            WHERE user_id = ? AND dhash_seq > ? AND dhash IS NOT NULL
+            ORDER BY dhash_seq
+            """,
+            (user_id, entry['max_seq'])
+        )
+        for row in cursor.fetchall():
+            # A re-hashed photo gets a second node; find_similar re-checks the stored hash
+            if entry['hashes'].get(row['id']) != row['dhash']:
+                entry['tree'].add(int(row['dhash'], 16), row['id'])
+                entry['hashes'][row['id']] = row['dhash']
+            entry['max_seq'] = row['dhash_seq']
+        return entry
+
+    def find_similar(
+        self,
+        connection,
+        user_id: int,
+        dhash: str,
+        exclude_id: Optional[int] = None,
+        max_distance: Optional[int] = None
+    ) -> List[dict]:
+        """
+        Find the user's photos whose dHash is within max_distance bits.
+
+        Returns:
+            List of {'photo_id', 'distance'} for photos that still exist,
+            closest first
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+
+        with self._lock:
+            entry = self._refresh(connection, user_id)
+            matches = entry['tree'].search(int(dhash, 16), max_distance)
+
+        candidates = {photo_id for _, photo_id in matches if photo_id != exclude_id}
+        if not candidates:
+            return []
+
+        # Deleted, tombstoned (or rolled back and reused) ids stay in the tree, so
+        # re-check each candidate against the hash actually stored
+        placeholders = ','.join('?' * len(candidates))
+        cursor = connection.execute(
+            f"""
+            SELECT id, dhash FROM Photos
+            WHERE id IN ({placeholders}) AND dhash IS NOT NULL AND deleted_at IS NULL
+            """,
+            list(candidates)
+        )
+        value = int(dhash, 16)
+        similar = []
+        for row in cursor.fetchall():
+            distance = hamming_distance(value, int(row['dhash'], 16))
+            if distance <= max_distance:
+                similar.append({'photo_id': row['id'], 'distance': distance})
+
+        similar.sort(key=lambda match: match['distance'])
+        return similar
+
+
+# Singleton instance
+perceptual_index = PerceptualIndex(max_distance=DHASH_MAX_DISTANCE)
@@ -5,16 +5,74 @@ from typing import List, Optional, Tuple
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 import hashlib
+import json
+import shutil
+import tempfile
+from concurrent.futures import Future
 from pathlib import Path
 from app.geocoding import geocoding_service
+from app.boundaries import place_resolver
+from app.exif_reader import exif_reader
+from app.image_workers import image_worker_pool, convert_heic_to_jpeg, analyze_photo
+from app.decode_budget import ImageTooLargeError
+from app.deepzoom import deep_zoom
+from app.perceptual_index import perceptual_index, BKTree
+from app.job_queue import job_queue
+from app.storage import photo_storage
+from app.config import (
+    UPLOAD_FOLDER,
+    UPLOAD_INCOMING_FOLDER,
+    PLACEHOLDER_SIZE,
+    PLACEHOLDER_QUALITY,
+    PHOTO_INSERT_BATCH_SIZE,
+    S3_PRESIGN_EXPIRES,
+    HEIC_EAGER_TRANSCODE,
+)
+
+try:
+    import pillow_heif  # noqa: F401
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
+
+# Photos columns filled in by analyze_photo()
+IMAGE_FIELDS = ('dhash', 'width', 'height', 'placeholder')
+
+# Photos columns written at ingest, in insert order
+PHOTO_INSERT_COLUMNS = (
+    'location_id', 'user_id', 'x', 'y', 'file_url', 'original_filename', 'taken_at',
+    'is_cover_photo', 'dhash', 'content_hash', 'file_size', 'width', 'height', 'placeholder',
+)
+
+# PhotoMetadata columns filled in by extract_camera_details()
+EXIF_METADATA_FIELDS = (
+    'camera_make', 'camera_model', 'lens_model', 'focal_length', 'f_number',
+    'exposure_time', 'iso', 'altitude', 'exif_orientation',
+)
+
 
 class PhotoService:
-    def __init__(self, upload_dir: str = "uploads/photos"):
+    def __init__(self, upload_dir: str = str(UPLOAD_FOLDER), storage=None):
         self.upload_dir = Path(upload_dir)
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        # Durable copy of every photo; upload_dir holds the working copies
+        # that EXIF reads, hashing and resizing need
+        self.storage = storage or photo_storage
     
     def extract_exif_data(self, image_path: str) -> dict:
         """Extract EXIF metadata from an image (supports HEIC, JPEG, PNG)."""
+        # Fast path: read GPS/timestamps from the JPEG APP1 segment or HEIF
+        # Exif item without decoding the image
+        metadata = exif_reader.read(image_path)
+        if metadata is not None:
+            if not metadata:
+                print(f"No EXIF data found in {image_path}")
+            return metadata
+
+        return self._extract_exif_data_with_pillow(image_path)
+
+    def _extract_exif_data_with_pillow(self, image_path: str) -> dict:
+        """Extract EXIF metadata by opening the image with Pillow."""
         try:
             # Try to register HEIC opener if available
             try:
@@ -44,6 +102,14 @@ class PhotoService:
                 tag = TAGS.get(tag_id, tag_id)
                 metadata[tag] = value
             
+            # Exposure and lens tags live in the Exif sub-IFD
+            if hasattr(exif_data, 'get_ifd'):
+                try:
+                    for tag_id, value in exif_data.get_ifd(0x8769).items():
+                        metadata.setdefault(TAGS.get(tag_id, tag_id), value)
+                except (KeyError, ValueError):
+                    pass
+            
             # Extract GPS data - handle IFD pointer
             # For HEIC files, GPSInfo is often an IFD pointer (integer)
             # We need to use get_ifd() to follow the pointer
@@ -145,77 +211,470 @@ class PhotoService:
             print(f"Error extracting datetime: {e}")
             return None
     
-    def save_photo_file(self, file, original_filename: str, convert_heic: bool = True) -> Tuple[str, str]:
+    def compute_content_hash(self, file_path: str) -> str:
+        """SHA-256 hex digest of a file, read in 1MB blocks."""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def describe_content(self, file_path: str) -> dict:
+        """Content hash and byte size of an original upload, as the client would compute them."""
+        return {
+            'content_hash': self.compute_content_hash(file_path),
+            'file_size': os.path.getsize(file_path),
+        }
+
+    def summarize_exif(self, exif_data: dict) -> dict:
+        """
+        Reduce raw EXIF to the JSON-safe fields photo rows are built from.
+        
+        Returns:
+            Dictionary with latitude/longitude (None without GPS), taken_at
+            and the camera details from extract_camera_details()
+        """
+        gps_coords = None
+        if 'GPSInfo' in exif_data:
+            gps_coords = self.convert_gps_to_decimal(exif_data['GPSInfo'])
+        
+        return {
+            'latitude': gps_coords[0] if gps_coords else None,
+            'longitude': gps_coords[1] if gps_coords else None,
+            'taken_at': self.extract_datetime(exif_data),
+            **self.extract_camera_details(exif_data),
+        }
+
+    def extract_camera_details(self, exif_data: dict) -> dict:
+        """
+        Pull the camera, exposure and altitude tags stored in PhotoMetadata.
+        
+        Returns:
+            Dictionary keyed by EXIF_METADATA_FIELDS; missing tags are None
+        """
+        def text(tag):
+            value = exif_data.get(tag)
+            if isinstance(value, bytes):
+                value = value.decode('ascii', errors='replace')
+            value = str(value).strip('\x00 ') if value is not None else ''
+            return value or None
+        
+        def number(tag):
+            value = exif_data.get(tag)
+            if isinstance(value, (tuple, list)):
+                value = value[0] if value else None
+            try:
+                return float(value) if value is not None else None
+            except (TypeError, ValueError, ZeroDivisionError):
+                return None
+        
+        altitude = None
+        gps_info = exif_data.get('GPSInfo')
+        if isinstance(gps_info, dict) and gps_info.get('GPSAltitude') is not None:
+            try:
+                altitude = float(gps_info['GPSAltitude'])
+                # GPSAltitudeRef 1 means below sea level
+                if gps_info.get('GPSAltitudeRef') in (1, b'\x01'):
+                    altitude = -altitude
+            except (TypeError, ValueError, ZeroDivisionError):
+                altitude = None
+        
+        iso = number('ISOSpeedRatings')
+        orientation = number('Orientation')
+        
+        return {
+            'camera_make': text('Make'),
+            'camera_model': text('Model'),
+            'lens_model': text('LensModel'),
+            'focal_length': number('FocalLength'),
+            'f_number': number('FNumber'),
+            'exposure_time': number('ExposureTime'),
+            'iso': int(iso) if iso is not None else None,
+            'altitude': altitude,
+            'exif_orientation': int(orientation) if orientation is not None else None,
+        }
+
+    def photo_orientation(self, width: Optional[int], height: Optional[int]) -> Optional[str]:
+        """Classify displayed dimensions as landscape, portrait or square."""
+        if not width or not height:
+            return None
+        if width > height:
+            return 'landscape'
+        if height > width:
+            return 'portrait'
+        return 'square'
+
+    def photo_format(self, original_filename: str) -> Optional[str]:
+        """Format of the original upload, from its extension (jpeg, heic, png, ...)."""
+        extension = Path(original_filename or '').suffix.lower().lstrip('.')
+        if extension == 'jpg':
+            return 'jpeg'
+        return extension or None
+
+    def record_photo_metadata(self, connection, rows: List[Tuple[int, dict]]):
+        """
+        Write PhotoMetadata rows without committing.
+        
+        Args:
+            connection: SQLite database connection
+            rows: List of (photo_id, details) where details holds
+                EXIF_METADATA_FIELDS plus orientation and format
+        """
+        columns = EXIF_METADATA_FIELDS + ('orientation', 'format')
+        connection.executemany(
+            f"""
+            INSERT OR REPLACE INTO PhotoMetadata (photo_id, {', '.join(columns)})
+            VALUES (?, {', '.join('?' * len(columns))})
+            """,
+            [(photo_id, *(details.get(column) for column in columns)) for photo_id, details in rows]
+        )
+
+    def save_photo_file(
+        self,
+        file,
+        original_filename: str,
+        convert_heic: bool = HEIC_EAGER_TRANSCODE
+    ) -> Tuple[str, str]:
         """
         Save photo file locally and return the file URL and saved extension.
         
         Args:
             file: FileStorage object
             original_filename: Original filename
-            convert_heic: If True, convert HEIC to JPG for web compatibility
+            convert_heic: If True, convert HEIC to JPG now; otherwise keep the
+                original and let serve_photo transcode it on first view
             
         Returns:
             Tuple of (file_url, saved_extension)
         """
+        original_ext = Path(original_filename).suffix.lower()
+        
+        # HEIC conversion runs on the image worker pool from a staged copy
+        if original_ext in ['.heic', '.heif'] and convert_heic and HEIF_SUPPORTED:
+            temp_heic = self.stage_upload(file)
+            try:
+                result = self.save_photo_files([(temp_heic, original_filename)], convert_heic=True)[0]
+            finally:
+                os.remove(temp_heic)
+            
+            if isinstance(result, Exception):
+                raise result
+            return result
+        
         # Generate unique filename
         timestamp = int(datetime.now().timestamp())
         file.seek(0)
         file_hash = hashlib.md5(file.read()).hexdigest()[:8]
         file.seek(0)  # Reset file pointer after reading
         
-        original_ext = Path(original_filename).suffix.lower()
+        if original_ext in ['.heic', '.heif'] and not HEIF_SUPPORTED:
+            print(f"Warning: pillow-heif not installed. HEIC file saved as-is but may not display in browsers.")
         
-        # Determine if we need to convert HEIC
-        if original_ext in ['.heic', '.heif'] and convert_heic:
-            # Convert HEIC to JPG for web compatibility
+        # Save regular image formats (and HEICs kept for lazy transcoding) as-is
+        file_ext = original_ext if original_ext else '.jpg'
+        new_filename = f"{timestamp}_{file_hash}{file_ext}"
+        file_path = self.new_photo_path(new_filename)
+        file.save(str(file_path))
+        
+        # Return relative path as URL
+        return self.photo_url(new_filename), file_ext
+
+    def save_photo_files(
+        self,
+        staged_files: List[Tuple[str, str]],
+        convert_heic: bool = HEIC_EAGER_TRANSCODE
+    ) -> List:
+        """
+        Save already-staged photos permanently, converting HEICs in parallel if asked.
+        
+        Args:
+            staged_files: List of (path_on_disk, original_filename) tuples
+            convert_heic: If True, convert HEIC to JPG now instead of on first view
+            
+        Returns:
+            List aligned with staged_files; each entry is (file_url, saved_extension)
+            or the Exception raised while saving that file
+        """
+        futures = []
+        for source_path, original_filename in staged_files:
             try:
-                from pillow_heif import register_heif_opener
-                register_heif_opener()
-                
-                # Save temp HEIC file
-                temp_heic = f"/tmp/{timestamp}_{file_hash}{original_ext}"
-                file.save(temp_heic)
-                
-                # Open and convert to JPG
-                img = Image.open(temp_heic)
-                
-                # Preserve EXIF data during conversion
-                exif_data = img.info.get('exif')
-                
-                new_filename = f"{timestamp}_{file_hash}.jpg"
-                file_path = self.upload_dir / new_filename
-                
-                # Save as JPEG with EXIF
-                if exif_data:
-                    img.save(str(file_path), 'JPEG', quality=95, exif=exif_data)
+                futures.append(self.start_photo_save(source_path, original_filename, convert_heic))
+            except Exception as e:
+                failed = Future()
+                failed.set_exception(e)
+                futures.append(failed)
+        
+        # Wait for the CPU-bound conversions fanned out across worker processes
+        return image_worker_pool.gather(futures)
+
+    def start_photo_save(
+        self,
+        source_path: str,
+        original_filename: str,
+        convert_heic: bool = HEIC_EAGER_TRANSCODE,
+        file_hash: Optional[str] = None,
+        move: bool = False
+    ) -> Future:
+        """
+        Begin saving one staged photo into the upload directory.
+        
+        Eager HEIC conversion is submitted to the image worker pool and runs
+        in the background; everything else is stored before this returns.
+        
+        Args:
+            source_path: Staged file on disk
+            original_filename: Original filename (its extension picks the format)
+            convert_heic: If True, convert HEIC to JPG now instead of on first view
+            file_hash: MD5 hex digest if the caller already computed it
+            move: Rename the staged file into place (or delete it after
+                conversion) instead of copying it
+            
+        Returns:
+            Future resolving to (file_url, saved_extension)
+        """
+        timestamp = int(datetime.now().timestamp())
+        if file_hash is None:
+            with open(source_path, 'rb') as f:
+                file_hash = hashlib.md5(f.read()).hexdigest()
+        file_hash = file_hash[:8]
+        original_ext = Path(original_filename).suffix.lower()
+        saved = Future()
+        
+        if original_ext in ['.heic', '.heif'] and convert_heic and HEIF_SUPPORTED:
+            new_filename = f"{timestamp}_{file_hash}.jpg"
+            dest_path = self.new_photo_path(new_filename)
+            # The worker writes beside the photo; it is renamed into place
+            # only if the caller is still waiting for it
+            temp_path = dest_path.with_name(f".{new_filename}.tmp")
+            conversion = image_worker_pool.submit(
+                convert_heic_to_jpeg, source_path, str(temp_path), 95
+            )
+            
+            def conversion_done(done: Future):
+                if move and os.path.exists(source_path):
+                    os.remove(source_path)
+                error = None if done.cancelled() else done.exception()
+                if not saved.set_running_or_notify_cancel():
+                    # gather() timed out and abandoned this save
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    print(f"🗑️  Discarded HEIC conversion abandoned after timeout: {original_filename}")
+                elif done.cancelled() or error:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    print(f"❌ HEIC conversion failed for {original_filename}: {error}")
+                    saved.set_exception(error or TimeoutError("HEIC conversion cancelled"))
                 else:
-                    img.save(str(file_path), 'JPEG', quality=95)
-                
-                # Clean up temp file
-                os.remove(temp_heic)
-                
-                saved_ext = '.jpg'
-                print(f"Converted HEIC to JPG: {original_filename} -> {new_filename}")
-                
-            except ImportError:
-                # pillow-heif not installed, save as-is
-                print(f"Warning: pillow-heif not installed. HEIC file saved as-is but may not display in browsers.")
-                new_filename = f"{timestamp}_{file_hash}{original_ext}"
-                file_path = self.upload_dir / new_filename
-                file.save(str(file_path))
-                saved_ext = original_ext
-                
+                    os.replace(temp_path, dest_path)
+                    print(f"Converted HEIC to JPG: {original_filename} -> {new_filename}")
+                    saved.set_result((self.photo_url(new_filename), '.jpg'))
+            
+            def save_done(done: Future):
+                # Abandoned before a worker picked it up: free its slot and budget
+                if done.cancelled():
+                    conversion.cancel()
+            
+            conversion.add_done_callback(conversion_done)
+            saved.add_done_callback(save_done)
+            return saved
+        
+        if original_ext in ['.heic', '.heif'] and not HEIF_SUPPORTED:
+            print(f"Warning: pillow-heif not installed. HEIC file saved as-is but may not display in browsers.")
+        
+        file_ext = original_ext if original_ext else '.jpg'
+        new_filename = f"{timestamp}_{file_hash}{file_ext}"
+        if move:
+            os.replace(source_path, self.new_photo_path(new_filename))
         else:
-            # Save regular image formats as-is
-            file_ext = original_ext if original_ext else '.jpg'
-            new_filename = f"{timestamp}_{file_hash}{file_ext}"
-            file_path = self.upload_dir / new_filename
-            file.save(str(file_path))
-            saved_ext = file_ext
+            shutil.copyfile(source_path, self.new_photo_path(new_filename))
+        saved.set_result((self.photo_url(new_filename), file_ext))
+        return saved
+
+    def stage_upload(self, file, directory: Optional[str] = None) -> str:
+        """Save an uploaded file to a unique temp path so concurrent uploads never collide."""
+        suffix = Path(file.filename or '').suffix.lower()
+        fd, temp_path = tempfile.mkstemp(prefix='journitag_', suffix=suffix, dir=directory)
+        os.close(fd)
+        file.seek(0)
+        file.save(temp_path)
+        return temp_path
+
+    def get_streaming_dir(self) -> str:
+        """Hidden directory beside the photos where streamed uploads land before being renamed into place."""
+        streaming_dir = self.upload_dir / '.streaming'
+        streaming_dir.mkdir(parents=True, exist_ok=True)
+        return str(streaming_dir)
+
+    def create_incoming_dir(self) -> str:
+        """Create a durable directory holding one async upload batch until it is processed."""
+        UPLOAD_INCOMING_FOLDER.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkdtemp(prefix='batch_', dir=str(UPLOAD_INCOMING_FOLDER))
+
+    def shard_dir(self, filename: str) -> str:
+        """Two levels of hashed subdirectories (ab/cd) a stored file lives under."""
+        digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}"
+
+    def photo_url(self, filename: str) -> str:
+        """URL of a stored file in the sharded layout."""
+        return f"/uploads/photos/{self.shard_dir(filename)}/{filename}"
+
+    def photo_urls(self, file_url: str) -> Tuple[str, str]:
+        """Both URLs (flat, sharded) a stored file may be recorded under."""
+        filename = Path(file_url).name
+        return f"/uploads/photos/{filename}", self.photo_url(filename)
+
+    def new_photo_path(self, filename: str) -> Path:
+        """Path a newly stored file is written to, creating its shard directory."""
+        path = self.upload_dir / self.shard_dir(filename) / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def storage_key(self, file_url: str) -> str:
+        """Key of a stored file in the storage backend (its sharded path)."""
+        filename = Path(file_url).name
+        return f"{self.shard_dir(filename)}/{filename}"
+
+    def local_photo_path(self, file_url: str) -> Path:
+        """
+        Resolve a stored /uploads/photos/... URL to its working copy on disk.
         
-        # Return relative path as URL
-        return f"/uploads/photos/{new_filename}", saved_ext
-    
+        Only the filename is used, so URLs in either layout find the file
+        whether or not migrate_photo_storage() has moved it yet.
+        """
+        filename = Path(file_url).name
+        upload_dir = self.upload_dir.resolve()
+        sharded_path = upload_dir / self.shard_dir(filename) / filename
+        if sharded_path.exists():
+            return sharded_path
+        flat_path = upload_dir / filename
+        return flat_path if flat_path.exists() else sharded_path
+
+    def get_photo_path(self, file_url: str) -> Path:
+        """Like local_photo_path(), fetching the file from the storage backend if needed."""
+        path = self.local_photo_path(file_url)
+        filename = path.name
+        if path.exists() or filename.startswith('.'):
+            return path
+        
+        try:
+            self.storage.get_file(self.storage_key(filename), str(path))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Could not fetch {filename} from storage: {e}")
+        return path
+
+    def presigned_photo_url(self, file_url: str) -> Optional[str]:
+        """Direct storage URL for a photo, or None when the app serves it itself."""
+        return self.storage.presigned_url(self.storage_key(file_url), S3_PRESIGN_EXPIRES)
+
+    def sync_photo_storage(self, connection, batch_size: int = 500) -> dict:
+        """
+        Copy working copies the storage backend doesn't have yet, e.g. after
+        switching PHOTO_STORAGE on an instance with existing photos.
+        
+        Returns:
+            Dictionary with files uploaded, files already stored and files missing
+        """
+        stats = {'files_uploaded': 0, 'files_present': 0, 'files_missing': 0}
+        last_id = 0
+        seen = set()
+        
+        while True:
+            cursor = connection.execute(
+                "SELECT id, file_url FROM Photos WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            
+            uploads = []
+            for row in rows:
+                key = self.storage_key(row['file_url'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                if self.storage.exists(key):
+                    stats['files_present'] += 1
+                    continue
+                path = self.local_photo_path(row['file_url'])
+                if not path.exists():
+                    stats['files_missing'] += 1
+                    continue
+                uploads.append((key, str(path)))
+            
+            for (key, _), result in zip(uploads, self.storage.put_files(uploads)):
+                if isinstance(result, Exception):
+                    print(f"❌ Failed to upload {key}: {result}")
+                    stats['files_missing'] += 1
+                else:
+                    stats['files_uploaded'] += 1
+            print(f"🪣 Synced photos up to id {last_id} ({stats['files_uploaded']} uploaded)")
+        
+        return stats
+
+    def migrate_photo_storage(self, connection, batch_size: int = 500) -> dict:
+        """
+        Move files out of the flat upload directory into the sharded layout.
+        
+        Photos rows are walked in id order; each batch moves its files and
+        then rewrites their file_url in one commit, so the app (which reads
+        both layouts) keeps serving every photo while this runs. Safe to
+        re-run after an interruption.
+        
+        Returns:
+            Dictionary with files moved, rows rewritten, files missing and
+            unreferenced files moved
+        """
+        stats = {'files_moved': 0, 'rows_rewritten': 0, 'files_missing': 0, 'unreferenced_moved': 0}
+        flat_prefix = '/uploads/photos/'
+        last_id = 0
+        
+        while True:
+            cursor = connection.execute(
+                "SELECT id, file_url FROM Photos WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            
+            updates = []
+            for row in rows:
+                file_url = row['file_url'] or ''
+                if not file_url.startswith(flat_prefix) or '/' in file_url[len(flat_prefix):]:
+                    continue
+                filename = file_url[len(flat_prefix):]
+                flat_path = self.upload_dir / filename
+                if flat_path.exists():
+                    os.replace(flat_path, self.new_photo_path(filename))
+                    stats['files_moved'] += 1
+                elif not (self.upload_dir / self.shard_dir(filename) / filename).exists():
+                    stats['files_missing'] += 1
+                updates.append((self.photo_url(filename), row['id']))
+            
+            if updates:
+                connection.executemany("UPDATE Photos SET file_url = ? WHERE id = ?", updates)
+                connection.commit()
+                stats['rows_rewritten'] += len(updates)
+                print(f"📦 Sharded photos up to id {last_id} ({stats['rows_rewritten']} rows rewritten)")
+        
+        # Files no row points at (or written by an old process mid-migration)
+        with os.scandir(self.upload_dir) as entries:
+            leftovers = [
+                entry.name for entry in entries
+                if entry.is_file() and not entry.name.startswith('.')
+            ]
+        for filename in leftovers:
+            os.replace(self.upload_dir / filename, self.new_photo_path(filename))
+            stats['unreferenced_moved'] += 1
+        
+        return stats
+
  
     def find_or_create_location(
         self, 
@@ -233,6 +692,7 @@ class PhotoService:
             """
             SELECT * FROM Locations 
             WHERE trip_id = ? 
+            AND deleted_at IS NULL
             AND x BETWEEN ? AND ? 
             AND y BETWEEN ? AND ?
             LIMIT 1
@@ -250,8 +710,9 @@ class PhotoService:
         # No existing location found - create a new one with geocoded info
         print(f"🆕 Creating new location for ({latitude:.6f}, {longitude:.6f})")
         
-        # Get location info from Nominatim
-        location_info = geocoding_service.reverse_geocode(latitude, longitude)
+        # Cached Nominatim answer or nearest gazetteer city; uploads never
+        # wait on the API (this may run inside the upload's transaction)
+        location_info = geocoding_service.reverse_geocode(latitude, longitude, offline=True)
         
         if location_info:
             name = location_info['name']
@@ -263,18 +724,30 @@ class PhotoService:
             geocoded_address = address or "Address not available"
             print(f"⚠️ Geocoding failed, using fallback name")
         
-        # Create new location
+        # Create new location, unless the trip has been deleted
         created_at = int(datetime.now().timestamp())
         cursor = connection.execute(
             """
             INSERT INTO Locations 
             (trip_id, x, y, name, address, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM Trips WHERE id = ? AND deleted_at IS NULL)
             """,
-            (trip_id, longitude, latitude, name, geocoded_address, created_at)
+            (trip_id, longitude, latitude, name, geocoded_address, created_at, trip_id)
         )
+        if cursor.rowcount == 0:
+            raise ValueError(f"Trip {trip_id} not found")
         
         location_id = cursor.lastrowid
+        self.fill_trip_place(connection, trip_id, latitude, longitude)
+        
+        if not location_info or location_info.get('source') == 'gazetteer':
+            # Look for a street-level name once the upload has committed
+            job_queue.enqueue(
+                'location_geocode',
+                {'location_id': location_id, 'name': name},
+                connection=connection
+            )
         
         # Fetch the created location
         cursor = connection.execute(
@@ -287,6 +760,697 @@ class PhotoService:
         return new_location
 
 
+    def fill_trip_place(
+        self,
+        connection,
+        trip_id: int,
+        latitude: float,
+        longitude: float,
+        wait: bool = False
+    ) -> Optional[dict]:
+        """
+        Fill a trip's blank city and country from a coordinate, without committing.
+        
+        Resolved offline (see app.boundaries), so it is safe inside an
+        upload's transaction. Values the user typed are never replaced.
+        While the place indexes are still loading at startup, a
+        trip_place job fills the trip once they are instead.
+        
+        Args:
+            wait: Resolve now even if that means waiting for the indexes
+        
+        Returns:
+            The resolved place, or None if nothing was resolved (yet)
+        """
+        if not wait and not place_resolver.ready:
+            job_queue.enqueue(
+                'trip_place',
+                {'trip_id': trip_id, 'latitude': latitude, 'longitude': longitude},
+                connection=connection
+            )
+            return None
+        
+        place = place_resolver.resolve(latitude, longitude)
+        if not place['country'] and not place['city']:
+            return None
+        
+        connection.execute(
+            """
+            UPDATE Trips SET
+                city = COALESCE(NULLIF(city, ''), ?),
+                country = COALESCE(NULLIF(country, ''), ?)
+            WHERE id = ? AND deleted_at IS NULL
+            """,
+            (place['city'], place['country'], trip_id)
+        )
+        return place
+
+    def fill_trip_place_job(self, connection, payload: dict) -> dict:
+        """Job handler for trip_place: fill_trip_place once the place indexes have loaded."""
+        place = self.fill_trip_place(
+            connection, payload['trip_id'], payload['latitude'], payload['longitude'], wait=True
+        )
+        connection.commit()
+        return {'place': place}
+
+    def countries_visited(self, connection, user_id: int, batch_size: int = 5000) -> dict:
+        """
+        Count a user's photos and trips per country and state.
+        
+        Photos without their own GPS use their location's coordinates.
+        Rows are streamed and resolved a batch at a time, so memory stays
+        flat however many photos the user has.
+        
+        Returns:
+            Dictionary with countries (most photographed first, each with
+            its states), photos_located and photos_unresolved
+        """
+        cursor = connection.execute(
+            """
+            SELECT COALESCE(p.y, l.y) AS latitude, COALESCE(p.x, l.x) AS longitude, l.trip_id
+            FROM Photos p
+            JOIN Locations l ON l.id = p.location_id
+            WHERE p.user_id = ? AND p.deleted_at IS NULL
+            AND COALESCE(p.y, l.y) IS NOT NULL AND COALESCE(p.x, l.x) IS NOT NULL
+            AND NOT (COALESCE(p.y, l.y) = 0 AND COALESCE(p.x, l.x) = 0)
+            ORDER BY l.trip_id, l.id
+            """,
+            (user_id,)
+        )
+        
+        countries = {}
+        located = unresolved = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            located += len(rows)
+            places = place_resolver.resolve_many([(row['latitude'], row['longitude']) for row in rows])
+            for row, place in zip(rows, places):
+                if not place['country_code']:
+                    unresolved += 1
+                    continue
+                country = countries.setdefault(place['country_code'], {
+                    'country': place['country'],
+                    'country_code': place['country_code'],
+                    'photos': 0,
+                    'trips': set(),
+                    'states': {},
+                })
+                country['photos'] += 1
+                country['trips'].add(row['trip_id'])
+                if place['state']:
+                    country['states'][place['state']] = country['states'].get(place['state'], 0) + 1
+        
+        visited = []
+        for country in sorted(countries.values(), key=lambda c: c['photos'], reverse=True):
+            country['trips'] = len(country['trips'])
+            country['states'] = [
+                {'state': state, 'photos': photos}
+                for state, photos in sorted(country['states'].items(), key=lambda item: item[1], reverse=True)
+            ]
+            visited.append(country)
+        
+        return {'countries': visited, 'photos_located': located, 'photos_unresolved': unresolved}
+
+    def refine_location(self, connection, payload: dict) -> dict:
+        """
+        Job handler that replaces an offline location name with Nominatim's.
+        
+        Payload:
+            location_id: Location created during an upload
+            name: The name it was given then
+        
+        Locations renamed or deleted in the meantime are left alone.
+        """
+        cursor = connection.execute(
+            "SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL",
+            (payload['location_id'],)
+        )
+        location = cursor.fetchone()
+        if location is None or location['name'] != payload['name']:
+            return {'updated': False}
+        
+        location_info = geocoding_service.reverse_geocode(location['y'], location['x'])
+        if not location_info or location_info.get('source') == 'gazetteer':
+            return {'updated': False}
+        
+        cursor = connection.execute(
+            "UPDATE Locations SET name = ?, address = ? WHERE id = ? AND name = ?",
+            (location_info['name'], location_info['address'], location['id'], payload['name'])
+        )
+        connection.commit()
+        print(f"📍 Renamed location {location['id']}: {payload['name']} -> {location_info['name']}")
+        return {'updated': cursor.rowcount > 0, 'name': location_info['name']}
+
+    def upload_photos_to_location(
+        self,
+        connection,
+        staged_files: List[Tuple[str, str]],
+        location: dict,
+        user_id: int,
+        known_metadata: Optional[dict] = None,
+        duplicates: str = 'flag',
+        skipped: Optional[list] = None
+    ) -> List[dict]:
+        """
+        Create photos at a location from files already staged on disk.
+        
+        Photos without GPS data use the location's coordinates. The caller
+        owns the staged files and the transaction (nothing is committed here).
+        
+        Args:
+            connection: SQLite database connection
+            staged_files: List of (path_on_disk, original_filename) tuples
+            location: Location row the photos belong to
+            user_id: ID of the user uploading the photos
+            known_metadata: Optional path -> summarize_exif() result for files
+                whose EXIF was already parsed
+            duplicates: Near-duplicate handling, see insert_location_photos()
+            skipped: Optional list that receives photos skipped as near-duplicates
+            
+        Returns:
+            List of created photo dictionaries
+        """
+        staged = []
+        
+        # Read EXIF for each staged file (unless it was parsed earlier)
+        for temp_path, original_filename in staged_files:
+            try:
+                print(f"\nProcessing: {original_filename}")
+                metadata = (known_metadata or {}).get(temp_path)
+                if metadata is None:
+                    metadata = self.summarize_exif(self.extract_exif_data(temp_path))
+                if not metadata.get('content_hash'):
+                    metadata = {**metadata, **self.describe_content(temp_path)}
+                staged.append((temp_path, original_filename, metadata))
+            except Exception as e:
+                print(f"❌ Error processing {original_filename}: {e}")
+                continue
+        
+        # Save photo files permanently; HEIC conversion fans out across worker processes
+        saved_files = self.save_photo_files([(item[0], item[1]) for item in staged])
+        
+        return self.insert_location_photos(
+            connection,
+            [(original_filename, metadata, saved)
+             for (_, original_filename, metadata), saved in zip(staged, saved_files)],
+            location,
+            user_id,
+            duplicates=duplicates,
+            skipped=skipped
+        )
+
+    def insert_location_photos(
+        self,
+        connection,
+        saved_photos: List[Tuple[str, dict, object]],
+        location: dict,
+        user_id: int,
+        duplicates: str = 'flag',
+        skipped: Optional[list] = None
+    ) -> List[dict]:
+        """
+        Insert Photos rows for files already saved to the upload directory.
+        
+        Each saved file is decoded once (across the image worker pool) for
+        its dimensions, inline placeholder and dHash; the dHash is checked
+        against the user's existing photos and the rest of the batch.
+        
+        Args:
+            connection: SQLite database connection
+            saved_photos: List of (original_filename, metadata, saved) tuples where
+                metadata comes from summarize_exif() (plus content_hash,
+                file_size and the IMAGE_FIELDS when known) and saved is
+                (file_url, saved_extension) or the Exception from saving
+            location: Location row the photos belong to
+            user_id: ID of the user uploading the photos
+            duplicates: 'flag' stores near-duplicates and lists the matching
+                photo ids under near_duplicates; 'skip' drops them instead
+            skipped: Optional list that receives {'original_filename',
+                'near_duplicate_of'} for each photo dropped in 'skip' mode
+            
+        Returns:
+            List of created photo dictionaries
+        """
+        return self.insert_saved_photos(
+            connection,
+            [(original_filename, metadata, saved, location)
+             for original_filename, metadata, saved in saved_photos],
+            user_id,
+            duplicates=duplicates,
+            skipped=skipped
+        )
+
+    def insert_saved_photos(
+        self,
+        connection,
+        saved_photos: List[Tuple[str, dict, object, dict]],
+        user_id: int,
+        duplicates: str = 'flag',
+        skipped: Optional[list] = None
+    ) -> List[dict]:
+        """
+        Like insert_location_photos(), but each photo names its own location.
+        
+        The whole batch is written with a constant number of statements:
+        multi-row INSERT ... RETURNING for Photos, one executemany for
+        PhotoMetadata and one UPDATE for cover photos.
+        
+        Args:
+            saved_photos: List of (original_filename, metadata, saved, location)
+        """
+        # Copy the new files to durable storage before any row points at them
+        saved_photos = list(saved_photos)
+        stored = [
+            index for index, (_, _, saved, _) in enumerate(saved_photos)
+            if not isinstance(saved, Exception)
+        ]
+        results = self.storage.put_files([
+            (self.storage_key(saved_photos[index][2][0]), str(self.get_photo_path(saved_photos[index][2][0])))
+            for index in stored
+        ])
+        for index, result in zip(stored, results):
+            if isinstance(result, Exception):
+                original_filename, metadata, _, location = saved_photos[index]
+                saved_photos[index] = (original_filename, metadata, result, location)
+        
+        # Analyze every saved file up front so the decodes run in parallel
+        pending = [
+            index for index, (_, metadata, saved, _) in enumerate(saved_photos)
+            if not isinstance(saved, Exception) and not metadata.get('dhash')
+        ]
+        analyses = dict(zip(pending, image_worker_pool.map(
+            analyze_photo,
+            [(str(self.get_photo_path(saved_photos[index][2][0])), 8, PLACEHOLDER_SIZE, PLACEHOLDER_QUALITY)
+             for index in pending],
+            decode_size=max(8 * 8, PLACEHOLDER_SIZE * 4)
+        )))
+        
+        rows = []
+        # (stored near-duplicate ids, batch positions of near-duplicates, PhotoMetadata details) per row
+        extras = []
+        skipped_rows = []
+        # Rows of this batch aren't in the database (or the index) until the insert
+        batch_tree = BKTree()
+        
+        for index, (original_filename, metadata, saved, location) in enumerate(saved_photos):
+            try:
+                if isinstance(saved, Exception):
+                    raise saved
+                file_url, saved_ext = saved
+                
+                print(f"💾 Saved to: {file_url}")
+                
+                image = analyses.get(index) or {field: metadata.get(field) for field in IMAGE_FIELDS}
+                if isinstance(image, ImageTooLargeError):
+                    # No variant or preview of it could ever be decoded
+                    if all(row['file_url'] != file_url for row in rows):
+                        self.remove_unreferenced_files(connection, [file_url])
+                    raise image
+                if isinstance(image, Exception):
+                    print(f"⚠️ Could not analyze {original_filename}: {image}")
+                    image = {}
+                dhash = image.get('dhash')
+                
+                near_duplicates = []
+                batch_duplicates = []
+                if dhash:
+                    near_duplicates = [
+                        match['photo_id']
+                        for match in perceptual_index.find_similar(connection, user_id, dhash)
+                    ]
+                    batch_duplicates = [
+                        position for _, position
+                        in batch_tree.search(int(dhash, 16), perceptual_index.max_distance)
+                    ]
+                
+                if (near_duplicates or batch_duplicates) and duplicates == 'skip':
+                    print(f"⏭️  Skipping {original_filename}, near-duplicate of an existing photo")
+                    # Identical bytes saved in the same second share a file with a queued row
+                    if all(row['file_url'] != file_url for row in rows):
+                        self.remove_unreferenced_files(connection, [file_url])
+                    skipped_rows.append((original_filename, near_duplicates, batch_duplicates))
+                    continue
+                
+                # Use location coordinates if photo doesn't have GPS
+                if metadata.get('latitude') is None or metadata.get('longitude') is None:
+                    print(f"No GPS data in photo, using location coordinates")
+                    latitude = location['y']
+                    longitude = location['x']
+                else:
+                    latitude, longitude = metadata['latitude'], metadata['longitude']
+                    print(f"📍 GPS: {latitude:.6f}, {longitude:.6f}")
+                
+                taken_at = metadata.get('taken_at')
+                if not taken_at:
+                    taken_at = int(datetime.now().timestamp())
+                
+                if dhash:
+                    batch_tree.add(int(dhash, 16), len(rows))
+                rows.append({
+                    'location_id': location['id'],
+                    'user_id': user_id,
+                    'x': longitude,
+                    'y': latitude,
+                    'file_url': file_url,
+                    'original_filename': original_filename,
+                    'taken_at': taken_at,
+                    'is_cover_photo': False,
+                    'dhash': dhash,
+                    'content_hash': metadata.get('content_hash'),
+                    'file_size': metadata.get('file_size'),
+                    'width': image.get('width'),
+                    'height': image.get('height'),
+                    'placeholder': image.get('placeholder'),
+                })
+                
+                details = {field: metadata.get(field) for field in EXIF_METADATA_FIELDS}
+                details['orientation'] = self.photo_orientation(image.get('width'), image.get('height'))
+                details['format'] = self.photo_format(original_filename)
+                extras.append((near_duplicates, batch_duplicates, details))
+                
+            except Exception as e:
+                print(f"❌ Error processing {original_filename}: {e}")
+                continue
+        
+        created_photos = self.insert_photo_rows(connection, rows)
+        photo_ids = [photo['id'] for photo in created_photos]
+        
+        for photo, (near_duplicates, batch_duplicates, _) in zip(created_photos, extras):
+            matches = near_duplicates + [photo_ids[position] for position in batch_duplicates]
+            if matches:
+                photo['near_duplicates'] = matches
+            print(f"✅ Successfully uploaded {photo['original_filename']}")
+        
+        if skipped is not None:
+            for original_filename, near_duplicates, batch_duplicates in skipped_rows:
+                skipped.append({
+                    'original_filename': original_filename,
+                    'near_duplicate_of': near_duplicates + [photo_ids[position] for position in batch_duplicates],
+                })
+        
+        self.record_photo_metadata(
+            connection,
+            [(photo_id, details) for photo_id, (_, _, details) in zip(photo_ids, extras)]
+        )
+        self.assign_missing_covers(connection, created_photos)
+        self.queue_tile_pyramids(connection, created_photos, user_id)
+        
+        return created_photos
+
+    def queue_tile_pyramids(self, connection, photos: List[dict], user_id: Optional[int] = None) -> int:
+        """
+        Queue Deep Zoom tiling for photos large enough to need it.
+        
+        The jobs are inserted in the caller's transaction, so they only run
+        once the photos are committed.
+        
+        Returns:
+            Number of jobs queued (one per stored file)
+        """
+        file_urls = sorted({
+            photo['file_url'] for photo in photos
+            if deep_zoom.wants_pyramid(photo['width'], photo['height']) and not photo.get('deepzoom_levels')
+        })
+        for file_url in file_urls:
+            job_queue.enqueue('deepzoom_render', {'file_url': file_url}, user_id=user_id, connection=connection)
+        return len(file_urls)
+
+    def tile_photo(self, connection, payload: dict) -> dict:
+        """
+        Job handler that renders the Deep Zoom pyramid of a large stored photo.
+        
+        Payload:
+            file_url: Stored file to tile
+        
+        Every Photos row pointing at the file gets deepzoom_levels set; rows
+        linked to a file that is already tiled just pick up its pyramid.
+        """
+        file_url = payload['file_url']
+        pyramid = deep_zoom.describe(file_url)
+        if pyramid is None:
+            source_path = self.get_photo_path(file_url)
+            if not source_path.exists():
+                # Deleted before the job ran
+                return {'levels': None}
+            pyramid = deep_zoom.render(source_path, file_url)
+        
+        connection.execute(
+            "UPDATE Photos SET deepzoom_levels = ? WHERE file_url IN (?, ?)",
+            (pyramid['levels'], *self.photo_urls(file_url))
+        )
+        connection.commit()
+        return pyramid
+
+    def insert_photo_rows(self, connection, rows: List[dict]) -> List[dict]:
+        """
+        Insert Photos rows with multi-row INSERT ... RETURNING *, without committing.
+        
+        Args:
+            connection: SQLite database connection
+            rows: Dictionaries keyed by PHOTO_INSERT_COLUMNS
+            
+        Returns:
+            The created rows, in the same order as rows
+        """
+        created = []
+        row_placeholders = f"({', '.join('?' * len(PHOTO_INSERT_COLUMNS))})"
+        
+        for start in range(0, len(rows), PHOTO_INSERT_BATCH_SIZE):
+            chunk = rows[start:start + PHOTO_INSERT_BATCH_SIZE]
+            cursor = connection.execute(
+                f"""
+                INSERT INTO Photos ({', '.join(PHOTO_INSERT_COLUMNS)})
+                VALUES {', '.join([row_placeholders] * len(chunk))}
+                RETURNING *
+                """,
+                [row[column] for row in chunk for column in PHOTO_INSERT_COLUMNS]
+            )
+            # RETURNING order is unspecified, but ids are assigned in VALUES order
+            created.extend(sorted(cursor.fetchall(), key=lambda photo: photo['id']))
+        
+        return created
+
+    def assign_missing_covers(self, connection, photos: List[dict]) -> List[int]:
+        """
+        Make the first of these photos the cover of each location that has none.
+        
+        One statement handles every location touched by the batch.
+        
+        Returns:
+            IDs of the photos that became covers
+        """
+        if not photos:
+            return []
+        
+        cursor = connection.execute(
+            """
+            UPDATE Photos SET is_cover_photo = 1
+            WHERE id IN (
+                SELECT MIN(p.id) FROM Photos p
+                WHERE p.id IN (SELECT value FROM json_each(?))
+                AND NOT EXISTS (
+                    SELECT 1 FROM Photos c
+                    WHERE c.location_id = p.location_id AND c.is_cover_photo = 1
+                )
+                GROUP BY p.location_id
+            )
+            RETURNING id
+            """,
+            (json.dumps([photo['id'] for photo in photos]),)
+        )
+        cover_ids = [row['id'] for row in cursor.fetchall()]
+        
+        for photo in photos:
+            if photo['id'] in cover_ids:
+                photo['is_cover_photo'] = True
+                print(f"⭐ Set {photo['original_filename']} as cover photo")
+        
+        return cover_ids
+
+    def remove_unreferenced_files(self, connection, file_urls: List[str]) -> int:
+        """
+        Delete stored files that no Photos row points at any more.
+        
+        Several rows can share one file (identical bytes saved in the same
+        second, or rows linked to an existing blob), so a file is only
+        removed once its last row is gone.
+        
+        Returns:
+            Number of files deleted
+        """
+        removed = 0
+        for file_url in set(file_urls):
+            cursor = connection.execute(
+                "SELECT 1 FROM Photos WHERE file_url IN (?, ?) LIMIT 1",
+                self.photo_urls(file_url)
+            )
+            if cursor.fetchone():
+                continue
+            try:
+                os.remove(self.local_photo_path(file_url))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Failed to delete file {file_url}: {e}")
+            try:
+                self.storage.delete(self.storage_key(file_url))
+            except Exception as e:
+                print(f"Failed to delete {file_url} from storage: {e}")
+        return removed
+
+    def find_stored_blob(
+        self,
+        connection,
+        user_id: int,
+        content_hash: str,
+        file_size: int
+    ) -> Optional[dict]:
+        """
+        Find one of the user's photos whose original upload had these exact bytes.
+        
+        Only the user's own photos are searched: a hash and size alone don't
+        prove the caller has the bytes, so they can't unlock another user's
+        file. Rows whose file has gone missing are ignored.
+        
+        Returns:
+            The matching Photos row, or None
+        """
+        cursor = connection.execute(
+            """
+            SELECT * FROM Photos
+            WHERE user_id = ? AND content_hash = ? AND file_size = ?
+            ORDER BY id DESC
+            """,
+            (user_id, content_hash, file_size)
+        )
+        for row in cursor.fetchall():
+            if self.get_photo_path(row['file_url']).exists():
+                return row
+        return None
+
+    def describe_stored_blob(self, blob: dict) -> dict:
+        """
+        GPS and capture time for a stored photo, as summarize_exif() returns them.
+        
+        They are re-read from the stored file (its EXIF survives HEIC
+        conversion), falling back to the row's taken_at.
+        """
+        try:
+            metadata = self.summarize_exif(
+                self.extract_exif_data(str(self.get_photo_path(blob['file_url'])))
+            )
+        except Exception as e:
+            print(f"⚠️ Could not read EXIF from {blob['file_url']}: {e}")
+            metadata = {'latitude': None, 'longitude': None, 'taken_at': None}
+        
+        metadata['taken_at'] = metadata.get('taken_at') or blob['taken_at']
+        return metadata
+
+    def link_stored_photos(
+        self,
+        connection,
+        items: List[dict],
+        location: dict,
+        user_id: int,
+        duplicates: str = 'flag',
+        skipped: Optional[list] = None
+    ) -> Tuple[List[dict], List[dict]]:
+        """
+        Create photos that point at files already stored, without receiving any bytes.
+        
+        Only the user's own stored files are linked (see find_stored_blob()).
+        GPS and capture time come from describe_stored_blob(); dimensions,
+        placeholder and perceptual hash are copied.
+        
+        Args:
+            connection: SQLite database connection
+            items: List of {'content_hash', 'size', 'original_filename'} dicts
+            location: Location row the photos belong to
+            user_id: ID of the user adding the photos
+            duplicates: Near-duplicate handling, see insert_location_photos()
+            skipped: Optional list that receives photos skipped as near-duplicates
+            
+        Returns:
+            Tuple of (created photo dictionaries, items with no stored blob)
+        """
+        linked = []
+        missing = []
+        
+        for item in items:
+            blob = self.find_stored_blob(connection, user_id, item['content_hash'], item['size'])
+            if not blob:
+                missing.append(item)
+                continue
+            
+            metadata = self.describe_stored_blob(blob)
+            metadata['content_hash'] = blob['content_hash']
+            metadata['file_size'] = blob['file_size']
+            for field in IMAGE_FIELDS:
+                metadata[field] = blob[field]
+            
+            original_filename = item.get('original_filename') or blob['original_filename']
+            print(f"🔗 Linking {original_filename} to stored {blob['file_url']}")
+            linked.append((original_filename, metadata, (blob['file_url'], Path(blob['file_url']).suffix)))
+        
+        created_photos = self.insert_location_photos(
+            connection, linked, location, user_id, duplicates=duplicates, skipped=skipped
+        )
+        return created_photos, missing
+
+    def process_upload_job(self, connection, payload: dict) -> dict:
+        """
+        Job handler for async batch uploads queued by /api/photos/batch-upload.
+        
+        The job is marked succeeded in the same transaction as the photos,
+        so a crash before the staged batch directory is removed can't
+        insert them again on retry; the directory is removed afterwards.
+        """
+        cursor = connection.execute(
+            "SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL",
+            (payload['location_id'],)
+        )
+        location = cursor.fetchone()
+        if not location:
+            raise ValueError(f"Location {payload['location_id']} not found")
+        
+        staged_files = [
+            (item['path'], item['original_filename'])
+            for item in payload['files']
+            if os.path.exists(item['path'])
+        ]
+        known_metadata = {
+            item['path']: item['metadata']
+            for item in payload['files']
+            if item.get('metadata')
+        }
+        
+        skipped = []
+        created_photos = self.upload_photos_to_location(
+            connection, staged_files, location, payload['user_id'], known_metadata,
+            duplicates=payload.get('duplicates', 'flag'),
+            skipped=skipped
+        )
+        result = {
+            'photos_uploaded': len(created_photos),
+            'photos': created_photos,
+            'duplicates_skipped': skipped,
+        }
+        job_queue.finish_current(connection, result)
+        connection.commit()
+        
+        shutil.rmtree(payload['batch_dir'], ignore_errors=True)
+        print(f"✅ Async upload stored {len(created_photos)} photos at location {location['id']}")
+        
+        return result
+
+    def discard_upload_job(self, payload: dict):
+        """Remove the staged files of an async upload that failed its last attempt."""
+        shutil.rmtree(payload['batch_dir'], ignore_errors=True)
+        print(f"🗑️  Discarded staged upload {payload['batch_dir']}")
+
     def batch_upload_photos(
         self,
         connection,
@@ -306,18 +1470,17 @@ class PhotoService:
         Returns:
             List of created photo dictionaries
         """
-        created_photos = []
         skipped_photos = []
+        staged = []
         
+        # Phase 1: stage each file, read EXIF and resolve its location
         for file in files:
             try:
                 original_filename = file.filename
                 print(f"\nProcessing: {original_filename}")
                 
                 # Save file temporarily to extract EXIF
-                temp_path = f"/tmp/{original_filename}"
-                file.seek(0)
-                file.save(temp_path)
+                temp_path = self.stage_upload(file)
                 
                 # Extract EXIF data
                 exif_data = self.extract_exif_data(temp_path)
@@ -341,66 +1504,32 @@ class PhotoService:
                     connection, trip_id, latitude, longitude
                 )
                 
-                # Save photo file permanently (reopen from temp)
-                with open(temp_path, 'rb') as f:
-                    from werkzeug.datastructures import FileStorage
-                    file_storage = FileStorage(f, filename=original_filename)
-                    file_url, saved_ext = self.save_photo_file(file_storage, original_filename)
-                
-                print(f"💾 Saved to: {file_url}")
-                
-                # Extract timestamp
-                taken_at = self.extract_datetime(exif_data)
-                if not taken_at:
-                    taken_at = int(datetime.now().timestamp())
-                
-                # Create Photo record
-                cursor = connection.execute(
-                    """
-                    INSERT INTO Photos 
-                    (location_id, user_id, x, y, file_url, original_filename, taken_at, is_cover_photo)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (location['id'], user_id, longitude, latitude, file_url, 
-                     original_filename, taken_at, False)
-                )
-                
-                photo_id = cursor.lastrowid
-                
-                # Fetch created photo
-                cursor = connection.execute(
-                    "SELECT * FROM Photos WHERE id = ?",
-                    (photo_id,)
-                )
-                photo = cursor.fetchone()
-                created_photos.append(photo)
-                
-                # Clean up temp file
-                os.remove(temp_path)
-                
-                print(f"✅ Successfully uploaded {original_filename}")
+                staged.append((temp_path, original_filename, exif_data, location, latitude, longitude))
                 
             except Exception as e:
                 print(f"❌ Error processing {file.filename}: {e}")
                 skipped_photos.append(file.filename)
                 continue
         
-        # Set first photo as cover if no cover exists for that location
-        if created_photos:
-            location_id = created_photos[0]['location_id']
-            cursor = connection.execute(
-                "SELECT * FROM Photos WHERE location_id = ? AND is_cover_photo = 1",
-                (location_id,)
-            )
-            existing_cover = cursor.fetchone()
+        # Phase 2: save permanently, converting HEICs across worker processes
+        saved_files = self.save_photo_files([(item[0], item[1]) for item in staged])
+        
+        # Phase 3: create Photo records in upload order
+        batch = []
+        for (temp_path, original_filename, exif_data, location, latitude, longitude), saved in zip(staged, saved_files):
+            if isinstance(saved, Exception):
+                print(f"❌ Error processing {original_filename}: {saved}")
+                skipped_photos.append(original_filename)
+            else:
+                metadata = self.summarize_exif(exif_data)
+                metadata.update(self.describe_content(temp_path))
+                batch.append((original_filename, metadata, saved, location))
             
-            if not existing_cover:
-                connection.execute(
-                    "UPDATE Photos SET is_cover_photo = 1 WHERE id = ?",
-                    (created_photos[0]['id'],)
-                )
-                created_photos[0]['is_cover_photo'] = True
-                print(f"⭐ Set {created_photos[0]['original_filename']} as cover photo")
+            # Clean up temp file
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        created_photos = self.insert_saved_photos(connection, batch, user_id)
         
         connection.commit()
         
@@ -0,0 +1,146 @@
+"""Upload previews stored on disk by content hash so browsers can cache them."""
+import os
+import re
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+from app.config import (
+    PREVIEW_CACHE_FOLDER,
+    PREVIEW_CACHE_MAX_BYTES,
+    PREVIEW_MAX_SIZE,
+    PREVIEW_QUALITY,
+    PREVIEW_HEIF_THUMBNAIL_MIN,
+)
+from app.image_workers import image_worker_pool, render_jpeg_preview
+
+PREVIEW_KEY_RE = re.compile(r'^[0-9a-f]{64}_\d+$')
+
+
+class PreviewEngine:
+    """Render upload previews once per content hash and keep them under a size cap."""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int,
+        max_size: int = 800,
+        quality: int = 85,
+        min_thumbnail_size: int = 320
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.quality = quality
+        self.min_thumbnail_size = min_thumbnail_size
+
+        self._lock = threading.Lock()
+        self._total_bytes = sum(
+            path.stat().st_size for path in self.cache_dir.glob('*.jpg')
+        )
+
+    def preview_key(self, content_hash: str) -> str:
+        """Previews are immutable: the same bytes always give the same key."""
+        return f"{content_hash}_{self.max_size}"
+
+    def preview_url(self, key: str) -> str:
+        """URL the frontend loads a preview from."""
+        return f"/api/previews/{key}.jpg"
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """Resolve a preview key to its file, rejecting anything that isn't a key."""
+        if not PREVIEW_KEY_RE.match(key):
+            return None
+        path = self.cache_dir / f"{key}.jpg"
+        return path if path.exists() else None
+
+    def ensure_previews(self, items: List[Tuple[str, str]]) -> List:
+        """
+        Make sure a preview exists for each (source_path, content_hash).
+
+        Previews already on disk are reused; the rest are rendered across
+        the image worker pool.
+
+        Returns:
+            List aligned with items; each entry is a preview key or the
+            Exception raised while rendering it
+        """
+        results = [None] * len(items)
+        missing = {}
+
+        for index, (source_path, content_hash) in enumerate(items):
+            key = self.preview_key(content_hash)
+            results[index] = key
+            path = self.cache_dir / f"{key}.jpg"
+            if path.exists():
+                # Bump mtime so pruning drops the least recently used first
+                os.utime(path)
+                continue
+            # Identical files in one selection are rendered once
+            missing.setdefault(key, (index, source_path, []))[2].append(index)
+
+        rendered = image_worker_pool.map(
+            render_jpeg_preview,
+            [(source_path, self.max_size, self.quality, self.min_thumbnail_size)
+             for _, source_path, _ in missing.values()],
+            decode_size=self.max_size
+        )
+
+        for (key, (_, _, indexes)), preview in zip(missing.items(), rendered):
+            if isinstance(preview, Exception):
+                for index in indexes:
+                    results[index] = preview
+                continue
+            self._write(key, preview)
+
+        self._prune()
+        return results
+
+    def _write(self, key: str, data: bytes):
+        """Write a preview atomically so readers never see a partial file."""
+        path = self.cache_dir / f"{key}.jpg"
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total_bytes += len(data)
+
+    def _prune(self):
+        """Delete the oldest previews once the cache grows past its budget."""
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            files = []
+            for path in self.cache_dir.glob('*.jpg'):
+                stat = path.stat()
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+
+            total = sum(size for _, size, _ in files)
+            # Free a little extra so we don't prune on every upload
+            target = self.max_bytes * 0.9
+            removed = 0
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+
+            self._total_bytes = total
+            print(f"🧹 Pruned {removed} upload previews")
+
+
+# Singleton instance
+preview_engine = PreviewEngine(
+    PREVIEW_CACHE_FOLDER,
+    PREVIEW_CACHE_MAX_BYTES,
+    max_size=PREVIEW_MAX_SIZE,
+    quality=PREVIEW_QUALITY,
+    min_thumbnail_size=PREVIEW_HEIF_THUMBNAIL_MIN,
+)
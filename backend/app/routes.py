@@ -1,5 +1,7 @@
 """REST API for localization."""
+import os
 import re
+import shutil
 import flask
 import uuid
 import hashlib
@@ -7,6 +9,21 @@ from datetime import datetime
 from app import app
 from app.db import get_db
 from app.photo_service import photo_service
+from app.image_cache import image_cache
+from app.deepzoom import deep_zoom
+from app.image_workers import image_worker_pool, compute_dhash
+from app.decode_budget import decode_budget, DecodeBudgetTimeout, ImageTooLargeError
+from app.perceptual_index import perceptual_index
+from app.preview_engine import preview_engine
+from app.job_queue import job_queue
+from app.upload_sessions import upload_sessions, UploadError
+from app.streaming_upload import streaming_upload_reader
+from app.staged_uploads import staged_uploads
+from app.storage_reconciler import storage_reconciler
+from app.trip_purger import trip_purger
+from app.config import PREFLIGHT_MAX_FILES, BOUNDARY_RESOLVE_MAX_POINTS, UPLOAD_STAGED_MAX_CONTENT_LENGTH
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
 
 def get_current_user():
     """Get current user from session."""
@@ -33,152 +50,269 @@ def get_health():
 
 #     return flask.render_template("index.html", **context)
 
+def get_upload_location(connection, location_id) -> dict:
+    """
+    Load the location a batch upload targets.
+
+    Raises:
+        UploadError: if location_id is missing or unknown
+    """
+    if not location_id:
+        raise UploadError('location_id is required', 400)
+
+    cursor = connection.execute("SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL", (location_id,))
+    location = cursor.fetchone()
+
+    if not location:
+        raise UploadError('Location not found', 404)
+
+    # Get trip to verify user authorization
+    # cursor = connection.execute("SELECT * FROM Trips WHERE id = ?", (location['trip_id'],))
+    # trip = cursor.fetchone()
+    # if not trip or trip['user_id'] != user_id:
+    #     raise UploadError('Not authorized to upload to this location', 403)
+
+    return location
+
+
+def get_duplicates_mode(value):
+    """Validate the near-duplicate handling requested for an upload."""
+    mode = (value or 'flag').lower()
+    if mode not in ('flag', 'skip'):
+        raise UploadError("duplicates must be 'flag' or 'skip'", 400)
+    return mode
+
+
 @app.route('/api/photos/batch-upload', methods=['POST'])
 def batch_upload_photos():
-    """Batch upload photos to a specific location."""
+    """
+    Batch upload photos to a specific location.
+
+    The multipart body is consumed part by part: each file is hashed and
+    written as it arrives, and its EXIF read and final save (including
+    HEIC conversion) start while later files are still uploading. Send
+    location_id (and async) before the files.
+
+    A JSON body of {location_id, upload_tokens, async} instead commits
+    files already staged by /api/photos/extract-exif.
+
+    Near-duplicates of the user's existing photos (or of earlier files in
+    the batch) are flagged by default; pass duplicates=skip to drop them.
+    """
     current_user = get_current_user()
     if not current_user:
         return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
 
-    # Get form data
-    location_id = flask.request.form.get('location_id', type=int)
     user_id = current_user['id']  # <-- GET FROM SESSION
 
-    if not location_id:
-        return flask.jsonify({
-            'success': False,
-            'error': 'location_id is required'
-        }), 400
-    # Get uploaded files
-    files = flask.request.files.getlist('files')
+    if flask.request.is_json:
+        return commit_staged_uploads(user_id, flask.request.get_json() or {})
 
-    if not files:
+    boundary = flask.request.mimetype_params.get('boundary')
+    if flask.request.mimetype != 'multipart/form-data' or not boundary:
         return flask.jsonify({
             'success': False,
-            'error': 'No files uploaded'
+            'error': 'Expected a multipart/form-data upload'
         }), 400
 
     connection = get_db()
+    state = {'location': None, 'batch_dir': None}
+    # (original_filename, metadata, Future of (file_url, ext)) per received file
+    pending = []
+
+    def is_async(fields):
+        flag = fields.get('async') or flask.request.args.get('async', '')
+        return flag.lower() in ('1', 'true', 'yes')
+
+    def choose_directory(fields):
+        if state['location'] is None:
+            state['location'] = get_upload_location(connection, fields.get('location_id'))
+        if is_async(fields):
+            # Async mode: persist raw bytes, let a background job do the rest
+            if state['batch_dir'] is None:
+                state['batch_dir'] = photo_service.create_incoming_dir()
+            return state['batch_dir']
+        return photo_service.get_streaming_dir()
+
+    def on_file(fields, streamed):
+        if state['batch_dir'] is not None:
+            return
+        try:
+            print(f"\nProcessing: {streamed.filename}")
+            metadata = photo_service.summarize_exif(photo_service.extract_exif_data(streamed.path))
+            metadata['content_hash'] = streamed.sha256
+            metadata['file_size'] = streamed.size
+            saved = photo_service.start_photo_save(
+                streamed.path, streamed.filename, file_hash=streamed.md5, move=True
+            )
+            pending.append((streamed.filename, metadata, saved))
+        except Exception as e:
+            print(f"❌ Error processing {streamed.filename}: {e}")
+            if os.path.exists(streamed.path):
+                os.remove(streamed.path)
 
-    # Verify location exists
-    cursor = connection.execute("SELECT * FROM Locations WHERE id = ?", (location_id,))
-    location = cursor.fetchone()
+    try:
+        fields, files = streaming_upload_reader.read(
+            flask.request.stream, boundary, choose_directory, on_file
+        )
+        duplicates = get_duplicates_mode(
+            fields.get('duplicates') or flask.request.args.get('duplicates')
+        )
+    except Exception as e:
+        discard_streamed_upload(state['batch_dir'], pending)
+        if isinstance(e, UploadError):
+            return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+        raise
 
-    if not location:
+    if not files:
+        error = 'location_id is required' if not fields.get('location_id') else 'No files uploaded'
         return flask.jsonify({
             'success': False,
-            'error': 'Location not found'
-        }), 404
+            'error': error
+        }), 400
 
-    # Get trip to verify user authorization
-    cursor = connection.execute("SELECT * FROM Trips WHERE id = ?", (location['trip_id'],))
-    trip = cursor.fetchone()
+    location = state['location']
+
+    if state['batch_dir'] is not None:
+        job_id = job_queue.enqueue(
+            'photo_upload',
+            {
+                'location_id': location['id'],
+                'user_id': user_id,
+                'batch_dir': state['batch_dir'],
+                'duplicates': duplicates,
+                'files': [
+                    {'path': streamed.path, 'original_filename': streamed.filename}
+                    for streamed in files
+                ],
+            },
+            user_id=user_id
+        )
 
-    # if not trip or trip['user_id'] != user_id:
-    #     return flask.jsonify({
-    #         'success': False,
-    #         'error': 'Not authorized to upload to this location'
-    #     }), 403
+        return flask.jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}',
+            'message': f'Queued {len(files)} photos for processing'
+        }), 202
 
     try:
-        created_photos = []
-
-        for file in files:
-            try:
-                original_filename = file.filename
-                print(f"\nProcessing: {original_filename}")
-
-                # Save file temporarily to extract EXIF
-                temp_path = f"/tmp/{original_filename}"
-                file.save(temp_path)
-
-                # Extract EXIF data
-                exif_data = photo_service.extract_exif_data(temp_path)
-
-                # Get GPS coordinates
-                gps_coords = None
-                if 'GPSInfo' in exif_data:
-                    gps_coords = photo_service.convert_gps_to_decimal(exif_data['GPSInfo'])
-
-                # Use location coordinates if photo doesn't have GPS
-                if not gps_coords:
-                    print(f"No GPS data in photo, using location coordinates")
-                    latitude = location['y']
-                    longitude = location['x']
-                else:
-                    latitude, longitude = gps_coords
-                    print(f"📍 GPS: {latitude:.6f}, {longitude:.6f}")
-
-                # Save photo file permanently (reopen from temp)
-                with open(temp_path, 'rb') as f:
-                    from werkzeug.datastructures import FileStorage
-                    file_storage = FileStorage(f, filename=original_filename)
-                    file_url, saved_ext = photo_service.save_photo_file(file_storage, original_filename)
-
-                print(f"💾 Saved to: {file_url}")
-
-                # Extract timestamp
-                taken_at = photo_service.extract_datetime(exif_data)
-                if not taken_at:
-                    taken_at = int(datetime.now().timestamp())
-
-                # Create Photo record
-                cursor = connection.execute(
-                    """
-                    INSERT INTO Photos
-                    (location_id, user_id, x, y, file_url, original_filename, taken_at, is_cover_photo)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (location_id, user_id, longitude, latitude, file_url,
-                     original_filename, taken_at, False)
-                )
+        saved_files = image_worker_pool.gather([saved for _, _, saved in pending])
+        skipped = []
+        created_photos = photo_service.insert_location_photos(
+            connection,
+            [(original_filename, metadata, saved)
+             for (original_filename, metadata, _), saved in zip(pending, saved_files)],
+            location,
+            user_id,
+            duplicates=duplicates,
+            skipped=skipped
+        )
 
-                photo_id = cursor.lastrowid
+        connection.commit()
 
-                # Fetch created photo
-                cursor = connection.execute(
-                    "SELECT * FROM Photos WHERE id = ?",
-                    (photo_id,)
-                )
-                photo = cursor.fetchone()
-                created_photos.append(photo)
+        print(f"\n{'='*60}")
+        print(f"✅ Successfully uploaded: {len(created_photos)} photos to location {location['id']}")
+        print(f"{'='*60}\n")
 
-                # Clean up temp file
-                import os
-                os.remove(temp_path)
+        return flask.jsonify({
+            'success': True,
+            'photos_uploaded': len(created_photos),
+            'photos': created_photos,
+            'duplicates_skipped': skipped,
+            'message': f'Successfully uploaded {len(created_photos)} photos'
+        })
 
-                print(f"✅ Successfully uploaded {original_filename}")
+    except Exception as e:
+        print(f"Error during upload: {e}")
+        import traceback
+        traceback.print_exc()
+        return flask.jsonify({
+            'success': False,
+            'error': f'Error uploading photos: {str(e)}'
+        }), 500
 
-            except Exception as e:
-                print(f"❌ Error processing {file.filename}: {e}")
-                continue
 
-        # Set first photo as cover if no cover exists for that location
-        if created_photos:
-            cursor = connection.execute(
-                "SELECT * FROM Photos WHERE location_id = ? AND is_cover_photo = 1",
-                (location_id,)
-            )
-            existing_cover = cursor.fetchone()
+def commit_staged_uploads(user_id, data):
+    """
+    Create photos from files staged by extract-exif, referenced by upload_tokens.
 
-            if not existing_cover:
-                connection.execute(
-                    "UPDATE Photos SET is_cover_photo = 1 WHERE id = ?",
-                    (created_photos[0]['id'],)
-                )
-                created_photos[0]['is_cover_photo'] = True
-                print(f"⭐ Set {created_photos[0]['original_filename']} as cover photo")
+    Their EXIF was parsed at staging time and is reused as-is.
+    """
+    tokens = data.get('upload_tokens') or []
+    connection = get_db()
+
+    try:
+        location = get_upload_location(connection, data.get('location_id'))
+        duplicates = get_duplicates_mode(data.get('duplicates'))
+        if not tokens:
+            raise UploadError('No upload_tokens provided', 400)
+        staged = staged_uploads.claim(connection, tokens, user_id)
+    except UploadError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    if data.get('async'):
+        # Move the staged files into a durable batch for the background job
+        batch_dir = photo_service.create_incoming_dir()
+        files = []
+        try:
+            for row in staged:
+                path = os.path.join(batch_dir, os.path.basename(row['path']))
+                shutil.move(row['path'], path)
+                files.append({
+                    'path': path,
+                    'original_filename': row['filename'],
+                    'metadata': row['metadata'],
+                })
+        except OSError as e:
+            # Put moved files back so every token can be retried
+            for row, item in zip(staged, files):
+                shutil.move(item['path'], row['path'])
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            staged_uploads.release(connection, staged)
+            return flask.jsonify({'success': False, 'error': f'Error staging photos: {e}'}), 500
+
+        job_id = job_queue.enqueue(
+            'photo_upload',
+            {
+                'location_id': location['id'],
+                'user_id': user_id,
+                'batch_dir': batch_dir,
+                'duplicates': duplicates,
+                'files': files,
+            },
+            user_id=user_id
+        )
 
+        return flask.jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}',
+            'message': f'Queued {len(files)} photos for processing'
+        }), 202
+
+    try:
+        skipped = []
+        created_photos = photo_service.upload_photos_to_location(
+            connection,
+            [(row['path'], row['filename']) for row in staged],
+            location,
+            user_id,
+            known_metadata={row['path']: row['metadata'] for row in staged},
+            duplicates=duplicates,
+            skipped=skipped
+        )
         connection.commit()
 
-        print(f"\n{'='*60}")
-        print(f"✅ Successfully uploaded: {len(created_photos)} photos to location {location_id}")
-        print(f"{'='*60}\n")
+        for row in staged:
+            if os.path.exists(row['path']):
+                os.remove(row['path'])
 
         return flask.jsonify({
             'success': True,
             'photos_uploaded': len(created_photos),
             'photos': created_photos,
+            'duplicates_skipped': skipped,
             'message': f'Successfully uploaded {len(created_photos)} photos'
         })
 
@@ -186,17 +320,160 @@ def batch_upload_photos():
         print(f"Error during upload: {e}")
         import traceback
         traceback.print_exc()
+        staged_uploads.release(connection, staged)
         return flask.jsonify({
             'success': False,
             'error': f'Error uploading photos: {str(e)}'
         }), 500
 
+
+def discard_streamed_upload(batch_dir, pending):
+    """Remove whatever an aborted streaming upload already stored."""
+    if batch_dir is not None:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+    for saved in image_worker_pool.gather([saved for _, _, saved in pending]):
+        if isinstance(saved, Exception):
+            continue
+        photo_path = photo_service.get_photo_path(saved[0])
+        if photo_path.exists():
+            os.remove(photo_path)
+
+
+@app.route('/api/photos/preflight', methods=['POST'])
+def preflight_photos():
+    """
+    Report which files the server already stores, before any bytes are sent.
+
+    Body: {files: [{content_hash, size}]} where content_hash is the SHA-256
+    of the original file. Each result's stored is 'user' when it matches
+    one of your photos, else null. Stored files can be added with
+    /api/photos/link instead of being uploaded, and come with the same
+    photo description extract-exif returns, so their bytes needn't be sent
+    there either.
+    """
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    data = flask.request.get_json(silent=True) or {}
+    try:
+        files = parse_content_refs(data.get('files'))
+    except UploadError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    connection = get_db()
+    results = []
+    stored = []
+    for item in files:
+        blob = photo_service.find_stored_blob(
+            connection, current_user['id'], item['content_hash'], item['size']
+        )
+        results.append({
+            'content_hash': item['content_hash'],
+            'size': item['size'],
+            'stored': 'user' if blob else None,
+        })
+        if blob:
+            metadata = photo_service.describe_stored_blob(blob)
+            has_gps = metadata['latitude'] is not None
+            results[-1]['photo'] = {
+                'filename': item['original_filename'] or blob['original_filename'],
+                'has_gps': has_gps,
+                'coordinates': {
+                    'latitude': metadata['latitude'],
+                    'longitude': metadata['longitude'],
+                } if has_gps else None,
+                'taken_at': metadata['taken_at'],
+                'preview_url': None,
+            }
+            stored.append((results[-1]['photo'], blob))
+
+    preview_keys = preview_engine.ensure_previews(
+        [(str(photo_service.get_photo_path(blob['file_url'])), blob['content_hash']) for _, blob in stored]
+    )
+    for (photo, blob), preview_key in zip(stored, preview_keys):
+        if isinstance(preview_key, Exception):
+            print(f"Error generating preview for {blob['file_url']}: {preview_key}")
+        else:
+            photo['preview_url'] = preview_engine.preview_url(preview_key)
+
+    return flask.jsonify({'success': True, 'results': results})
+
+
+@app.route('/api/photos/link', methods=['POST'])
+def link_stored_photos():
+    """
+    Add photos to a location from files the server already has (see preflight).
+
+    Body: {location_id, files: [{content_hash, size, original_filename}],
+    duplicates}. Files that turn out not to be stored are returned under
+    missing and should be uploaded normally.
+    """
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    user_id = current_user['id']
+    data = flask.request.get_json(silent=True) or {}
+    connection = get_db()
+
+    try:
+        location = get_upload_location(connection, data.get('location_id'))
+        duplicates = get_duplicates_mode(data.get('duplicates'))
+        files = parse_content_refs(data.get('files'))
+    except UploadError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    skipped = []
+    created_photos, missing = photo_service.link_stored_photos(
+        connection, files, location, user_id, duplicates=duplicates, skipped=skipped
+    )
+    connection.commit()
+
+    print(f"✅ Linked {len(created_photos)} stored photos to location {location['id']}")
+
+    return flask.jsonify({
+        'success': True,
+        'photos_uploaded': len(created_photos),
+        'photos': created_photos,
+        'missing': missing,
+        'duplicates_skipped': skipped,
+        'message': f'Added {len(created_photos)} photos without uploading'
+    })
+
+
+def parse_content_refs(files):
+    """Validate a preflight/link file list of {content_hash, size, original_filename}."""
+    if not isinstance(files, list) or not files:
+        raise UploadError('files must be a non-empty list', 400)
+    if len(files) > PREFLIGHT_MAX_FILES:
+        raise UploadError(f'At most {PREFLIGHT_MAX_FILES} files per request', 413)
+
+    refs = []
+    for item in files:
+        if not isinstance(item, dict):
+            raise UploadError('Each file must be an object', 400)
+        content_hash = str(item.get('content_hash') or '').lower()
+        size = item.get('size')
+        if not SHA256_RE.match(content_hash):
+            raise UploadError('content_hash must be a hex SHA-256 digest', 400)
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            raise UploadError('size must be a non-negative integer', 400)
+        refs.append({
+            'content_hash': content_hash,
+            'size': size,
+            'original_filename': os.path.basename(str(item.get('original_filename') or '')) or None,
+        })
+    return refs
+
+
 @app.route('/api/photos/location/<int:location_id>', methods=['GET'])
 def get_photos_by_location(location_id):
     """Get all photos for a location."""
     connection = get_db()
     cursor = connection.execute(
-        "SELECT * FROM Photos WHERE location_id = ?",
+        "SELECT * FROM Photos WHERE location_id = ? AND deleted_at IS NULL",
         (location_id,)
     )
     photos = cursor.fetchall()
@@ -213,7 +490,7 @@ def set_cover_photo(photo_id):
         return flask.jsonify({'success': False, 'error': 'user_id required'}), 400
 
     connection = get_db()
-    cursor = connection.execute("SELECT * FROM Photos WHERE id = ?", (photo_id,))
+    cursor = connection.execute("SELECT * FROM Photos WHERE id = ? AND deleted_at IS NULL", (photo_id,))
     photo = cursor.fetchone()
 
     if not photo:
@@ -240,20 +517,33 @@ def set_cover_photo(photo_id):
 
 @app.route('/api/photos', methods=['GET'])
 def get_all_photos():
-    """Get all photos for the logged-in user with location info, including shared trips."""
+    """
+    Get all photos for the logged-in user with location info, including shared trips.
+
+    Optional filters, answered from PhotoMetadata without touching the files:
+    camera (make or model), lens, orientation (landscape/portrait/square),
+    format (jpeg, heic, ...), taken_after and taken_before (unix seconds or
+    YYYY-MM-DD, inclusive).
+    """
     current_user = get_current_user()
     if not current_user:
         return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
 
     user_id = current_user['id']
 
+    try:
+        metadata_join, filter_sql, filter_params = build_photo_filters(flask.request.args)
+    except ValueError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), 400
+
     connection = get_db()
 
     # Photos from trips I own
     cursor = connection.execute(
-        """
+        f"""
         SELECT
             p.*,
+            {PHOTO_METADATA_COLUMNS},
             l.name AS location_name,
             l.trip_id,
             t.user_id AS trip_owner_id,
@@ -261,20 +551,22 @@ def get_all_photos():
             u.name AS owner_name,
             'owner' AS access_type
         FROM Photos p
+        {metadata_join} PhotoMetadata m ON m.photo_id = p.id
         JOIN Locations l ON p.location_id = l.id
         JOIN Trips t ON l.trip_id = t.id
         JOIN Users u ON t.user_id = u.id
-        WHERE t.user_id = ?
+        WHERE t.user_id = ? AND t.deleted_at IS NULL{filter_sql}
         """,
-        (user_id,),
+        (user_id, *filter_params),
     )
     owned_photos = cursor.fetchall()
 
     # Photos from trips that were shared with me
     cursor = connection.execute(
-        """
+        f"""
         SELECT
             p.*,
+            {PHOTO_METADATA_COLUMNS},
             l.name AS location_name,
             l.trip_id,
             t.user_id AS trip_owner_id,
@@ -285,10 +577,11 @@ def get_all_photos():
         JOIN Trips t ON st.trip_id = t.id
         JOIN Locations l ON l.trip_id = t.id
         JOIN Photos p ON p.location_id = l.id
+        {metadata_join} PhotoMetadata m ON m.photo_id = p.id
         JOIN Users u ON t.user_id = u.id
-        WHERE st.shared_with_user_id = ?
+        WHERE st.shared_with_user_id = ? AND t.deleted_at IS NULL{filter_sql}
         """,
-        (user_id,),
+        (user_id, *filter_params),
     )
     shared_photos = cursor.fetchall()
 
@@ -299,6 +592,80 @@ def get_all_photos():
     return flask.jsonify({'success': True, 'photos': all_photos})
 
 
+PHOTO_METADATA_COLUMNS = ', '.join(
+    f"m.{column}" for column in (
+        'camera_make', 'camera_model', 'lens_model', 'focal_length', 'f_number',
+        'exposure_time', 'iso', 'altitude', 'orientation', 'format',
+    )
+)
+
+
+def build_photo_filters(args):
+    """
+    Turn /api/photos query parameters into extra WHERE clauses.
+
+    Returns:
+        Tuple of (join to PhotoMetadata, SQL starting with ' AND ' or empty,
+        parameters). Metadata filters use an inner join so SQLite can start
+        from the PhotoMetadata indexes.
+
+    Raises:
+        ValueError: if a parameter is malformed
+    """
+    def parse_time(name, end_of_day=False):
+        value = args.get(name)
+        if not value:
+            return None
+        if value.isdigit():
+            return int(value)
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"{name} must be unix seconds or YYYY-MM-DD")
+        # A date bound covers that whole day
+        return int(day.timestamp()) + (86400 - 1 if end_of_day else 0)
+
+    clauses = []
+    params = []
+    metadata_join = 'LEFT JOIN'
+
+    camera = args.get('camera')
+    if camera:
+        clauses.append("(m.camera_make = ? OR m.camera_model = ?)")
+        params += [camera, camera]
+
+    if args.get('lens'):
+        clauses.append("m.lens_model = ?")
+        params.append(args['lens'])
+
+    orientation = args.get('orientation')
+    if orientation:
+        if orientation not in ('landscape', 'portrait', 'square'):
+            raise ValueError("orientation must be landscape, portrait or square")
+        clauses.append("m.orientation = ?")
+        params.append(orientation)
+
+    if args.get('format'):
+        clauses.append("m.format = ?")
+        params.append(args['format'].lower())
+
+    if clauses:
+        metadata_join = 'JOIN'
+
+    taken_after = parse_time('taken_after')
+    if taken_after is not None:
+        clauses.append("p.taken_at >= ?")
+        params.append(taken_after)
+
+    taken_before = parse_time('taken_before', end_of_day=True)
+    if taken_before is not None:
+        clauses.append("p.taken_at <= ?")
+        params.append(taken_before)
+
+    sql = ''.join(f" AND {clause}" for clause in clauses)
+    return metadata_join, sql, params
+
+
 @app.route('/api/photos/<int:photo_id>', methods=['DELETE'])
 def delete_photo(photo_id):
     """Delete a photo."""
@@ -310,7 +677,7 @@ def delete_photo(photo_id):
     connection = get_db()
 
     # Get photo
-    cursor = connection.execute("SELECT * FROM Photos WHERE id = ?", (photo_id,))
+    cursor = connection.execute("SELECT * FROM Photos WHERE id = ? AND deleted_at IS NULL", (photo_id,))
     photo = cursor.fetchone()
 
     if not photo:
@@ -320,102 +687,633 @@ def delete_photo(photo_id):
     if photo['user_id'] != user_id:
         return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
 
-    # Delete file from storage
-    import os
-    file_path = f".{photo['file_url']}"  # Convert URL to file path
-    if os.path.exists(file_path):
-        os.remove(file_path)
-
     # Delete from database
+    connection.execute("DELETE FROM PhotoMetadata WHERE photo_id = ?", (photo_id,))
     connection.execute("DELETE FROM Photos WHERE id = ?", (photo_id,))
     connection.commit()
 
+    # The file is quarantined in the background unless another photo links to it
+    job_queue.enqueue('photo_files_reclaim', {'file_urls': [photo['file_url']]})
+
     return flask.jsonify({'success': True, 'message': 'Photo deleted'})
 
 
+@app.route('/api/photos/<int:photo_id>/similar', methods=['GET'])
+def get_similar_photos(photo_id):
+    """List the user's photos that look like this one (dHash within max_distance bits)."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    connection = get_db()
+    cursor = connection.execute("SELECT * FROM Photos WHERE id = ? AND deleted_at IS NULL", (photo_id,))
+    photo = cursor.fetchone()
+
+    if not photo:
+        return flask.jsonify({'success': False, 'error': 'Photo not found'}), 404
+
+    if photo['user_id'] != current_user['id']:
+        return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
+
+    max_distance = flask.request.args.get('max_distance', type=int)
+    if max_distance is not None and not 0 <= max_distance <= 64:
+        return flask.jsonify({'success': False, 'error': 'max_distance must be between 0 and 64'}), 400
+
+    dhash = photo['dhash']
+    if not dhash:
+        # Photos uploaded before hashing was added get one on first lookup
+        photo_path = photo_service.get_photo_path(photo['file_url'])
+        if not photo_path.exists():
+            return flask.jsonify({'success': False, 'error': 'Photo file not found'}), 404
+        dhash = image_worker_pool.run(compute_dhash, str(photo_path), decode_size=8 * 8)
+        connection.execute("UPDATE Photos SET dhash = ? WHERE id = ?", (dhash, photo_id))
+        connection.commit()
+
+    matches = perceptual_index.find_similar(
+        connection, current_user['id'], dhash, exclude_id=photo_id, max_distance=max_distance
+    )
+
+    similar = []
+    for match in matches:
+        cursor = connection.execute("SELECT * FROM Photos WHERE id = ?", (match['photo_id'],))
+        similar_photo = cursor.fetchone()
+        if similar_photo:
+            similar_photo['distance'] = match['distance']
+            similar.append(similar_photo)
+
+    return flask.jsonify({'success': True, 'photo_id': photo_id, 'similar': similar})
+
+
 @app.route('/api/photos/extract-exif', methods=['POST'])
 def extract_exif():
     """
     Extract EXIF data from photos without uploading them yet.
     This is called from the frontend FileSelectStep to get GPS coordinates.
+
+    Files are streamed to disk as they arrive and each stays staged for a
+    while under an upload_token, so the later batch-upload can commit it
+    without sending the bytes again.
     """
-    files = flask.request.files.getlist('files')
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
 
-    if not files:
-        return flask.jsonify({'success': False, 'error': 'No files provided'}), 400
+    # A handful of full-size HEICs is past MAX_CONTENT_LENGTH, but parts are
+    # streamed straight to disk, so this route only caps the total
+    flask.request.max_content_length = UPLOAD_STAGED_MAX_CONTENT_LENGTH
+
+    boundary = flask.request.mimetype_params.get('boundary')
+    if flask.request.mimetype != 'multipart/form-data' or not boundary:
+        return flask.jsonify({
+            'success': False,
+            'error': 'Expected a multipart/form-data upload'
+        }), 400
+
+    connection = get_db()
+    staged_uploads.cleanup_expired(connection)
 
     results = []
+    staged = []
+    # Staged files not yet registered under a token; removed if anything fails
+    unregistered = []
 
-    from PIL import Image
-    try:
-        # Enable HEIC/HEIF support if available
-        from pillow_heif import register_heif_opener
-        register_heif_opener()
-    except ImportError:
-        # HEIC preview will simply not be available if pillow-heif is missing
-        pass
-
-    import io
-    import base64
-    import os
-
-    for file in files:
-        try:
-            # Save temporarily so PhotoService can work with a file path
-            temp_path = f"/tmp/{file.filename}"
-            file.save(temp_path)
+    def choose_directory(fields):
+        # Stage each file where batch-upload can pick it up by token
+        return str(staged_uploads.storage_dir)
 
+    def on_file(fields, streamed):
+        # Runs while later files are still arriving
+        unregistered.append(streamed.path)
+        try:
             # Extract EXIF (including GPS) from the original file
-            exif_data = photo_service.extract_exif_data(temp_path)
-
-            # Get GPS coordinates
-            gps_coords = None
-            if 'GPSInfo' in exif_data:
-                gps_coords = photo_service.convert_gps_to_decimal(exif_data['GPSInfo'])
-
-            # Get timestamp
-            taken_at = photo_service.extract_datetime(exif_data)
-
-            # Generate a lightweight JPEG preview for the frontend
-            preview_data_url = None
-            try:
-                img = Image.open(temp_path)
-                img.thumbnail((800, 800))
-                buf = io.BytesIO()
-                img.save(buf, format='JPEG', quality=85)
-                buf.seek(0)
-                b64 = base64.b64encode(buf.read()).decode('ascii')
-                preview_data_url = f"data:image/jpeg;base64,{b64}"
-            except Exception as preview_err:
-                print(f"Error generating preview for {file.filename}: {preview_err}")
-                preview_data_url = None
+            exif_data = photo_service.extract_exif_data(streamed.path)
+            metadata = photo_service.summarize_exif(exif_data)
+            metadata['content_hash'] = streamed.sha256
+            metadata['file_size'] = streamed.size
+            has_gps = metadata['latitude'] is not None
 
             results.append({
-                'filename': file.filename,
-                'has_gps': gps_coords is not None,
+                'filename': streamed.filename,
+                'has_gps': has_gps,
                 'coordinates': {
-                    'latitude': gps_coords[0] if gps_coords else None,
-                    'longitude': gps_coords[1] if gps_coords else None,
-                } if gps_coords else None,
-                'taken_at': taken_at,
-                'preview_data_url': preview_data_url,
+                    'latitude': metadata['latitude'],
+                    'longitude': metadata['longitude'],
+                } if has_gps else None,
+                'taken_at': metadata['taken_at'],
+                'preview_url': None,
             })
-
-            # Clean up
-            os.remove(temp_path)
+            staged.append((results[-1], streamed.path, metadata))
 
         except Exception as e:
-            print(f"Error extracting EXIF from {file.filename}: {e}")
+            print(f"Error extracting EXIF from {streamed.filename}: {e}")
+            unregistered.remove(streamed.path)
+            os.remove(streamed.path)
             results.append({
-                'filename': file.filename,
+                'filename': streamed.filename,
                 'has_gps': False,
                 'error': str(e),
-                'preview_data_url': None,
+                'preview_url': None,
             })
 
+    try:
+        streaming_upload_reader.read(flask.request.stream, boundary, choose_directory, on_file)
+        if not results:
+            return flask.jsonify({'success': False, 'error': 'No files provided'}), 400
+
+        # Lightweight JPEG previews, cached by content hash so re-selected photos are free
+        preview_keys = preview_engine.ensure_previews(
+            [(temp_path, metadata['content_hash']) for _, temp_path, metadata in staged]
+        )
+
+        for (result, temp_path, metadata), preview_key in zip(staged, preview_keys):
+            if isinstance(preview_key, Exception):
+                print(f"Error generating preview for {result['filename']}: {preview_key}")
+            else:
+                result['preview_url'] = preview_engine.preview_url(preview_key)
+
+            staged_upload = staged_uploads.add(
+                connection, temp_path, result['filename'], metadata, user_id=current_user['id']
+            )
+            unregistered.remove(temp_path)
+            result['upload_token'] = staged_upload['token']
+            result['upload_token_expires_at'] = staged_upload['expires_at']
+
+    except Exception as e:
+        for temp_path in unregistered:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if isinstance(e, UploadError):
+            return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+        raise
+
     return flask.jsonify({'success': True, 'photos': results})
 
 
+# ============================================================================
+# IMAGE ENDPOINTS
+# ============================================================================
+
+@app.route('/api/previews/<key>.jpg', methods=['GET'])
+def get_upload_preview(key):
+    """Serve an upload preview; keys are content hashes, so they never change."""
+    preview_path = preview_engine.get_path(key)
+    if not preview_path:
+        return flask.jsonify({'success': False, 'error': 'Preview not found'}), 404
+
+    response = flask.send_file(
+        preview_path,
+        mimetype='image/jpeg',
+        max_age=app.config['IMAGE_CACHE_MAX_AGE'],
+        conditional=True,
+        etag=key,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/api/images/<int:photo_id>', methods=['GET'])
+def get_image_variant(photo_id):
+    """
+    Serve a resized variant of a photo, rendering and caching it on first request.
+
+    Query params:
+    - w, h: target width/height in pixels (either or both)
+    - fit: contain (default), cover or fill
+    - fmt: jpeg, png, webp or avif (negotiated from Accept when omitted)
+    """
+    try:
+        width, height, fit, fmt = image_cache.parse_variant_args(flask.request.args)
+    except ValueError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), 400
+
+    negotiated = fmt is None
+
+    connection = get_db()
+    cursor = connection.execute("SELECT file_url FROM Photos WHERE id = ? AND deleted_at IS NULL", (photo_id,))
+    photo = cursor.fetchone()
+
+    if not photo:
+        return flask.jsonify({'success': False, 'error': 'Photo not found'}), 404
+
+    source_path = photo_service.get_photo_path(photo['file_url'])
+    if not source_path.exists():
+        return flask.jsonify({'success': False, 'error': 'Photo file not found'}), 404
+
+    if negotiated:
+        fmt = image_cache.negotiate_format(flask.request.accept_mimetypes, source_path)
+
+    try:
+        variant_path, mimetype = image_cache.get_variant(source_path, width, height, fit, fmt)
+    except DecodeBudgetTimeout as e:
+        response = flask.jsonify({'success': False, 'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except ImageTooLargeError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), 422
+    except Exception as e:
+        print(f"Error rendering image variant for photo {photo_id}: {e}")
+        return flask.jsonify({'success': False, 'error': 'Could not render image'}), 500
+
+    response = flask.send_file(
+        variant_path,
+        mimetype=mimetype,
+        max_age=app.config['IMAGE_CACHE_MAX_AGE'],
+    )
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+
+@app.route('/api/images/<int:photo_id>/deepzoom.dzi', methods=['GET'])
+def get_deepzoom_descriptor(photo_id):
+    """Serve the Deep Zoom descriptor of a large photo; tiles are under deepzoom_files/."""
+    connection = get_db()
+    cursor = connection.execute("SELECT file_url FROM Photos WHERE id = ? AND deleted_at IS NULL", (photo_id,))
+    photo = cursor.fetchone()
+
+    descriptor_path = deep_zoom.descriptor_path(photo['file_url']) if photo else None
+    if not descriptor_path:
+        return flask.jsonify({'success': False, 'error': 'No tile pyramid for this photo'}), 404
+
+    return flask.send_file(
+        descriptor_path,
+        mimetype='application/xml',
+        max_age=app.config['IMAGE_CACHE_MAX_AGE'],
+    )
+
+
+@app.route('/api/images/<int:photo_id>/deepzoom_files/<int:level>/<int:col>_<int:row>.jpg', methods=['GET'])
+def get_deepzoom_tile(photo_id, level, col, row):
+    """Serve one Deep Zoom tile; a stored file's tiles never change, so they cache for a year."""
+    connection = get_db()
+    cursor = connection.execute("SELECT file_url FROM Photos WHERE id = ? AND deleted_at IS NULL", (photo_id,))
+    photo = cursor.fetchone()
+
+    tile_path = deep_zoom.tile_path(photo['file_url'], level, col, row) if photo else None
+    if not tile_path:
+        return flask.jsonify({'success': False, 'error': 'Tile not found'}), 404
+
+    response = flask.send_file(
+        tile_path,
+        mimetype='image/jpeg',
+        max_age=app.config['DEEPZOOM_TILE_MAX_AGE'],
+        conditional=True,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/uploads/photos/<path:filename>', methods=['GET'])
+def serve_photo(filename):
+    """
+    Serve an uploaded photo, transcoded to WebP/AVIF when the client accepts it.
+
+    HEIC originals are transcoded on first view (to JPEG if the client
+    accepts nothing better) and the result is kept in the image cache.
+    With object storage, requests the original answers are redirected to
+    a presigned bucket URL; transcoded variants are always served here.
+    """
+    needs_transcode = image_cache.needs_transcode(filename)
+    source_path = photo_service.get_photo_path(filename)
+    if not source_path.is_file():
+        return flask.abort(404)
+
+    response = None
+    fmt = image_cache.negotiate_format(flask.request.accept_mimetypes, source_path)
+    if needs_transcode:
+        fmt = fmt or image_cache.default_format(source_path)
+    if fmt:
+        try:
+            # Concurrent first views of the same photo wait for one render
+            variant_path, mimetype = image_cache.get_variant(source_path, fmt=fmt)
+            # Only worth sending if the transcode actually saved bytes
+            if needs_transcode or variant_path.stat().st_size < source_path.stat().st_size:
+                response = flask.send_file(
+                    variant_path,
+                    mimetype=mimetype,
+                    max_age=app.config['IMAGE_CACHE_MAX_AGE'],
+                )
+        except Exception as e:
+            print(f"Error transcoding {filename} to {fmt}: {e}")
+            # The raw HEIC is no use to a browser; have it try again shortly
+            if needs_transcode:
+                response = flask.jsonify({'success': False, 'error': 'Photo is still being converted'})
+                response.headers['Retry-After'] = '5'
+                return response, 503
+
+    if response is None:
+        # With object storage the client fetches the original straight from the bucket
+        download_url = photo_service.presigned_photo_url(filename)
+        if download_url:
+            response = flask.redirect(download_url)
+            # Browsers may reuse the redirect for half the URL's lifetime
+            response.cache_control.private = True
+            response.cache_control.max_age = app.config['S3_PRESIGN_EXPIRES'] // 2
+        else:
+            response = flask.send_file(source_path, max_age=app.config['IMAGE_CACHE_MAX_AGE'])
+
+    response.vary.add('Accept')
+    return response
+
+
+@app.route('/api/images/cache/stats', methods=['GET'])
+def get_image_cache_stats():
+    """Report image cache usage and per-variant access stats."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    return flask.jsonify({'success': True, 'cache': image_cache.stats()})
+
+
+@app.route('/api/images/decode/stats', methods=['GET'])
+def get_decode_stats():
+    """Report decode memory in use and how many decodes are queued for it."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    return flask.jsonify({'success': True, 'decode': decode_budget.stats()})
+
+
+@app.route('/api/storage/stats', methods=['GET'])
+def get_storage_stats():
+    """Report files waiting in quarantine and what the last reconciliation reclaimed."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    last_run = job_queue.latest_job('storage_reconcile')
+
+    return flask.jsonify({
+        'success': True,
+        'quarantine': storage_reconciler.quarantine_usage(),
+        'last_reconcile': {
+            'finished_at': last_run['updated_at'],
+            'result': last_run['result'],
+        } if last_run else None,
+    })
+
+
+# ============================================================================
+# JOB ENDPOINTS
+# ============================================================================
+
+job_queue.register('photo_upload', photo_service.process_upload_job, on_failure=photo_service.discard_upload_job)
+job_queue.register('photo_files_reclaim', storage_reconciler.quarantine_files)
+job_queue.register('storage_reconcile', storage_reconciler.reconcile)
+job_queue.register('trip_purge', trip_purger.purge_trip)
+job_queue.register('deepzoom_render', photo_service.tile_photo)
+job_queue.register('location_geocode', photo_service.refine_location)
+job_queue.register('trip_place', photo_service.fill_trip_place_job)
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get the status (and result once finished) of a background job."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    job = job_queue.get_job(job_id)
+
+    if not job or job['user_id'] != current_user['id']:
+        return flask.jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    return flask.jsonify({
+        'success': True,
+        'job': {
+            'id': job['id'],
+            'type': job['job_type'],
+            'status': job['status'],
+            'attempts': job['attempts'],
+            'max_attempts': job['max_attempts'],
+            'error': job['error'],
+            'result': job['result'],
+            'progress': job['progress'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+        }
+    })
+
+
+# ============================================================================
+# RESUMABLE UPLOAD ENDPOINTS
+# ============================================================================
+
+def upload_session_response(session: dict, status_code: int = 200):
+    """Describe an upload session, echoing its offset in tus-style headers."""
+    response = flask.jsonify({
+        'success': True,
+        'upload': {
+            'id': session['id'],
+            'filename': session['filename'],
+            'location_id': session['location_id'],
+            'offset': session['upload_offset'],
+            'length': session['upload_length'],
+            'status': session['status'],
+            'expires_at': session['expires_at'],
+            'url': f"/api/uploads/{session['id']}",
+        }
+    })
+    response.status_code = status_code
+    response.headers['Upload-Offset'] = str(session['upload_offset'])
+    response.headers['Upload-Length'] = str(session['upload_length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload for one file; chunks are then PATCHed to its URL."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    data = flask.request.get_json() or {}
+    filename = data.get('filename')
+    length = data.get('length', flask.request.headers.get('Upload-Length'))
+
+    if not filename or length is None:
+        return flask.jsonify({'success': False, 'error': 'filename and length are required'}), 400
+
+    try:
+        length = int(length)
+    except (TypeError, ValueError):
+        return flask.jsonify({'success': False, 'error': 'length must be an integer'}), 400
+
+    connection = get_db()
+    try:
+        session = upload_sessions.create(
+            connection, current_user['id'], filename, length,
+            location_id=data.get('location_id')
+        )
+    except UploadError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    response = upload_session_response(session, 201)
+    response.headers['Location'] = f"/api/uploads/{session['id']}"
+    return response
+
+
+@app.route('/api/uploads/<upload_id>', methods=['HEAD', 'GET'])
+def get_upload_session(upload_id):
+    """Report how many bytes of an upload the server has, so clients can resume."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    session = upload_sessions.get(get_db(), upload_id, current_user['id'])
+    if not session:
+        return flask.jsonify({'success': False, 'error': 'Upload not found'}), 404
+
+    return upload_session_response(session)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def append_upload_chunk(upload_id):
+    """Append a chunk at Upload-Offset, verified against Upload-Checksum."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    if flask.request.mimetype != 'application/offset+octet-stream':
+        return flask.jsonify({
+            'success': False,
+            'error': 'Content-Type must be application/offset+octet-stream'
+        }), 415
+
+    offset = flask.request.headers.get('Upload-Offset', type=int)
+    if offset is None or offset < 0:
+        return flask.jsonify({'success': False, 'error': 'Upload-Offset header is required'}), 400
+
+    connection = get_db()
+    session = upload_sessions.get(connection, upload_id, current_user['id'])
+    if not session:
+        return flask.jsonify({'success': False, 'error': 'Upload not found'}), 404
+
+    try:
+        upload_sessions.append_chunk(
+            connection, session, offset, flask.request.stream,
+            checksum=flask.request.headers.get('Upload-Checksum')
+        )
+    except UploadError as e:
+        # Tell the client where to resume from
+        session = upload_sessions.get(connection, upload_id, current_user['id']) or session
+        response = flask.jsonify({'success': False, 'error': str(e)})
+        response.status_code = e.status_code
+        response.headers['Upload-Offset'] = str(session['upload_offset'])
+        return response
+
+    session = upload_sessions.get(connection, upload_id, current_user['id'])
+    return upload_session_response(session)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload_session(upload_id):
+    """Abort an upload and discard the bytes received so far."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    connection = get_db()
+    session = upload_sessions.get(connection, upload_id, current_user['id'])
+    if not session:
+        return flask.jsonify({'success': False, 'error': 'Upload not found'}), 404
+
+    upload_sessions.delete(connection, session)
+    return flask.jsonify({'success': True, 'message': 'Upload cancelled'})
+
+
+@app.route('/api/uploads/finalize', methods=['POST'])
+def finalize_uploads():
+    """Hand completed uploads to photo processing as one batch for a location."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    data = flask.request.get_json() or {}
+    location_id = data.get('location_id')
+    upload_ids = data.get('upload_ids') or []
+    user_id = current_user['id']
+
+    if not location_id or not upload_ids:
+        return flask.jsonify({
+            'success': False,
+            'error': 'location_id and upload_ids are required'
+        }), 400
+
+    try:
+        duplicates = get_duplicates_mode(data.get('duplicates'))
+    except UploadError as e:
+        return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    connection = get_db()
+
+    cursor = connection.execute("SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL", (location_id,))
+    location = cursor.fetchone()
+
+    if not location:
+        return flask.jsonify({
+            'success': False,
+            'error': 'Location not found'
+        }), 404
+
+    # Large batches default to background processing
+    run_async = bool(data.get('async', True))
+
+    batch_dir = photo_service.create_incoming_dir()
+    try:
+        # Synchronous batches only close their sessions once the photos commit
+        staged_files = upload_sessions.take_completed(
+            connection, upload_ids, user_id, batch_dir, commit=run_async
+        )
+    except UploadError as e:
+        os.rmdir(batch_dir)
+        return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    payload = {
+        'location_id': location_id,
+        'user_id': user_id,
+        'batch_dir': batch_dir,
+        'duplicates': duplicates,
+        'files': staged_files,
+    }
+
+    if run_async:
+        job_id = job_queue.enqueue('photo_upload', payload, user_id=user_id)
+        return flask.jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}',
+            'message': f'Queued {len(staged_files)} photos for processing'
+        }), 202
+
+    try:
+        result = photo_service.process_upload_job(connection, payload)
+    except Exception as e:
+        print(f"Error finalizing uploads: {e}")
+        import traceback
+        traceback.print_exc()
+        # Bring the sessions back so the client can finalize them again
+        connection.rollback()
+        upload_sessions.restore(staged_files)
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        if isinstance(e, UploadError):
+            return flask.jsonify({'success': False, 'error': str(e)}), e.status_code
+        return flask.jsonify({
+            'success': False,
+            'error': f'Error uploading photos: {str(e)}'
+        }), 500
+
+    return flask.jsonify({
+        'success': True,
+        **result,
+        'message': f"Successfully uploaded {result['photos_uploaded']} photos"
+    })
+
 
 # ============================================================================
 # TRIP ENDPOINTS
@@ -432,7 +1330,7 @@ def get_all_trips():
 
     connection = get_db()
     cursor = connection.execute(
-        "SELECT * FROM Trips WHERE user_id = ? ORDER BY created_at DESC",
+        "SELECT * FROM Trips WHERE user_id = ? AND deleted_at IS NULL ORDER BY created_at DESC",
         (user_id,)
     )
     trips = cursor.fetchall()
@@ -506,13 +1404,13 @@ def get_trip_by_id(trip_id):
     """Get a single trip with its locations and photos."""
     connection = get_db()
 
-    cursor = connection.execute("SELECT * FROM Trips WHERE id = ?", (trip_id,))
+    cursor = connection.execute("SELECT * FROM Trips WHERE id = ? AND deleted_at IS NULL", (trip_id,))
     trip = cursor.fetchone()
 
     if not trip:
         return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
 
-    cursor = connection.execute("SELECT * FROM Locations WHERE trip_id = ?", (trip_id,))
+    cursor = connection.execute("SELECT * FROM Locations WHERE trip_id = ? AND deleted_at IS NULL", (trip_id,))
     locations_raw = cursor.fetchall()
 
     # Add tags to each location
@@ -599,7 +1497,7 @@ def create_trip():
     trip_id = cursor.lastrowid
     connection.commit()
 
-    cursor = connection.execute("SELECT * FROM Trips WHERE id = ?", (trip_id,))
+    cursor = connection.execute("SELECT * FROM Trips WHERE id = ? AND deleted_at IS NULL", (trip_id,))
     trip = cursor.fetchone()
 
     print(f"✅ Created trip: {title} (ID: {trip_id})")
@@ -616,7 +1514,7 @@ def get_location_by_id(location_id):
     """Get a single location with its photos and tags."""
     connection = get_db()
 
-    cursor = connection.execute("SELECT * FROM Locations WHERE id = ?", (location_id,))
+    cursor = connection.execute("SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL", (location_id,))
     location = cursor.fetchone()
 
     if not location:
@@ -669,6 +1567,10 @@ def create_location():
 
     connection = get_db()
 
+    cursor = connection.execute("SELECT id FROM Trips WHERE id = ? AND deleted_at IS NULL", (trip_id,))
+    if not cursor.fetchone():
+        return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
+
     # If we have valid GPS coordinates, check if a location already exists nearby
     if x != 0.0 and y != 0.0:
         # Search for locations within ~50 meters (roughly 0.0005 degrees)
@@ -678,6 +1580,7 @@ def create_location():
             """
             SELECT * FROM Locations
             WHERE trip_id = ?
+            AND deleted_at IS NULL
             AND x BETWEEN ? AND ?
             AND y BETWEEN ? AND ?
             LIMIT 1
@@ -722,19 +1625,25 @@ def create_location():
     if not name:
         return flask.jsonify({'success': False, 'error': 'name or coordinates required'}), 400
 
-    # Create new location
+    # Create new location, unless the trip was deleted while geocoding
     created_at = int(datetime.now().timestamp())
 
     cursor = connection.execute(
         """
         INSERT INTO Locations
         (trip_id, x, y, name, address, rating, cost_level, notes, time_needed, best_time_to_visit, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+        WHERE EXISTS (SELECT 1 FROM Trips WHERE id = ? AND deleted_at IS NULL)
         """,
-        (trip_id, x, y, name, address, rating, cost_level, notes, time_needed, best_time_to_visit, created_at)
+        (trip_id, x, y, name, address, rating, cost_level, notes, time_needed, best_time_to_visit, created_at,
+         trip_id)
     )
+    if cursor.rowcount == 0:
+        return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
 
     location_id = cursor.lastrowid
+    if x != 0.0 and y != 0.0:
+        photo_service.fill_trip_place(connection, trip_id, y, x)
     # Persist tags if provided
     if tags:
         if not isinstance(tags, list):
@@ -762,7 +1671,7 @@ def create_location():
 
     connection.commit()
 
-    cursor = connection.execute("SELECT * FROM Locations WHERE id = ?", (location_id,))
+    cursor = connection.execute("SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL", (location_id,))
     location = cursor.fetchone()
 
     print(f"✅ Created NEW location: {name} (ID: {location_id}) at {address}")
@@ -775,7 +1684,7 @@ def update_location(location_id):
 
     connection = get_db()
 
-    cursor = connection.execute("SELECT * FROM Locations WHERE id = ?", (location_id,))
+    cursor = connection.execute("SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL", (location_id,))
     location = cursor.fetchone()
 
     if not location:
@@ -831,7 +1740,7 @@ def update_location(location_id):
     connection.commit()
 
     # Fetch updated location with tags
-    cursor = connection.execute("SELECT * FROM Locations WHERE id = ?", (location_id,))
+    cursor = connection.execute("SELECT * FROM Locations WHERE id = ? AND deleted_at IS NULL", (location_id,))
     updated_location = dict(cursor.fetchone())
 
     # Get tags
@@ -851,7 +1760,12 @@ def update_location(location_id):
 
 @app.route('/api/geocode', methods=['POST'])
 def geocode_coordinates():
-    """Geocode coordinates to get location name and address."""
+    """
+    Geocode coordinates to get location name and address.
+
+    Send "level": "city" for the nearest city from the offline gazetteer,
+    which never calls Nominatim.
+    """
     data = flask.request.get_json()
 
     latitude = data.get('latitude')
@@ -861,9 +1775,13 @@ def geocode_coordinates():
         return flask.jsonify({'success': False, 'error': 'latitude and longitude required'}), 400
 
     from app.geocoding import geocoding_service
+    from app.gazetteer import gazetteer
 
     print(f"🌍 Geocoding: ({latitude:.6f}, {longitude:.6f})")
-    location_info = geocoding_service.reverse_geocode(latitude, longitude)
+    if data.get('level') == 'city':
+        location_info = gazetteer.reverse_geocode(latitude, longitude)
+    else:
+        location_info = geocoding_service.reverse_geocode(latitude, longitude)
 
     if location_info:
         print(f"✅ Found: {location_info['name']} at {location_info['address']}")
@@ -881,6 +1799,72 @@ def geocode_coordinates():
             'error': 'Could not geocode coordinates'
         }), 404
 
+
+@app.route('/api/places/resolve', methods=['POST'])
+def resolve_places():
+    """
+    Resolve country, state and city for a batch of points, offline.
+
+    Body: {"points": [[latitude, longitude], ...]}
+    """
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    data = flask.request.get_json() or {}
+    points = data.get('points')
+    if not isinstance(points, list) or not points:
+        return flask.jsonify({'success': False, 'error': 'points must be a non-empty list'}), 400
+    if len(points) > BOUNDARY_RESOLVE_MAX_POINTS:
+        return flask.jsonify({
+            'success': False,
+            'error': f'At most {BOUNDARY_RESOLVE_MAX_POINTS} points per request'
+        }), 400
+
+    try:
+        coordinates = [(float(latitude), float(longitude)) for latitude, longitude in points]
+    except (TypeError, ValueError):
+        return flask.jsonify({'success': False, 'error': 'Each point must be [latitude, longitude]'}), 400
+
+    from app.boundaries import place_resolver
+
+    return flask.jsonify({'success': True, 'places': place_resolver.resolve_many(coordinates)})
+
+
+@app.route('/api/places/countries', methods=['GET'])
+def get_countries_visited():
+    """Countries (and states) the current user has photos in, with photo and trip counts."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    visited = photo_service.countries_visited(get_db(), current_user['id'])
+    return flask.jsonify({'success': True, **visited})
+
+
+@app.route('/api/places/stats', methods=['GET'])
+def get_places_stats():
+    """Report what the offline boundary and gazetteer indexes have loaded."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    from app.boundaries import place_resolver
+
+    return flask.jsonify({'success': True, 'places': place_resolver.stats()})
+
+
+@app.route('/api/geocode/stats', methods=['GET'])
+def get_geocode_stats():
+    """Report reverse geocoding cache hits, misses and API errors."""
+    current_user = get_current_user()
+    if not current_user:
+        return flask.jsonify({'success': False, 'error': 'Not logged in'}), 401
+
+    from app.geocoding import geocoding_service
+
+    return flask.jsonify({'success': True, 'geocode': geocoding_service.stats()})
+
 # ============================================================================
 # AUTH ROUTES
 # ============================================================================
@@ -1286,7 +2270,7 @@ def share_trip(trip_id):
 
     # Verify trip ownership
     cursor = connection.execute(
-        "SELECT * FROM Trips WHERE id = ? AND user_id = ?",
+        "SELECT * FROM Trips WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
         (trip_id, current_user['id'])
     )
     trip = cursor.fetchone()
@@ -1335,7 +2319,7 @@ def get_trip_shares(trip_id):
 
     # Verify ownership
     cursor = connection.execute(
-        "SELECT * FROM Trips WHERE id = ? AND user_id = ?",
+        "SELECT * FROM Trips WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
         (trip_id, current_user['id'])
     )
     if not cursor.fetchone():
@@ -1370,7 +2354,7 @@ def get_shared_trips():
         FROM SharedTrips st
         JOIN Trips t ON st.trip_id = t.id
         JOIN Users u ON t.user_id = u.id
-        WHERE st.shared_with_user_id = ?
+        WHERE st.shared_with_user_id = ? AND t.deleted_at IS NULL
         ORDER BY st.created_at DESC
         """,
         (current_user['id'],)
@@ -1454,7 +2438,7 @@ def get_all_my_trips():
 
     # Get owned trips
     cursor = connection.execute(
-        "SELECT *, 'owner' as access_type, 'owner' as access_level FROM Trips WHERE user_id = ? ORDER BY created_at DESC",
+        "SELECT *, 'owner' as access_type, 'owner' as access_level FROM Trips WHERE user_id = ? AND deleted_at IS NULL ORDER BY created_at DESC",
         (current_user['id'],)
     )
     owned_trips = cursor.fetchall()
@@ -1466,7 +2450,7 @@ def get_all_my_trips():
         FROM SharedTrips st
         JOIN Trips t ON st.trip_id = t.id
         JOIN Users u ON t.user_id = u.id
-        WHERE st.shared_with_user_id = ?
+        WHERE st.shared_with_user_id = ? AND t.deleted_at IS NULL
         ORDER BY st.created_at DESC
         """,
         (current_user['id'],)
@@ -1552,7 +2536,7 @@ def delete_trip(trip_id):
 
     # Verify trip exists and user owns it
     cursor = connection.execute(
-        "SELECT * FROM Trips WHERE id = ? AND user_id = ?",
+        "SELECT * FROM Trips WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
         (trip_id, current_user['id'])
     )
     trip = cursor.fetchone()
@@ -1560,38 +2544,19 @@ def delete_trip(trip_id):
     if not trip:
         return flask.jsonify({'success': False, 'error': 'Trip not found or not authorized'}), 404
 
-    # Get all photo file URLs before deletion (to clean up files)
-    cursor = connection.execute(
-        """
-        SELECT p.file_url FROM Photos p
-        JOIN Locations l ON p.location_id = l.id
-        WHERE l.trip_id = ?
-        """,
-        (trip_id,)
-    )
-    photo_files = [row['file_url'] for row in cursor.fetchall()]
-
-    # Delete the trip (cascade will handle locations, photos, shared trips, etc.)
-    connection.execute("DELETE FROM Trips WHERE id = ?", (trip_id,))
+    # Hide the trip, its locations and photos at once; the rows and files are
+    # purged in the background so large trips don't hold up the request
+    photo_count = trip_purger.tombstone_trip(connection, trip_id)
     connection.commit()
 
-    # Clean up photo files from storage
-    import os
-    deleted_count = 0
-    for file_url in photo_files:
-        file_path = f".{file_url}"  # Convert URL to file path
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                deleted_count += 1
-            except Exception as e:
-                print(f"Failed to delete file {file_path}: {e}")
-
-    print(f"✅ Deleted trip '{trip['title']}' (ID: {trip_id})")
-    print(f"   Cleaned up {deleted_count} photo files")
+    job_id = job_queue.enqueue('trip_purge', {'trip_id': trip_id}, user_id=current_user['id'])
+
+    print(f"✅ Deleted trip '{trip['title']}' (ID: {trip_id}), purging {photo_count} photos in job {job_id}")
 
     return flask.jsonify({
         'success': True,
         'message': f"Trip '{trip['title']}' deleted successfully",
-        'photos_deleted': deleted_count
+        'photos_deleted': photo_count,
+        'job_id': job_id,
+        'status_url': f'/api/jobs/{job_id}',
     })
\ No newline at end of file
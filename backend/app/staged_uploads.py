@@ -0,0 +1,135 @@
+"""Files staged during EXIF preview, kept briefly so batch-upload can commit them by token."""
+import json
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import List
+from app.config import UPLOAD_STAGED_FOLDER, UPLOAD_STAGED_TTL
+from app.upload_sessions import UploadError
+
+
+class StagedUploadStore:
+    """Track staged files and their parsed metadata in the StagedUploads table."""
+
+    def __init__(self, storage_dir: str, ttl: int = 60 * 60):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def add(
+        self,
+        connection,
+        path: str,
+        filename: str,
+        metadata: dict,
+        user_id: int
+    ) -> dict:
+        """
+        Register a file already written to storage_dir and return its token.
+
+        Args:
+            connection: SQLite database connection
+            path: Staged file on disk
+            filename: Original filename
+            metadata: PhotoService.summarize_exif() result for the file
+            user_id: Uploader; only they can commit the token
+
+        Returns:
+            Dictionary with token and expires_at
+        """
+        token = secrets.token_urlsafe(16)
+        expires_at = int(time.time()) + self.ttl
+
+        connection.execute(
+            """
+            INSERT INTO StagedUploads (token, user_id, filename, path, metadata, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (token, user_id, filename, path, json.dumps(metadata), expires_at)
+        )
+        connection.commit()
+
+        return {'token': token, 'expires_at': expires_at}
+
+    def claim(self, connection, tokens: List[str], user_id: int) -> List[dict]:
+        """
+        Take the staged files for a batch of tokens, in token order, and commit.
+
+        Each row is deleted as it is read (DELETE ... RETURNING), so a
+        token can only be claimed once even by concurrent requests. If
+        creating the photos fails afterwards, hand the rows to release().
+
+        Raises:
+            UploadError: 410 if any token is unknown, expired, used, staged
+                by another user or its file is gone; nothing is claimed then
+        """
+        staged = []
+        now = int(time.time())
+        try:
+            for token in tokens:
+                cursor = connection.execute(
+                    """
+                    DELETE FROM StagedUploads
+                    WHERE token = ? AND user_id = ? AND expires_at > ?
+                    RETURNING *
+                    """,
+                    (token, user_id, now)
+                )
+                row = cursor.fetchone()
+                if not row or not os.path.exists(row['path']):
+                    raise UploadError(f"Upload token {token} has expired, please re-select the file", 410)
+
+                row['metadata'] = json.loads(row['metadata'])
+                staged.append(row)
+        except Exception:
+            connection.rollback()
+            raise
+
+        connection.commit()
+        return staged
+
+    def release(self, connection, rows: List[dict]):
+        """Put claimed rows whose files still exist back, so their tokens can be retried."""
+        connection.rollback()
+        connection.executemany(
+            """
+            INSERT OR IGNORE INTO StagedUploads (token, user_id, filename, path, metadata, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (row['token'], row['user_id'], row['filename'], row['path'],
+                 json.dumps(row['metadata']), row['expires_at'])
+                for row in rows if os.path.exists(row['path'])
+            ]
+        )
+        connection.commit()
+
+    def consume(self, connection, tokens: List[str]):
+        """Delete token rows without committing, so they go with the caller's transaction."""
+        connection.executemany(
+            "DELETE FROM StagedUploads WHERE token = ?",
+            [(token,) for token in tokens]
+        )
+
+    def cleanup_expired(self, connection) -> int:
+        """Remove expired tokens and their staged files."""
+        cursor = connection.execute(
+            "SELECT token, path FROM StagedUploads WHERE expires_at <= ?",
+            (int(time.time()),)
+        )
+        expired = cursor.fetchall()
+        for row in expired:
+            try:
+                os.remove(row['path'])
+            except FileNotFoundError:
+                pass
+        if expired:
+            self.consume(connection, [row['token'] for row in expired])
+            connection.commit()
+            print(f"🧹 Discarded {len(expired)} expired staged uploads")
+        return len(expired)
+
+
+# Singleton instance
+staged_uploads = StagedUploadStore(UPLOAD_STAGED_FOLDER, ttl=UPLOAD_STAGED_TTL)
@@ -0,0 +1,418 @@
+"""Durable photo storage: the local upload directory or an S3-compatible bucket."""
+import hashlib
+import hmac
+import os
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+import requests
+from app.config import (
+    UPLOAD_FOLDER,
+    PHOTO_STORAGE,
+    S3_ENDPOINT_URL,
+    S3_BUCKET,
+    S3_REGION,
+    S3_ACCESS_KEY_ID,
+    S3_SECRET_ACCESS_KEY,
+    S3_MULTIPART_THRESHOLD,
+    S3_MULTIPART_PART_SIZE,
+    S3_UPLOAD_CONCURRENCY,
+    FAKE_S3_FOLDER,
+)
+
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+
+
+class StorageError(Exception):
+    """Raised when the storage service rejects or fails a request."""
+
+
+def sign_v4(
+    secret_key: str,
+    region: str,
+    method: str,
+    path: str,
+    query: dict,
+    headers: dict,
+    payload_hash: str,
+    amz_date: str,
+    service: str = 's3'
+) -> str:
+    """
+    Compute an AWS Signature Version 4 signature.
+
+    Args:
+        secret_key: Secret access key
+        region: Region in the credential scope
+        method: HTTP method
+        path: Unencoded request path
+        query: Query parameters, excluding X-Amz-Signature
+        headers: Lowercase header names to values; every one is signed
+        payload_hash: Hex SHA-256 of the body, or UNSIGNED-PAYLOAD
+        amz_date: Request time as YYYYMMDDTHHMMSSZ
+
+    Returns:
+        Hex signature
+    """
+    canonical_query = '&'.join(
+        f"{quote(name, safe='-_.~')}={quote(str(value), safe='-_.~')}"
+        for name, value in sorted(query.items())
+    )
+    canonical_headers = ''.join(
+        f"{name}:{' '.join(str(value).split())}\n" for name, value in sorted(headers.items())
+    )
+    canonical_request = '\n'.join([
+        method,
+        quote(path, safe='/-_.~'),
+        canonical_query,
+        canonical_headers,
+        ';'.join(sorted(headers)),
+        payload_hash,
+    ])
+
+    date = amz_date[:8]
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256',
+        amz_date,
+        f"{date}/{region}/{service}/aws4_request",
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+    ])
+
+    key = f"AWS4{secret_key}".encode('utf-8')
+    for part in (date, region, service, 'aws4_request'):
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+    return hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def xml_text(content: bytes, tag: str) -> Optional[str]:
+    """Text of the first element named tag, with or without the S3 namespace."""
+    for element in ET.fromstring(content).iter():
+        if element.tag.split('}')[-1] == tag:
+            return element.text
+    return None
+
+
+class LocalStorage:
+    """Photos kept in the upload directory and served by the app itself."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def put_file(self, key: str, source_path: str):
+        """Store a file under key (a no-op for files already written there)."""
+        target = self.root / key
+        if Path(source_path).resolve() == target.resolve():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source_path, target)
+
+    def put_files(self, items: List[Tuple[str, str]]) -> List:
+        """Store several (key, source_path); failures are returned in place of None."""
+        results = []
+        for key, source_path in items:
+            try:
+                results.append(self.put_file(key, source_path))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def get_file(self, key: str, dest_path: str):
+        """Copy the stored file to dest_path. Raises FileNotFoundError if missing."""
+        source = self.root / key
+        if not source.is_file():
+            raise FileNotFoundError(key)
+        if source.resolve() != Path(dest_path).resolve():
+            shutil.copyfile(source, dest_path)
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def delete(self, key: str):
+        """Delete a stored file; missing files are ignored."""
+        try:
+            os.remove(self.root / key)
+        except FileNotFoundError:
+            pass
+
+    def presigned_url(self, key: str, expires: int = 3600) -> Optional[str]:
+        """Local files have no direct URL; the app serves them."""
+        return None
+
+
+class S3Storage:
+    """
+    Photos in an S3-compatible bucket, signed with SigV4 over plain HTTP requests.
+
+    Uses path-style addressing ({endpoint}/{bucket}/{key}) so it also works
+    with MinIO, Ceph, R2 and the in-process FakeS3Server.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = 'us-east-1',
+        multipart_threshold: int = 16 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 4,
+        timeout: float = 60
+    ):
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.host = urlsplit(self.endpoint_url).netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.multipart_threshold = multipart_threshold
+        # S3 rejects parts (other than the last) smaller than 5MB
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        """One connection pool per thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _object_path(self, key: str) -> str:
+        return f"/{self.bucket}/{key}"
+
+    def _request(
+        self,
+        method: str,
+        key: str,
+        query: Optional[dict] = None,
+        body: bytes = b'',
+        headers: Optional[dict] = None,
+        stream: bool = False
+    ) -> requests.Response:
+        """Send a header-signed request for an object."""
+        query = query or {}
+        path = self._object_path(key)
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        payload_hash = hashlib.sha256(body).hexdigest()
+
+        signed = {
+            'host': self.host,
+            'x-amz-content-sha256': payload_hash,
+            'x-amz-date': amz_date,
+        }
+        signed.update({name.lower(): value for name, value in (headers or {}).items()})
+        signature = sign_v4(
+            self.secret_key, self.region, method, path, query, signed, payload_hash, amz_date
+        )
+        date = amz_date[:8]
+        signed['authorization'] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{date}/{self.region}/s3/aws4_request, "
+            f"SignedHeaders={';'.join(sorted(signed))}, "
+            f"Signature={signature}"
+        )
+        del signed['host']
+
+        url = f"{self.endpoint_url}{quote(path, safe='/-_.~')}"
+        if query:
+            url += '?' + '&'.join(
+                f"{quote(name, safe='-_.~')}={quote(str(value), safe='-_.~')}"
+                for name, value in sorted(query.items())
+            )
+        return self._session().request(
+            method, url, data=body or None, headers=signed, stream=stream, timeout=self.timeout
+        )
+
+    def _check(self, response: requests.Response, action: str, key: str):
+        if response.status_code >= 300:
+            raise StorageError(
+                f"{action} {key} failed with HTTP {response.status_code}: {response.text[:200]}"
+            )
+
+    def put_file(self, key: str, source_path: str):
+        """Upload a file, switching to a multipart upload above the threshold."""
+        size = os.path.getsize(source_path)
+        if size > self.multipart_threshold:
+            self._put_multipart(key, source_path)
+            return
+
+        with open(source_path, 'rb') as f:
+            body = f.read()
+        response = self._request('PUT', key, body=body)
+        self._check(response, 'PUT', key)
+
+    def _put_multipart(self, key: str, source_path: str):
+        """Upload a large file in part_size pieces, aborting the upload on failure."""
+        response = self._request('POST', key, query={'uploads': ''})
+        self._check(response, 'Create multipart upload for', key)
+        upload_id = xml_text(response.content, 'UploadId')
+
+        try:
+            parts = []
+            with open(source_path, 'rb') as f:
+                part_number = 1
+                while True:
+                    chunk = f.read(self.part_size)
+                    if not chunk:
+                        break
+                    response = self._request(
+                        'PUT', key,
+                        query={'partNumber': part_number, 'uploadId': upload_id},
+                        body=chunk
+                    )
+                    self._check(response, f"Upload part {part_number} of", key)
+                    parts.append((part_number, response.headers['ETag']))
+                    part_number += 1
+
+            body = '<CompleteMultipartUpload>' + ''.join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for number, etag in parts
+            ) + '</CompleteMultipartUpload>'
+            response = self._request('POST', key, query={'uploadId': upload_id}, body=body.encode('utf-8'))
+            self._check(response, 'Complete multipart upload for', key)
+            # S3 can report a failed completion inside a 200 response
+            if b'<Error>' in response.content:
+                raise StorageError(f"Complete multipart upload for {key} failed: {response.text[:200]}")
+        except Exception:
+            try:
+                self._request('DELETE', key, query={'uploadId': upload_id})
+            except requests.RequestException:
+                pass
+            raise
+
+    def put_files(self, items: List[Tuple[str, str]]) -> List:
+        """Upload several (key, source_path) concurrently; failures are returned in place of None."""
+        def put(item):
+            try:
+                return self.put_file(*item)
+            except Exception as e:
+                return e
+
+        if len(items) <= 1:
+            return [put(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(put, items))
+
+    def get_file(self, key: str, dest_path: str):
+        """Download an object to dest_path. Raises FileNotFoundError if missing."""
+        response = self._request('GET', key, stream=True)
+        if response.status_code == 404:
+            raise FileNotFoundError(key)
+        self._check(response, 'GET', key)
+
+        dest = Path(dest_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            for chunk in response.iter_content(256 * 1024):
+                f.write(chunk)
+        os.replace(temp_path, dest)
+
+    def exists(self, key: str) -> bool:
+        response = self._request('HEAD', key)
+        if response.status_code == 404:
+            return False
+        self._check(response, 'HEAD', key)
+        return True
+
+    def delete(self, key: str):
+        """Delete an object; S3 treats missing keys as already deleted."""
+        response = self._request('DELETE', key)
+        if response.status_code != 404:
+            self._check(response, 'DELETE', key)
+
+    def presigned_url(self, key: str, expires: int = 3600) -> Optional[str]:
+        """URL a client can GET the object from directly until it expires."""
+        path = self._object_path(key)
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        query = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        signature = sign_v4(
+            self.secret_key, self.region, 'GET', path, query,
+            {'host': self.host}, UNSIGNED_PAYLOAD, amz_date
+        )
+        query_string = '&'.join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for name, value in sorted(query.items())
+        )
+        return (
+            f"{self.endpoint_url}{quote(path, safe='/-_.~')}"
+            f"?{query_string}&X-Amz-Signature={signature}"
+        )
+
+
+class FakeS3Storage(S3Storage):
+    """
+    S3Storage against an in-process FakeS3Server, started on first use so
+    importing the app doesn't open a listening socket.
+    """
+
+    def __init__(self, root: str, bucket: str, access_key: str, secret_key: str, **kwargs):
+        super().__init__('http://127.0.0.1', bucket, access_key, secret_key, **kwargs)
+        self.root = root
+        self._server = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._server is not None:
+                return
+            from app.fake_s3 import FakeS3Server
+            server = FakeS3Server(self.root, self.access_key, self.secret_key, region=self.region)
+            self.endpoint_url = server.start()
+            self.host = urlsplit(self.endpoint_url).netloc
+            self._server = server
+            print(f"🪣 Fake S3 storage listening at {self.endpoint_url}")
+
+    def _request(self, *args, **kwargs) -> requests.Response:
+        self._ensure_started()
+        return super()._request(*args, **kwargs)
+
+    def presigned_url(self, key: str, expires: int = 3600) -> Optional[str]:
+        self._ensure_started()
+        return super().presigned_url(key, expires)
+
+
+def create_storage(backend: str):
+    """Build the storage backend named by PHOTO_STORAGE."""
+    if backend == 'local':
+        return LocalStorage(UPLOAD_FOLDER)
+
+    options = {
+        'region': S3_REGION,
+        'multipart_threshold': S3_MULTIPART_THRESHOLD,
+        'part_size': S3_MULTIPART_PART_SIZE,
+        'max_concurrency': S3_UPLOAD_CONCURRENCY,
+    }
+    access_key, secret_key = S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY
+    if backend == 'fake-s3':
+        return FakeS3Storage(
+            str(FAKE_S3_FOLDER),
+            S3_BUCKET,
+            access_key or 'journitag',
+            secret_key or 'journitag-secret',
+            **options
+        )
+    if backend == 's3':
+        if not access_key or not secret_key:
+            raise ValueError("PHOTO_STORAGE=s3 requires S3_ACCESS_KEY_ID and S3_SECRET_ACCESS_KEY")
+        endpoint_url = S3_ENDPOINT_URL or f"https://s3.{S3_REGION}.amazonaws.com"
+    else:
+        raise ValueError(f"Unknown PHOTO_STORAGE backend: {backend}")
+
+    return S3Storage(endpoint_url, S3_BUCKET, access_key, secret_key, **options)
+
+
+# Singleton instance
+photo_storage = create_storage(PHOTO_STORAGE)
@@ -0,0 +1,332 @@
+"""Find stored photo files no Photos row references, quarantine them, then delete them."""
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from app.photo_service import photo_service
+from app.job_queue import job_queue
+from app.deepzoom import deep_zoom
+from app.config import (
+    RECLAIM_GRACE_SECONDS,
+    RECLAIM_MIN_AGE_SECONDS,
+    RECLAIM_INTERVAL_SECONDS,
+    RECLAIM_BATCH_SIZE,
+    RECLAIM_ENABLED,
+    RECLAIM_DRY_RUN,
+    RECLAIM_MAX_ORPHAN_FRACTION,
+)
+
+
+class StorageReconciler:
+    """
+    Reclaim disk from photo files that no longer belong to any photo.
+
+    Unreferenced files are first moved into a hidden .quarantine directory
+    (their mtime marks when), restored if a row points at them again, and
+    only deleted, together with their storage backend object, once they
+    have sat there for the grace period.
+
+    The periodic scan is off unless enabled, can run as a dry run, and
+    refuses to quarantine anything when Photos is empty or when most
+    files look orphaned, since both usually mean the wrong database.
+    """
+
+    def __init__(
+        self,
+        service,
+        grace_seconds: int = 7 * 24 * 60 * 60,
+        min_age_seconds: int = 60 * 60,
+        interval_seconds: int = 24 * 60 * 60,
+        batch_size: int = 500,
+        enabled: bool = False,
+        dry_run: bool = False,
+        max_orphan_fraction: float = 0.1
+    ):
+        self.service = service
+        self.grace_seconds = grace_seconds
+        # Files this new may belong to an upload whose row isn't inserted yet
+        self.min_age_seconds = min_age_seconds
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.enabled = enabled
+        self.dry_run = dry_run
+        self.max_orphan_fraction = max_orphan_fraction
+
+    @property
+    def quarantine_dir(self) -> Path:
+        return self.service.upload_dir.resolve() / '.quarantine'
+
+    def _walk(self, directory: Path) -> Iterator[os.DirEntry]:
+        """Yield stored files under directory, skipping hidden files and directories."""
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def _chunks(self, entries: Iterator[os.DirEntry]) -> Iterator[List[os.DirEntry]]:
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= self.batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def referenced_names(self, connection, filenames: List[str]) -> set:
+        """Which of these filenames some Photos row points at, in either layout."""
+        urls = []
+        for filename in filenames:
+            urls.extend(self.service.photo_urls(filename))
+        if not urls:
+            return set()
+
+        placeholders = ','.join('?' * len(urls))
+        cursor = connection.execute(
+            f"SELECT file_url FROM Photos WHERE file_url IN ({placeholders})",
+            urls
+        )
+        return {Path(row['file_url']).name for row in cursor.fetchall()}
+
+    def quarantine(self, path: Path) -> int:
+        """Move a working copy into quarantine. Returns its size in bytes."""
+        self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+        target = self.quarantine_dir / path.name
+        size = path.stat().st_size
+        os.replace(path, target)
+        # The mtime is when the grace period started
+        os.utime(target)
+        return size
+
+    def quarantine_if_unreferenced(self, connection, path: Path) -> Optional[int]:
+        """
+        Quarantine a file unless a Photos row points at it right now.
+
+        The check and the move happen under the database write lock, so a
+        row inserted by /api/photos/link either lands before the check (and
+        the file stays) or after the move (and the file is restored).
+
+        Returns:
+            Bytes quarantined, or None if the file is referenced
+        """
+        connection.commit()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self.referenced_names(connection, [path.name]):
+                return None
+            if path.exists():
+                return self.quarantine(path)
+            # No working copy (remote storage): an empty marker still gets
+            # the backend object deleted after the grace period
+            self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+            (self.quarantine_dir / path.name).touch()
+            return 0
+        finally:
+            connection.commit()
+
+    def quarantine_files(self, connection, payload: dict) -> dict:
+        """
+        Job handler: quarantine the files of just-deleted photos.
+
+        Payload:
+            file_urls: URLs the deleted rows pointed at
+
+        Files still referenced by another row (linked duplicates) are kept.
+        A file with no working copy (remote storage) gets an empty marker so
+        its backend object is still deleted after the grace period.
+        """
+        filenames = sorted({Path(file_url).name for file_url in payload.get('file_urls', [])})
+        referenced = self.referenced_names(connection, filenames)
+
+        quarantined = 0
+        bytes_quarantined = 0
+        for filename in filenames:
+            if filename in referenced or filename.startswith('.'):
+                continue
+            size = self.quarantine_if_unreferenced(connection, self.service.local_photo_path(filename))
+            if size is not None:
+                bytes_quarantined += size
+                quarantined += 1
+
+        print(f"🗑️  Quarantined {quarantined} files of deleted photos")
+        return {'files_quarantined': quarantined, 'bytes_quarantined': bytes_quarantined}
+
+    def reconcile(self, connection, payload: dict) -> dict:
+        """
+        Job handler: run() and schedule the next run.
+
+        A job left queued from when the scan was enabled does nothing (and
+        isn't rescheduled) once it is disabled.
+
+        Payload:
+            dry_run: Report what would be quarantined without moving anything
+        """
+        if not self.enabled:
+            print("♻️  Storage reconciliation is disabled (RECLAIM_ENABLED); skipping")
+            return {'skipped': 'disabled'}
+
+        stats = self.run(connection, dry_run=self.dry_run or payload.get('dry_run', False))
+        job_queue.enqueue('storage_reconcile', {}, delay=self.interval_seconds)
+        return stats
+
+    def run(self, connection, dry_run: bool = False) -> dict:
+        """
+        Diff the photo directory against Photos.file_url.
+
+        The directory is streamed in batches, each checked with one indexed
+        lookup. Only the orphans found are kept in memory, so the safety
+        checks can see how many there are before anything moves. Each one
+        is re-checked right before it is quarantined. Then expired
+        quarantine entries are purged.
+
+        Args:
+            connection: SQLite database connection
+            dry_run: Count orphans and expired entries without moving or deleting
+
+        Returns:
+            Counts of files scanned, orphaned, quarantined, restored and
+            purged, the bytes quarantined and reclaimed, and why the run
+            refused to quarantine, if it did
+        """
+        started = time.time()
+        stats = {
+            'dry_run': dry_run,
+            'refused': None,
+            'files_scanned': 0,
+            'files_orphaned': 0,
+            'files_quarantined': 0,
+            'bytes_quarantined': 0,
+            'files_restored': 0,
+            'files_purged': 0,
+            'bytes_reclaimed': 0,
+        }
+        cutoff = time.time() - self.min_age_seconds
+
+        orphans = []
+        for chunk in self._chunks(self._walk(self.service.upload_dir.resolve())):
+            stats['files_scanned'] += len(chunk)
+            referenced = self.referenced_names(connection, [entry.name for entry in chunk])
+            for entry in chunk:
+                if entry.name in referenced:
+                    continue
+                try:
+                    if entry.stat().st_mtime <= cutoff:
+                        orphans.append(Path(entry.path))
+                except FileNotFoundError:
+                    # Deleted or moved since the directory was listed
+                    pass
+        stats['files_orphaned'] = len(orphans)
+
+        cursor = connection.execute("SELECT EXISTS(SELECT 1 FROM Photos) AS has_photos")
+        if orphans and not cursor.fetchone()['has_photos']:
+            stats['refused'] = 'Photos table is empty'
+        elif len(orphans) > self.max_orphan_fraction * stats['files_scanned']:
+            stats['refused'] = (
+                f"{len(orphans)} of {stats['files_scanned']} files look orphaned "
+                f"(limit {self.max_orphan_fraction:.0%})"
+            )
+        if stats['refused']:
+            print(f"⚠️  Not quarantining anything: {stats['refused']}")
+
+        if not dry_run and not stats['refused']:
+            for path in orphans:
+                try:
+                    size = self.quarantine_if_unreferenced(connection, path)
+                except FileNotFoundError:
+                    continue
+                if size is not None:
+                    stats['bytes_quarantined'] += size
+                    stats['files_quarantined'] += 1
+
+        restored, purged, reclaimed = self.purge_quarantine(connection, dry_run=dry_run)
+        stats['files_restored'] = restored
+        stats['files_purged'] = purged
+        stats['bytes_reclaimed'] = reclaimed
+
+        print(
+            f"♻️  Reconciled photo storage in {time.time() - started:.1f}s"
+            f"{' (dry run)' if dry_run else ''}: {len(orphans)} orphaned, "
+            f"{stats['files_quarantined']} quarantined, {purged} purged, "
+            f"{reclaimed / (1024 * 1024):.1f}MB reclaimed"
+        )
+        return stats
+
+    def purge_quarantine(self, connection, dry_run: bool = False) -> Tuple[int, int, int]:
+        """
+        Delete quarantined files past the grace period; restore any that are referenced again.
+
+        With dry_run, only counts what would be restored and purged.
+
+        Returns:
+            Tuple of (files restored, files purged, bytes reclaimed)
+        """
+        if not self.quarantine_dir.exists():
+            return 0, 0, 0
+
+        restored = purged = reclaimed = 0
+        expired_before = time.time() - self.grace_seconds
+        # Listed up front since entries are moved out of the directory as we go
+        entries = list(self._walk(self.quarantine_dir))
+
+        for chunk in self._chunks(iter(entries)):
+            referenced = self.referenced_names(connection, [entry.name for entry in chunk])
+            for entry in chunk:
+                path = Path(entry.path)
+                try:
+                    if entry.name in referenced:
+                        if dry_run:
+                            restored += 1
+                            continue
+                        target = self.service.new_photo_path(entry.name)
+                        if target.exists() or entry.stat().st_size == 0:
+                            os.remove(path)
+                        else:
+                            os.replace(path, target)
+                        restored += 1
+                        continue
+
+                    stat = entry.stat()
+                    if stat.st_mtime > expired_before:
+                        continue
+                    if dry_run:
+                        purged += 1
+                        reclaimed += stat.st_size
+                        continue
+                    self.service.storage.delete(self.service.storage_key(entry.name))
+                    deep_zoom.remove(entry.name)
+                    os.remove(path)
+                    purged += 1
+                    reclaimed += stat.st_size
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"Failed to purge quarantined file {entry.name}: {e}")
+
+        return restored, purged, reclaimed
+
+    def quarantine_usage(self) -> dict:
+        """Files and bytes currently waiting out the grace period."""
+        files = 0
+        total_bytes = 0
+        if self.quarantine_dir.exists():
+            for entry in self._walk(self.quarantine_dir):
+                files += 1
+                total_bytes += entry.stat().st_size
+        return {'files': files, 'bytes': total_bytes}
+
+
+# Singleton instance
+storage_reconciler = StorageReconciler(
+    photo_service,
+    grace_seconds=RECLAIM_GRACE_SECONDS,
+    min_age_seconds=RECLAIM_MIN_AGE_SECONDS,
+    interval_seconds=RECLAIM_INTERVAL_SECONDS,
+    batch_size=RECLAIM_BATCH_SIZE,
+    enabled=RECLAIM_ENABLED,
+    dry_run=RECLAIM_DRY_RUN,
+    max_orphan_fraction=RECLAIM_MAX_ORPHAN_FRACTION,
+)
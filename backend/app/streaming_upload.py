@@ -0,0 +1,157 @@
+"""Consume multipart/form-data uploads part by part instead of spooling the whole body."""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from app.config import ALLOWED_EXTENSIONS, STREAM_CHUNK_SIZE, STREAM_MAX_FIELD_BYTES
+from app.upload_sessions import UploadError
+
+
+class StreamedFile:
+    """One file part written to disk while it was being received."""
+
+    def __init__(self, field_name: str, filename: str, path: str):
+        self.field_name = field_name
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        # Hashes are computed on the fly so the bytes never have to be re-read:
+        # MD5 names the saved file, SHA-256 identifies its content
+        self._hasher = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+
+    def write(self, f: BinaryIO, data: bytes):
+        """Append received bytes to the open file and the running hashes."""
+        f.write(data)
+        self._hasher.update(data)
+        self._sha256.update(data)
+        self.size += len(data)
+
+    @property
+    def md5(self) -> str:
+        """Hex MD5 digest of everything written so far."""
+        return self._hasher.hexdigest()
+
+    @property
+    def sha256(self) -> str:
+        """Hex SHA-256 digest of everything written so far."""
+        return self._sha256.hexdigest()
+
+
+class StreamingUploadReader:
+    """
+    Parse a multipart body incrementally with Werkzeug's sans-IO decoder.
+
+    Only one read buffer and the current part's pending bytes are held in
+    memory. Each file part is streamed to a directory chosen when the part
+    starts, and a callback fires as soon as the part is complete so the
+    caller can start processing it while later parts are still arriving.
+    """
+
+    def __init__(self, chunk_size: int = 64 * 1024, max_field_bytes: int = 64 * 1024):
+        self.chunk_size = chunk_size
+        self.max_field_bytes = max_field_bytes
+
+    def read(
+        self,
+        stream: BinaryIO,
+        boundary: str,
+        choose_directory: Callable[[Dict[str, str]], str],
+        on_file: Optional[Callable[[Dict[str, str], StreamedFile], None]] = None
+    ) -> Tuple[Dict[str, str], List[StreamedFile]]:
+        """
+        Read every part of the body.
+
+        Args:
+            stream: Raw request body (e.g. flask.request.stream)
+            boundary: Multipart boundary from the Content-Type header
+            choose_directory: Called with the form fields seen so far when a
+                file part starts; returns where to write it. May raise
+                UploadError to reject the upload early.
+            on_file: Called with the fields seen so far and the finished file
+
+        Returns:
+            Tuple of (form fields, streamed files in upload order)
+
+        Raises:
+            UploadError: on malformed bodies, oversized fields or rejected files.
+                Partially written files are removed; completed ones are left
+                for the caller (their paths may have moved in on_file).
+        """
+        decoder = MultipartDecoder(boundary.encode('latin-1'))
+        fields = {}
+        files = []
+        field_name = None
+        field_data = bytearray()
+        current = None
+        current_file = None
+
+        try:
+            while True:
+                event = decoder.next_event()
+
+                if isinstance(event, NeedData):
+                    chunk = stream.read(self.chunk_size)
+                    decoder.receive_data(chunk or None)
+                    continue
+
+                if isinstance(event, Epilogue):
+                    break
+
+                if isinstance(event, File):
+                    field_name = None
+                    if not event.filename:
+                        # Empty file input; its (empty) data is dropped
+                        continue
+                    extension = Path(event.filename or '').suffix.lower().lstrip('.')
+                    if extension not in ALLOWED_EXTENSIONS:
+                        raise UploadError(f"File type not allowed: {event.filename}", 415)
+                    directory = choose_directory(fields)
+                    fd, path = tempfile.mkstemp(
+                        prefix='journitag_', suffix=f".{extension}", dir=directory
+                    )
+                    current_file = os.fdopen(fd, 'wb')
+                    current = StreamedFile(event.name, Path(event.filename).name, path)
+
+                elif isinstance(event, Field):
+                    field_name = event.name
+                    field_data = bytearray()
+
+                elif isinstance(event, Data):
+                    if current is not None:
+                        current.write(current_file, event.data)
+                        if not event.more_data:
+                            current_file.close()
+                            current_file = None
+                            files.append(current)
+                            finished, current = current, None
+                            if on_file:
+                                on_file(fields, finished)
+                    elif field_name is not None:
+                        field_data += event.data
+                        if len(field_data) > self.max_field_bytes:
+                            raise UploadError(f"Form field {field_name} is too large", 413)
+                        if not event.more_data:
+                            fields[field_name] = field_data.decode('utf-8', errors='replace')
+                            field_name = None
+
+        except ValueError as e:
+            # Raised by the decoder for malformed bodies
+            raise UploadError(f"Malformed multipart body: {e}")
+
+        finally:
+            if current_file is not None:
+                current_file.close()
+            if current is not None and os.path.exists(current.path):
+                os.remove(current.path)
+
+        return fields, files
+
+
+# Singleton instance
+streaming_upload_reader = StreamingUploadReader(
+    chunk_size=STREAM_CHUNK_SIZE,
+    max_field_bytes=STREAM_MAX_FIELD_BYTES,
+)
@@ -0,0 +1,128 @@
+"""Remove tombstoned trips row by row in the background."""
+import json
+import time
+from app.job_queue import job_queue
+from app.storage_reconciler import storage_reconciler
+from app.config import TRIP_PURGE_BATCH_SIZE
+
+
+class TripPurger:
+    """
+    Second phase of trip deletion.
+
+    delete_trip only stamps deleted_at on the trip, its locations and its
+    photos; read paths stop showing them at once. This job then deletes
+    the rows in bounded batches, handing each batch's files to the
+    storage reconciler, and reports progress on the job as it goes.
+    """
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+
+    def tombstone_trip(self, connection, trip_id: int) -> int:
+        """
+        Mark a trip, its locations and its photos deleted (without committing).
+
+        Returns:
+            Number of photos tombstoned
+        """
+        now = int(time.time())
+        connection.execute(
+            "UPDATE Trips SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL",
+            (now, trip_id)
+        )
+        connection.execute(
+            "UPDATE Locations SET deleted_at = ? WHERE trip_id = ? AND deleted_at IS NULL",
+            (now, trip_id)
+        )
+        cursor = connection.execute(
+            """
+            UPDATE Photos SET deleted_at = ?
+            WHERE location_id IN (SELECT id FROM Locations WHERE trip_id = ?)
+            AND deleted_at IS NULL
+            """,
+            (now, trip_id)
+        )
+        return cursor.rowcount
+
+    def purge_trip(self, connection, payload: dict) -> dict:
+        """
+        Job handler: delete a tombstoned trip and everything under it.
+
+        Payload:
+            trip_id: ID of a trip delete_trip() tombstoned
+
+        Each batch of photos is deleted and committed on its own, so a
+        retry after a crash resumes where the last batch left off.
+        """
+        trip_id = payload['trip_id']
+        cursor = connection.execute("SELECT deleted_at FROM Trips WHERE id = ?", (trip_id,))
+        trip = cursor.fetchone()
+        if trip is None:
+            return {'photos_purged': 0, 'locations_purged': 0}
+        if trip['deleted_at'] is None:
+            raise ValueError(f"Trip {trip_id} is not marked deleted")
+
+        cursor = connection.execute(
+            """
+            SELECT COUNT(*) AS n FROM Photos
+            WHERE location_id IN (SELECT id FROM Locations WHERE trip_id = ?)
+            """,
+            (trip_id,)
+        )
+        total = cursor.fetchone()['n']
+        purged = 0
+        job_queue.report_progress(connection, {'photos_purged': 0, 'photos_total': total})
+
+        while True:
+            cursor = connection.execute(
+                """
+                SELECT id, file_url FROM Photos
+                WHERE location_id IN (SELECT id FROM Locations WHERE trip_id = ?)
+                LIMIT ?
+                """,
+                (trip_id, self.batch_size)
+            )
+            photos = cursor.fetchall()
+            if not photos:
+                break
+
+            photo_ids = json.dumps([photo['id'] for photo in photos])
+            connection.execute(
+                "DELETE FROM PhotoMetadata WHERE photo_id IN (SELECT value FROM json_each(?))",
+                (photo_ids,)
+            )
+            connection.execute(
+                "DELETE FROM Photos WHERE id IN (SELECT value FROM json_each(?))",
+                (photo_ids,)
+            )
+            connection.commit()
+
+            # Quarantine files once no row (in this trip or another) points at them
+            storage_reconciler.quarantine_files(
+                connection, {'file_urls': [photo['file_url'] for photo in photos]}
+            )
+
+            purged += len(photos)
+            job_queue.report_progress(connection, {'photos_purged': purged, 'photos_total': total})
+            print(f"🧹 Purged {purged}/{total} photos of trip {trip_id}")
+
+        connection.execute(
+            """
+            DELETE FROM LocationTags
+            WHERE location_id IN (SELECT id FROM Locations WHERE trip_id = ?)
+            """,
+            (trip_id,)
+        )
+        cursor = connection.execute("DELETE FROM Locations WHERE trip_id = ?", (trip_id,))
+        locations_purged = cursor.rowcount
+        connection.execute("DELETE FROM SharedTrips WHERE trip_id = ?", (trip_id,))
+        connection.execute("DELETE FROM Trips WHERE id = ?", (trip_id,))
+        connection.commit()
+
+        print(f"✅ Purged trip {trip_id}: {purged} photos, {locations_purged} locations")
+        return {'photos_purged': purged, 'locations_purged': locations_purged}
+
+
+# Singleton instance
+trip_purger = TripPurger(batch_size=TRIP_PURGE_BATCH_SIZE)
@@ -0,0 +1,298 @@
+"""Resumable, tus-style chunked uploads appended straight to disk."""
+import base64
+import fcntl
+import hashlib
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+from app.config import (
+    ALLOWED_EXTENSIONS,
+    UPLOAD_SESSION_FOLDER,
+    UPLOAD_CHUNK_MAX_BYTES,
+    UPLOAD_FILE_MAX_BYTES,
+    UPLOAD_SESSION_TTL,
+)
+
+# Upload-Checksum algorithms we can verify
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+
+class UploadError(Exception):
+    """Raised when an upload (a chunk, session or streamed part) can't be accepted."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadSessionManager:
+    """Track upload sessions in the UploadSessions table and their bytes in .part files."""
+
+    def __init__(
+        self,
+        storage_dir: str,
+        chunk_max_bytes: int = 8 * 1024 * 1024,
+        file_max_bytes: int = 200 * 1024 * 1024,
+        session_ttl: int = 24 * 60 * 60
+    ):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_max_bytes = chunk_max_bytes
+        self.file_max_bytes = file_max_bytes
+        self.session_ttl = session_ttl
+
+    def _part_path(self, upload_id: str) -> Path:
+        """Where the received bytes of a session live."""
+        return self.storage_dir / f"{upload_id}.part"
+
+    def create(
+        self,
+        connection,
+        user_id: int,
+        filename: str,
+        length: int,
+        location_id: Optional[int] = None
+    ) -> dict:
+        """
+        Start a new upload session for one file.
+
+        Raises:
+            UploadError: if the filename or declared length is not acceptable
+        """
+        extension = Path(filename or '').suffix.lower().lstrip('.')
+        if extension not in ALLOWED_EXTENSIONS:
+            raise UploadError(f"File type not allowed: {filename}", 415)
+        if length <= 0:
+            raise UploadError("Upload-Length must be a positive integer")
+        if length > self.file_max_bytes:
+            raise UploadError(f"File exceeds {self.file_max_bytes} bytes", 413)
+
+        self.cleanup_expired(connection)
+
+        upload_id = secrets.token_urlsafe(16)
+        now = int(time.time())
+        self._part_path(upload_id).touch()
+
+        connection.execute(
+            """
+            INSERT INTO UploadSessions
+            (id, user_id, location_id, filename, upload_length, upload_offset, status,
+             created_at, updated_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, 0, 'uploading', ?, ?, ?)
+            """,
+            (upload_id, user_id, location_id, Path(filename).name, length,
+             now, now, now + self.session_ttl)
+        )
+        connection.commit()
+
+        return self.get(connection, upload_id, user_id)
+
+    def get(self, connection, upload_id: str, user_id: int) -> Optional[dict]:
+        """Fetch a live session owned by the user."""
+        cursor = connection.execute(
+            "SELECT * FROM UploadSessions WHERE id = ? AND user_id = ? AND expires_at > ?",
+            (upload_id, user_id, int(time.time()))
+        )
+        return cursor.fetchone()
+
+    def append_chunk(
+        self,
+        connection,
+        session: dict,
+        offset: int,
+        stream: BinaryIO,
+        checksum: Optional[str] = None
+    ) -> int:
+        """
+        Append one chunk at the given offset, verifying its checksum.
+
+        The chunk is streamed to disk in small blocks. If anything goes
+        wrong the .part file is truncated back to the last good offset so
+        the client can simply resend the chunk.
+
+        Args:
+            connection: SQLite database connection
+            session: UploadSessions row
+            offset: Upload-Offset the client believes it is writing at
+            stream: Request body stream
+            checksum: Upload-Checksum header, e.g. "sha256 <base64 digest>"
+
+        Returns:
+            The new upload offset
+
+        Raises:
+            UploadError: 409 on offset mismatch or a concurrent PATCH,
+                460 on checksum mismatch, 413 if the chunk is too large
+        """
+        if session['status'] != 'uploading':
+            raise UploadError("Upload is already complete", 409)
+
+        algorithm, expected_digest = self._parse_checksum(checksum)
+        part_path = self._part_path(session['id'])
+
+        with open(part_path, 'r+b') as f:
+            try:
+                # One writer per session, even across gunicorn workers
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("Another chunk is being written to this upload", 409)
+
+            # Re-read the offset now that we hold the lock
+            cursor = connection.execute(
+                "SELECT upload_offset FROM UploadSessions WHERE id = ?",
+                (session['id'],)
+            )
+            current_offset = cursor.fetchone()['upload_offset']
+            if offset != current_offset:
+                raise UploadError(f"Upload-Offset is {current_offset}, got {offset}", 409)
+
+            # Drop bytes from a chunk interrupted before it was recorded
+            f.truncate(current_offset)
+            f.seek(current_offset)
+
+            remaining = session['upload_length'] - current_offset
+            hasher = hashlib.new(algorithm) if algorithm else None
+            written = 0
+            try:
+                while True:
+                    block = stream.read(64 * 1024)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > self.chunk_max_bytes:
+                        raise UploadError(f"Chunk exceeds {self.chunk_max_bytes} bytes", 413)
+                    if written > remaining:
+                        raise UploadError("Chunk extends past Upload-Length", 413)
+                    if hasher:
+                        hasher.update(block)
+                    f.write(block)
+
+                if hasher and hasher.digest() != expected_digest:
+                    raise UploadError("Upload-Checksum does not match chunk", 460)
+
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception:
+                f.truncate(current_offset)
+                raise
+
+            new_offset = current_offset + written
+            status = 'complete' if new_offset == session['upload_length'] else 'uploading'
+            connection.execute(
+                """
+                UPDATE UploadSessions
+                SET upload_offset = ?, status = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (new_offset, status, int(time.time()), session['id'])
+            )
+            connection.commit()
+
+        return new_offset
+
+    def _parse_checksum(self, header: Optional[str]) -> Tuple[Optional[str], Optional[bytes]]:
+        """Split an Upload-Checksum header into (algorithm, digest bytes)."""
+        if not header:
+            return None, None
+        algorithm, _, encoded = header.strip().partition(' ')
+        algorithm = algorithm.lower()
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise UploadError(f"Unsupported checksum algorithm: {algorithm}")
+        try:
+            return algorithm, base64.b64decode(encoded.strip(), validate=True)
+        except ValueError:
+            raise UploadError("Upload-Checksum digest must be base64")
+
+    def take_completed(
+        self,
+        connection,
+        upload_ids: List[str],
+        user_id: int,
+        directory: str,
+        commit: bool = True
+    ) -> List[dict]:
+        """
+        Move finished uploads into a staging directory and close their sessions.
+
+        With commit=False the sessions' removal is left to the caller's
+        transaction; if that is rolled back, restore() hands the files back
+        so the uploads can be finalized again.
+
+        Returns:
+            List of {'path', 'original_filename', 'upload_id'} for the moved
+            files, in the shape process_upload_job expects
+
+        Raises:
+            UploadError: if any session is missing or not fully uploaded
+        """
+        sessions = []
+        for upload_id in upload_ids:
+            session = self.get(connection, upload_id, user_id)
+            if not session:
+                raise UploadError(f"Upload {upload_id} not found", 404)
+            if session['status'] != 'complete':
+                raise UploadError(
+                    f"Upload {upload_id} is incomplete "
+                    f"({session['upload_offset']}/{session['upload_length']} bytes)",
+                    409
+                )
+            sessions.append(session)
+
+        staged_files = []
+        for session in sessions:
+            suffix = Path(session['filename']).suffix.lower()
+            staged_path = os.path.join(directory, f"journitag_{session['id']}{suffix}")
+            os.replace(self._part_path(session['id']), staged_path)
+            staged_files.append({
+                'path': staged_path,
+                'original_filename': session['filename'],
+                'upload_id': session['id'],
+            })
+            connection.execute("DELETE FROM UploadSessions WHERE id = ?", (session['id'],))
+
+        if commit:
+            connection.commit()
+        return staged_files
+
+    def restore(self, staged_files: List[dict]):
+        """Move files taken by an uncommitted take_completed() back to their sessions."""
+        for item in staged_files:
+            os.replace(item['path'], self._part_path(item['upload_id']))
+
+    def delete(self, connection, session: dict):
+        """Abort an upload and discard its bytes."""
+        connection.execute("DELETE FROM UploadSessions WHERE id = ?", (session['id'],))
+        connection.commit()
+        try:
+            os.remove(self._part_path(session['id']))
+        except FileNotFoundError:
+            pass
+
+    def cleanup_expired(self, connection) -> int:
+        """Remove sessions (and their .part files) that outlived the TTL."""
+        cursor = connection.execute(
+            "SELECT id FROM UploadSessions WHERE expires_at <= ?",
+            (int(time.time()),)
+        )
+        expired = [row['id'] for row in cursor.fetchall()]
+        for upload_id in expired:
+            connection.execute("DELETE FROM UploadSessions WHERE id = ?", (upload_id,))
+            try:
+                os.remove(self._part_path(upload_id))
+            except FileNotFoundError:
+                pass
+        if expired:
+            connection.commit()
+            print(f"🧹 Discarded {len(expired)} expired upload sessions")
+        return len(expired)
+
+
+# Singleton instance
+upload_sessions = UploadSessionManager(
+    UPLOAD_SESSION_FOLDER,
+    chunk_max_bytes=UPLOAD_CHUNK_MAX_BYTES,
+    file_max_bytes=UPLOAD_FILE_MAX_BYTES,
+    session_ttl=UPLOAD_SESSION_TTL,
+)
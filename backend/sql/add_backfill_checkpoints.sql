@@ -0,0 +1,9 @@
+-- Migration: Resumable checkpoints for the derivative backfill CLI
+-- Run with: sqlite3 sql/greetings.db < sql/add_backfill_checkpoints.sql
+
+CREATE TABLE IF NOT EXISTS BackfillCheckpoints (
+    name VARCHAR(50) PRIMARY KEY,
+    last_photo_id INTEGER NOT NULL DEFAULT 0,
+    stats TEXT,
+    updated_at INTEGER DEFAULT (strftime('%s','now'))
+);
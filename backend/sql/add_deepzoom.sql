@@ -0,0 +1,5 @@
+-- Migration: Record which photos have a Deep Zoom tile pyramid
+-- Run with: sqlite3 sql/greetings.db < sql/add_deepzoom.sql
+
+-- Number of pyramid levels once the tiles are rendered, NULL otherwise
+ALTER TABLE Photos ADD COLUMN deepzoom_levels INTEGER;
@@ -0,0 +1,24 @@
+-- Migration: Number dHash writes so the perceptual index can pick up late hashes
+-- Run with: sqlite3 sql/greetings.db < sql/add_dhash_seq.sql
+
+-- Increases every time a photo's dhash is set. Writes to SQLite are
+-- serialized, so the order matches commit order and "everything after the
+-- last value seen" never misses a row.
+ALTER TABLE Photos ADD COLUMN dhash_seq INTEGER;
+UPDATE Photos SET dhash_seq = id WHERE dhash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_photos_dhash_seq ON Photos(dhash_seq);
+CREATE INDEX IF NOT EXISTS idx_photos_user_dhash_seq ON Photos(user_id, dhash_seq);
+
+CREATE TRIGGER IF NOT EXISTS photos_dhash_inserted
+AFTER INSERT ON Photos WHEN NEW.dhash IS NOT NULL
+BEGIN
+    UPDATE Photos SET dhash_seq = (SELECT COALESCE(MAX(dhash_seq), 0) + 1 FROM Photos)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS photos_dhash_updated
+AFTER UPDATE OF dhash ON Photos WHEN NEW.dhash IS NOT NULL AND NEW.dhash IS NOT OLD.dhash
+BEGIN
+    UPDATE Photos SET dhash_seq = (SELECT COALESCE(MAX(dhash_seq), 0) + 1 FROM Photos)
+    WHERE id = NEW.id;
+END;
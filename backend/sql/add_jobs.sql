@@ -0,0 +1,22 @@
+-- Migration: Add durable background job queue
+-- Run with: sqlite3 sql/greetings.db < sql/add_jobs.sql
+
+CREATE TABLE IF NOT EXISTS Jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type VARCHAR(50) NOT NULL,
+    user_id INTEGER,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after INTEGER NOT NULL DEFAULT (strftime('%s','now')),
+    locked_by TEXT,
+    locked_at INTEGER,
+    result TEXT,
+    error TEXT,
+    created_at INTEGER DEFAULT (strftime('%s','now')),
+    updated_at INTEGER DEFAULT (strftime('%s','now')),
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON Jobs(status, run_after);
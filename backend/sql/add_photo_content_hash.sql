@@ -0,0 +1,7 @@
+-- Migration: Add original-file SHA-256 and size so uploads can skip bytes the server already has
+-- Run with: sqlite3 sql/greetings.db < sql/add_photo_content_hash.sql
+
+ALTER TABLE Photos ADD COLUMN content_hash VARCHAR(64);
+ALTER TABLE Photos ADD COLUMN file_size INTEGER;
+
+CREATE INDEX IF NOT EXISTS idx_photos_content_hash ON Photos(content_hash, file_size);
@@ -0,0 +1,4 @@
+-- Migration: Add perceptual hash (dHash) for near-duplicate detection
+-- Run with: sqlite3 sql/greetings.db < sql/add_photo_dhash.sql
+
+ALTER TABLE Photos ADD COLUMN dhash VARCHAR(16);
@@ -0,0 +1,4 @@
+-- Migration: Index Photos.file_url so storage reconciliation can check which files are referenced
+-- Run with: sqlite3 sql/greetings.db < sql/add_photo_file_url_index.sql
+
+CREATE INDEX IF NOT EXISTS idx_photos_file_url ON Photos(file_url);
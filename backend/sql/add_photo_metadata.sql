@@ -0,0 +1,25 @@
+-- Migration: Add PhotoMetadata table with camera/exposure details parsed at ingest
+-- Run with: sqlite3 sql/greetings.db < sql/add_photo_metadata.sql
+
+CREATE TABLE IF NOT EXISTS PhotoMetadata (
+    photo_id INTEGER PRIMARY KEY,
+    camera_make VARCHAR(100) COLLATE NOCASE,
+    camera_model VARCHAR(100) COLLATE NOCASE,
+    lens_model VARCHAR(255) COLLATE NOCASE,
+    focal_length REAL,
+    f_number REAL,
+    exposure_time REAL,
+    iso INTEGER,
+    altitude REAL,
+    exif_orientation INTEGER,
+    orientation VARCHAR(10),
+    format VARCHAR(10),
+    FOREIGN KEY (photo_id) REFERENCES Photos(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_make ON PhotoMetadata(camera_make);
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_model ON PhotoMetadata(camera_model);
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_lens ON PhotoMetadata(lens_model);
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_orientation ON PhotoMetadata(orientation);
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_format ON PhotoMetadata(format);
+CREATE INDEX IF NOT EXISTS idx_photos_taken_at ON Photos(taken_at);
@@ -0,0 +1,6 @@
+-- Migration: Add display dimensions and an inline low-quality placeholder to photos
+-- Run with: sqlite3 sql/greetings.db < sql/add_photo_placeholder.sql
+
+ALTER TABLE Photos ADD COLUMN width INTEGER;
+ALTER TABLE Photos ADD COLUMN height INTEGER;
+ALTER TABLE Photos ADD COLUMN placeholder TEXT;
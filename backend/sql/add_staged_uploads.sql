@@ -0,0 +1,15 @@
+-- Migration: Add staged uploads committed by token
+-- Run with: sqlite3 sql/greetings.db < sql/add_staged_uploads.sql
+
+CREATE TABLE IF NOT EXISTS StagedUploads (
+    token VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER,
+    filename VARCHAR(255) NOT NULL,
+    path TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    created_at INTEGER DEFAULT (strftime('%s','now')),
+    expires_at INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_staged_uploads_expires ON StagedUploads(expires_at);
@@ -0,0 +1,12 @@
+-- Migration: Tombstone columns so trip deletion returns at once and a background job purges the rows
+-- Run with: sqlite3 sql/greetings.db < sql/add_tombstones.sql
+
+ALTER TABLE Trips ADD COLUMN deleted_at INTEGER;
+ALTER TABLE Locations ADD COLUMN deleted_at INTEGER;
+ALTER TABLE Photos ADD COLUMN deleted_at INTEGER;
+
+-- Progress reported by long-running jobs such as trip purges
+ALTER TABLE Jobs ADD COLUMN progress TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_locations_trip ON Locations(trip_id);
+CREATE INDEX IF NOT EXISTS idx_photos_location ON Photos(location_id);
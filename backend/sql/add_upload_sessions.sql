@@ -0,0 +1,18 @@
+-- Migration: Add resumable chunked upload sessions
+-- Run with: sqlite3 sql/greetings.db < sql/add_upload_sessions.sql
+
+CREATE TABLE IF NOT EXISTS UploadSessions (
+    id VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    location_id INTEGER,
+    filename VARCHAR(255) NOT NULL,
+    upload_length INTEGER NOT NULL,
+    upload_offset INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'uploading',
+    created_at INTEGER DEFAULT (strftime('%s','now')),
+    updated_at INTEGER DEFAULT (strftime('%s','now')),
+    expires_at INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires ON UploadSessions(expires_at);
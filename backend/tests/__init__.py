@@ -0,0 +1,6 @@
+"""Backend tests; run from backend/ with `python -m pytest tests`."""
+import os
+import tempfile
+
+# Importing the app initializes its database; keep that out of the repo
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'JourniTag.db'))
@@ -0,0 +1,150 @@
+"""Boundary polygons: ring simplification, point-in-polygon and the STR-tree."""
+import json
+import math
+import random
+import shutil
+import tempfile
+import unittest
+from array import array
+from pathlib import Path
+
+from app.boundaries import BoundaryIndex, STRTree, point_in_rings, simplify_ring
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+HOLE = [(4, 4), (6, 4), (6, 6), (4, 6), (4, 4)]
+
+
+def flat(points):
+    return array('d', [value for point in points for value in point])
+
+
+def segment_distance(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    t = 0 if length == 0 else max(0, min(1, ((px - x1) * dx + (py - y1) * dy) / length))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+class SimplifyRingTest(unittest.TestCase):
+
+    def test_zero_tolerance_keeps_every_vertex(self):
+        self.assertEqual(simplify_ring(SQUARE, 0), flat(SQUARE))
+
+    def test_drops_collinear_vertices(self):
+        ring = [(0, 0), (5, 0), (10, 0), (10, 5), (10, 10), (5, 10), (0, 10), (0, 5), (0, 0)]
+        self.assertEqual(simplify_ring(ring, 0.01), flat(SQUARE))
+
+    def test_stays_within_tolerance(self):
+        circle = [(math.cos(2 * math.pi * i / 200), math.sin(2 * math.pi * i / 200)) for i in range(200)]
+        circle.append(circle[0])
+        tolerance = 0.01
+
+        simplified = simplify_ring(circle, tolerance)
+        kept = list(zip(simplified[0::2], simplified[1::2]))
+        self.assertLess(len(kept), len(circle) // 2)
+        self.assertEqual(kept[0], kept[-1])
+        for px, py in circle:
+            distance = min(
+                segment_distance(px, py, *kept[i], *kept[i + 1]) for i in range(len(kept) - 1)
+            )
+            self.assertLessEqual(distance, tolerance + 1e-9)
+
+    def test_tiny_rings_are_not_collapsed(self):
+        sliver = [(0, 0), (1, 0.001), (2, 0), (1, -0.001), (0, 0)]
+        self.assertEqual(simplify_ring(sliver, 1), flat(sliver))
+
+
+class PointInRingsTest(unittest.TestCase):
+
+    def test_outer_ring_and_hole(self):
+        rings = [flat(SQUARE), flat(HOLE)]
+        self.assertTrue(point_in_rings(2, 2, rings))
+        self.assertTrue(point_in_rings(9.9, 5, rings))
+        self.assertFalse(point_in_rings(5, 5, rings))
+        self.assertFalse(point_in_rings(11, 5, rings))
+        self.assertFalse(point_in_rings(5, -0.1, rings))
+
+    def test_concave_ring(self):
+        # A U shape opening upwards
+        ring = flat([(0, 0), (3, 0), (3, 3), (2, 3), (2, 1), (1, 1), (1, 3), (0, 3), (0, 0)])
+        self.assertTrue(point_in_rings(0.5, 2, [ring]))
+        self.assertTrue(point_in_rings(2.5, 2, [ring]))
+        self.assertFalse(point_in_rings(1.5, 2, [ring]))
+        self.assertTrue(point_in_rings(1.5, 0.5, [ring]))
+
+
+class STRTreeTest(unittest.TestCase):
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(5)
+        boxes = []
+        for _ in range(500):
+            x, y = rng.uniform(-180, 170), rng.uniform(-90, 80)
+            boxes.append((x, y, x + rng.uniform(0, 10), y + rng.uniform(0, 10)))
+
+        for capacity in (2, 4, 16):
+            tree = STRTree(boxes, node_capacity=capacity)
+            self.assertEqual(len(tree.levels[0]), 1)
+            for _ in range(200):
+                x, y = rng.uniform(-180, 180), rng.uniform(-90, 90)
+                expected = [
+                    i for i, (min_x, min_y, max_x, max_y) in enumerate(boxes)
+                    if min_x <= x <= max_x and min_y <= y <= max_y
+                ]
+                self.assertEqual(sorted(tree.query(x, y)), expected)
+
+    def test_small_trees(self):
+        self.assertEqual(STRTree([]).query(0, 0), [])
+        tree = STRTree([(0, 0, 1, 1)])
+        self.assertEqual(tree.query(1, 1), [0])
+        self.assertEqual(tree.query(1.1, 1), [])
+
+
+class BoundaryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        islands = [[[(20, 0), (22, 0), (22, 2), (20, 2), (20, 0)]], [[(30, 0), (32, 0), (32, 2), (30, 2), (30, 0)]]]
+        collection = {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'properties': {'NAME': 'Holey', 'ISO_A2': '-99', 'ISO_A2_EH': 'HL'},
+                    'geometry': {'type': 'Polygon', 'coordinates': [SQUARE, HOLE]},
+                },
+                {
+                    'type': 'Feature',
+                    'properties': {'NAME': 'Islands', 'ISO_A2': 'IS'},
+                    'geometry': {'type': 'MultiPolygon', 'coordinates': islands},
+                },
+                {'type': 'Feature', 'properties': {'NAME': 'Point'}, 'geometry': {'type': 'Point', 'coordinates': [1, 1]}},
+            ],
+        }
+        (self.tmp / 'countries.geojson').write_text(json.dumps(collection), encoding='utf-8')
+        self.index = BoundaryIndex(
+            str(self.tmp / 'countries.geojson'),
+            {'name': ('NAME',), 'code': ('ISO_A2', 'ISO_A2_EH')},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_locate(self):
+        self.assertEqual(self.index.locate(2, 2), {'name': 'Holey', 'code': 'HL'})
+        self.assertIsNone(self.index.locate(5, 5))
+        self.assertEqual(self.index.locate(1, 31), {'name': 'Islands', 'code': 'IS'})
+        self.assertIsNone(self.index.locate(1, 26))
+        self.assertEqual(len(self.index.features), 2)
+
+    def test_locate_many_matches_locate(self):
+        points = [(1, 21), (1.5, 21.5), (1, 31), (5, 5), (2, 2), (1, 21), (50, 50)]
+        self.assertEqual(self.index.locate_many(points), [self.index.locate(*point) for point in points])
+
+    def test_missing_layer(self):
+        index = BoundaryIndex(str(self.tmp / 'missing.geojson'), {'name': ('NAME',)})
+        self.assertEqual(index.locate_many([(0, 0), (1, 1)]), [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Header-only EXIF reads and the Pillow fallback in PhotoService."""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+from app.exif_reader import ExifReader, exif_reader
+from app.photo_service import photo_service
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_AVAILABLE = True
+except ImportError:
+    HEIF_AVAILABLE = False
+
+# 33°52'12"S 151°12'36"E
+GPS = {1: 'S', 2: (33.0, 52.0, 12.0), 3: 'E', 4: (151.0, 12.0, 36.0)}
+LATITUDE = -(33 + 52 / 60 + 12 / 3600)
+LONGITUDE = 151 + 12 / 60 + 36 / 3600
+
+
+def make_exif() -> bytes:
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCam'
+    exif[0x0110] = 'Model 1'
+    exif.get_ifd(0x8769)[0x9003] = '2024:05:01 12:30:00'
+    exif.get_ifd(0x8825).update(GPS)
+    return exif.tobytes()
+
+
+class ExifReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.reader = ExifReader()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def save(self, name: str, **kwargs) -> str:
+        path = self.tmp / name
+        Image.new('RGB', (64, 48), 'red').save(path, **kwargs)
+        return str(path)
+
+    def assert_tags(self, metadata: dict):
+        self.assertEqual(metadata['Make'], 'TestCam')
+        self.assertEqual(metadata['Model'], 'Model 1')
+        self.assertEqual(metadata['DateTimeOriginal'], '2024:05:01 12:30:00')
+        self.assertEqual(metadata['GPSInfo'], {
+            'GPSLatitudeRef': 'S',
+            'GPSLatitude': (33.0, 52.0, 12.0),
+            'GPSLongitudeRef': 'E',
+            'GPSLongitude': (151.0, 12.0, 36.0),
+        })
+
+    def test_jpeg(self):
+        self.assert_tags(self.reader.read(self.save('a.jpg', exif=make_exif())))
+
+    @unittest.skipUnless(HEIF_AVAILABLE, 'pillow-heif is not installed')
+    def test_heic(self):
+        self.assert_tags(self.reader.read(self.save('a.heic', exif=make_exif())))
+
+    def test_jpeg_without_exif(self):
+        self.assertEqual(self.reader.read(self.save('a.jpg')), {})
+
+    def test_unsupported_container(self):
+        self.assertIsNone(self.reader.read(self.save('a.png', exif=make_exif())))
+
+    def test_truncated_jpeg(self):
+        path = self.save('a.jpg', exif=make_exif())
+        Path(path).write_bytes(Path(path).read_bytes()[:30])
+        self.assertIsNone(self.reader.read(path))
+
+    def test_exif_past_read_limit(self):
+        # Only the JFIF segment fits in 16 bytes; the caller has to decode
+        reader = ExifReader(read_limit=16)
+        self.assertIsNone(reader.read(self.save('a.jpg', exif=make_exif())))
+
+
+class PillowFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def save(self, name: str, **kwargs) -> str:
+        path = self.tmp / name
+        Image.new('RGB', (64, 48), 'red').save(path, **kwargs)
+        return str(path)
+
+    def assert_summary(self, metadata: dict):
+        summary = photo_service.summarize_exif(metadata)
+        self.assertAlmostEqual(summary['latitude'], LATITUDE, places=6)
+        self.assertAlmostEqual(summary['longitude'], LONGITUDE, places=6)
+        self.assertIsNotNone(summary['taken_at'])
+
+    def test_png_uses_pillow(self):
+        path = self.save('a.png', exif=make_exif())
+        with mock.patch.object(
+            photo_service, '_extract_exif_data_with_pillow',
+            wraps=photo_service._extract_exif_data_with_pillow
+        ) as fallback:
+            metadata = photo_service.extract_exif_data(path)
+        fallback.assert_called_once_with(path)
+        self.assert_summary(metadata)
+
+    def test_jpeg_past_read_limit_uses_pillow(self):
+        path = self.save('a.jpg', exif=make_exif())
+        with mock.patch.object(exif_reader, 'read_limit', 16):
+            metadata = photo_service.extract_exif_data(path)
+        self.assertEqual(metadata['Make'], 'TestCam')
+        self.assert_summary(metadata)
+
+    def test_fast_path_matches_pillow(self):
+        path = self.save('a.jpg', exif=make_exif())
+        fast = photo_service.summarize_exif(photo_service.extract_exif_data(path))
+        slow = photo_service.summarize_exif(photo_service._extract_exif_data_with_pillow(path))
+        self.assertEqual(fast, slow)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Gazetteer: KD-tree nearest-place lookups over a GeoNames-style dump."""
+import math
+import random
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.gazetteer import EARTH_RADIUS_KM, Gazetteer
+
+PLACES = [
+    # name, latitude, longitude, country, admin1
+    ('San Francisco', 37.77493, -122.41942, 'US', 'CA'),
+    ('Oakland', 37.80437, -122.2708, 'US', 'CA'),
+    ('Suva', -18.14161, 178.44149, 'FJ', '01'),
+    ('Apia', -13.83333, -171.76666, 'WS', '11'),
+    ('Longyearbyen', 78.22334, 15.64689, 'SJ', '21'),
+]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def geonames_line(geonameid, name, latitude, longitude, country, admin1):
+    fields = [str(geonameid), name, name, '', str(latitude), str(longitude),
+              'P', 'PPL', country, '', admin1, '', '', '', '1000', '', '0', 'UTC', '2024-01-01']
+    return '\t'.join(fields) + '\n'
+
+
+class GazetteerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        rng = random.Random(3)
+        self.places = list(PLACES) + [
+            (f"Town {i}", round(rng.uniform(-85, 85), 5), round(rng.uniform(-180, 180), 5), 'XX', '')
+            for i in range(2000)
+        ]
+        lines = [geonames_line(i, *place) for i, place in enumerate(self.places)]
+        lines.insert(3, 'not\ta\tplace\n')
+        (self.tmp / 'cities.txt').write_text(''.join(lines), encoding='utf-8')
+        (self.tmp / 'admin1.txt').write_text(
+            'US.CA\tCalifornia\tCalifornia\t5332921\nFJ.01\tCentral\tCentral\t2205218\n', encoding='utf-8'
+        )
+        (self.tmp / 'countries.txt').write_text(
+            '#ISO\tISO3\tISO-Numeric\tfips\tCountry\n'
+            'US\tUSA\t840\tUS\tUnited States\nFJ\tFJI\t242\tFJ\tFiji\n',
+            encoding='utf-8'
+        )
+        self.gazetteer = Gazetteer(
+            str(self.tmp / 'cities.txt'),
+            admin1_file=str(self.tmp / 'admin1.txt'),
+            country_file=str(self.tmp / 'countries.txt'),
+            max_distance_km=50,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_matches_linear_scan(self):
+        self.assertTrue(self.gazetteer.load())
+        self.assertEqual(len(self.gazetteer), len(self.places))
+
+        rng = random.Random(11)
+        queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(300)]
+        # Poles and both sides of the antimeridian
+        queries += [(90, 0), (-90, 0), (-16, 179.99), (-16, -179.99)]
+        for latitude, longitude in queries:
+            expected = min(haversine_km(latitude, longitude, place[1], place[2]) for place in self.places)
+            place = self.gazetteer.nearest(latitude, longitude)
+            self.assertAlmostEqual(place['distance_km'], expected, delta=0.01)
+
+    def test_reverse_geocode(self):
+        result = self.gazetteer.reverse_geocode(37.7793, -122.4193)
+        self.assertEqual(result['name'], 'San Francisco')
+        self.assertEqual(result['state'], 'California')
+        self.assertEqual(result['country'], 'United States')
+        self.assertEqual(result['country_code'], 'us')
+        self.assertEqual(result['address'], 'San Francisco, California, United States')
+        self.assertEqual(result['source'], 'gazetteer')
+        self.assertLess(result['distance_km'], 1)
+
+    def test_nearest_across_the_antimeridian(self):
+        # Just east of 180°, Suva (178.4°E) is far closer than Apia (171.8°W)
+        place = self.gazetteer.nearest(-18.0, -179.9)
+        self.assertEqual(place['name'], 'Suva')
+        self.assertEqual(place['country'], 'Fiji')
+
+    def test_unknown_codes_fall_back(self):
+        place = self.gazetteer.nearest(-13.8, -171.8)
+        self.assertEqual(place['name'], 'Apia')
+        self.assertEqual(place['state'], '')
+        self.assertEqual(place['country'], 'WS')
+
+    def test_too_far_from_any_place(self):
+        self.gazetteer.max_distance_km = 1
+        self.assertIsNone(self.gazetteer.reverse_geocode(37.9, -122.0))
+        self.assertIsNotNone(self.gazetteer.nearest(37.9, -122.0))
+
+    def test_missing_dump(self):
+        gazetteer = Gazetteer(str(self.tmp / 'missing.txt'))
+        self.assertFalse(gazetteer.available)
+        self.assertTrue(gazetteer.ready)
+        self.assertIsNone(gazetteer.nearest(0, 0))
+        self.assertIsNone(gazetteer.reverse_geocode(0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
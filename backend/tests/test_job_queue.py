@@ -0,0 +1,156 @@
+"""JobQueue leases, retries, heartbeats and orphan recovery against a scratch database."""
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from app.job_queue import JobQueue
+
+SQL_DIR = Path(__file__).resolve().parent.parent / 'sql'
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.db_path = self.tmp / 'jobs.db'
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript((SQL_DIR / 'add_jobs.sql').read_text())
+        connection.execute("ALTER TABLE Jobs ADD COLUMN progress TEXT")
+        connection.close()
+        # No worker threads: tests claim and run jobs themselves
+        self.queue = JobQueue(self.db_path, num_workers=0, max_attempts=2, retry_backoff=30, lease_seconds=60)
+        self.worker_id = f"{self.queue._worker_prefix}:0"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def claim(self):
+        connection = self.queue._connect()
+        try:
+            return self.queue._claim_next(connection, self.worker_id)
+        finally:
+            connection.close()
+
+    def run_claimed(self, job):
+        connection = self.queue._connect()
+        try:
+            self.queue._run_job(connection, job)
+        finally:
+            connection.close()
+
+    def set_lock(self, job_id, locked_by, locked_at):
+        connection = self.queue._connect()
+        connection.execute(
+            "UPDATE Jobs SET status = 'running', locked_by = ?, locked_at = ? WHERE id = ?",
+            (locked_by, locked_at, job_id)
+        )
+        connection.commit()
+        connection.close()
+
+    def test_claim_takes_oldest_runnable_job(self):
+        later = self.queue.enqueue('test', {'n': 1}, delay=3600)
+        first = self.queue.enqueue('test', {'n': 2})
+        second = self.queue.enqueue('test', {'n': 3})
+
+        job = self.claim()
+        self.assertEqual(job['id'], first)
+        self.assertEqual(job['status'], 'running')
+        self.assertEqual(job['locked_by'], self.worker_id)
+        self.assertEqual(job['attempts'], 1)
+
+        self.assertEqual(self.claim()['id'], second)
+        # The delayed job isn't due yet
+        self.assertIsNone(self.claim())
+        self.assertEqual(self.queue.get_job(later)['status'], 'queued')
+
+    def test_success_records_result(self):
+        self.queue.register('test', lambda connection, payload: {'doubled': payload['n'] * 2})
+        job_id = self.queue.enqueue('test', {'n': 21})
+
+        self.run_claimed(self.claim())
+
+        job = self.queue.get_job(job_id)
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['result'], {'doubled': 42})
+        self.assertIsNone(job['locked_by'])
+
+    def test_failure_retries_with_backoff_then_fails(self):
+        failed_payloads = []
+
+        def handler(connection, payload):
+            raise RuntimeError('boom')
+
+        self.queue.register('test', handler, on_failure=failed_payloads.append)
+        job_id = self.queue.enqueue('test', {'n': 1})
+
+        self.run_claimed(self.claim())
+        job = self.queue.get_job(job_id)
+        self.assertEqual(job['status'], 'queued')
+        self.assertEqual(job['error'], 'boom')
+        self.assertGreaterEqual(job['run_after'], int(time.time()) + 29)
+        self.assertEqual(failed_payloads, [])
+
+        # Make the retry due now
+        connection = self.queue._connect()
+        connection.execute("UPDATE Jobs SET run_after = 0 WHERE id = ?", (job_id,))
+        connection.commit()
+        connection.close()
+
+        self.run_claimed(self.claim())
+        job = self.queue.get_job(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(failed_payloads, [{'n': 1}])
+
+    def test_heartbeat_refreshes_lease(self):
+        queue = JobQueue(self.db_path, num_workers=0, lease_seconds=0.3)
+        job_id = queue.enqueue('test', {})
+        other_id = queue.enqueue('test', {})
+        self.set_lock(job_id, self.worker_id, 0)
+        self.set_lock(other_id, 'elsewhere:1:0', 0)
+
+        done = threading.Event()
+        thread = threading.Thread(target=queue._heartbeat, args=(job_id, self.worker_id, done))
+        thread.start()
+        time.sleep(0.35)
+        done.set()
+        thread.join()
+
+        self.assertGreaterEqual(queue.get_job(job_id)['locked_at'], int(time.time()) - 1)
+        # Only the worker's own job is refreshed
+        self.assertEqual(queue.get_job(other_id)['locked_at'], 0)
+
+    def test_recover_orphaned_jobs(self):
+        hostname = socket.gethostname()
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        now = int(time.time())
+
+        dead_local = self.queue.enqueue('test', {})
+        live_local = self.queue.enqueue('test', {})
+        expired_remote = self.queue.enqueue('test', {})
+        fresh_remote = self.queue.enqueue('test', {})
+        self.set_lock(dead_local, f"{hostname}:{exited.pid}:0", now)
+        # Our own process is alive, however stale its lock looks
+        self.set_lock(live_local, self.worker_id, 0)
+        self.set_lock(expired_remote, 'other-host:123:0', now - 120)
+        self.set_lock(fresh_remote, 'other-host:123:1', now)
+
+        self.assertEqual(self.queue.recover_orphaned_jobs(), 2)
+
+        self.assertEqual(self.queue.get_job(dead_local)['status'], 'queued')
+        self.assertIsNone(self.queue.get_job(dead_local)['locked_by'])
+        self.assertEqual(self.queue.get_job(live_local)['status'], 'running')
+        self.assertEqual(self.queue.get_job(expired_remote)['status'], 'queued')
+        self.assertEqual(self.queue.get_job(fresh_remote)['status'], 'running')
+
+
+if __name__ == '__main__':
+    unittest.main()
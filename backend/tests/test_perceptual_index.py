@@ -0,0 +1,124 @@
+"""BK-tree near-duplicate search and the per-user PerceptualIndex."""
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.db import dict_factory
+from app.perceptual_index import BKTree, PerceptualIndex, hamming_distance
+
+SQL_DIR = Path(__file__).resolve().parent.parent / 'sql'
+
+
+class BKTreeTest(unittest.TestCase):
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(7)
+        base = [rng.getrandbits(64) for _ in range(20)]
+        # Clusters of near-duplicates around a few base hashes
+        values = base + [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+                         for value in base for _ in range(10)]
+        tree = BKTree()
+        for item, value in enumerate(values):
+            tree.add(value, item)
+        self.assertEqual(tree.size, len(values))
+
+        for query in base[:5] + [rng.getrandbits(64)]:
+            for radius in (0, 2, 6, 20):
+                expected = sorted(
+                    (hamming_distance(query, value), item)
+                    for item, value in enumerate(values)
+                    if hamming_distance(query, value) <= radius
+                )
+                self.assertEqual(sorted(tree.search(query, radius)), expected)
+
+    def test_closest_first_and_duplicates(self):
+        tree = BKTree()
+        tree.add(0b1111, 'far')
+        tree.add(0b0000, 'a')
+        tree.add(0b0000, 'b')
+        tree.add(0b0001, 'near')
+
+        matches = tree.search(0b0000, 4)
+        self.assertEqual([distance for distance, _ in matches], [0, 0, 1, 4])
+        self.assertEqual({item for distance, item in matches if distance == 0}, {'a', 'b'})
+        self.assertEqual(BKTree().search(0, 64), [])
+
+
+class PerceptualIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.connection = sqlite3.connect(self.tmp / 'photos.db')
+        self.connection.row_factory = dict_factory
+        self.connection.execute(
+            """
+            CREATE TABLE Photos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                dhash TEXT,
+                deleted_at TIMESTAMP
+            )
+            """
+        )
+        self.connection.executescript((SQL_DIR / 'add_dhash_seq.sql').read_text())
+        self.index = PerceptualIndex(max_distance=4)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def insert(self, user_id, dhash):
+        cursor = self.connection.execute(
+            "INSERT INTO Photos (user_id, dhash) VALUES (?, ?)", (user_id, dhash)
+        )
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def similar(self, dhash, user_id=1, **kwargs):
+        return [
+            (match['photo_id'], match['distance'])
+            for match in self.index.find_similar(self.connection, user_id, dhash, **kwargs)
+        ]
+
+    def test_finds_near_duplicates_for_the_user_only(self):
+        exact = self.insert(1, 'ffff000000000000')
+        near = self.insert(1, 'ffff000000000003')
+        self.insert(1, '0000ffffffffffff')
+        self.insert(2, 'ffff000000000000')
+
+        self.assertEqual(self.similar('ffff000000000000'), [(exact, 0), (near, 2)])
+        self.assertEqual(self.similar('ffff000000000000', exclude_id=exact), [(near, 2)])
+        self.assertEqual(self.similar('ffff000000000000', max_distance=1), [(exact, 0)])
+
+    def test_picks_up_hashes_written_after_first_lookup(self):
+        self.insert(1, 'ffff000000000000')
+        self.similar('ffff000000000000')
+
+        # Inserted by another process, then a hash backfilled onto an old row
+        added = self.insert(1, 'ffff000000000001')
+        backfilled = self.insert(1, None)
+        self.connection.execute("UPDATE Photos SET dhash = ? WHERE id = ?", ('ffff000000000002', backfilled))
+        self.connection.commit()
+
+        photo_ids = [photo_id for photo_id, _ in self.similar('ffff000000000000')]
+        self.assertIn(added, photo_ids)
+        self.assertIn(backfilled, photo_ids)
+
+    def test_rechecks_deleted_and_rehashed_photos(self):
+        deleted = self.insert(1, 'ffff000000000000')
+        rehashed = self.insert(1, 'ffff000000000001')
+        self.similar('ffff000000000000')
+
+        self.connection.execute("UPDATE Photos SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?", (deleted,))
+        self.connection.execute("UPDATE Photos SET dhash = ? WHERE id = ?", ('0000ffffffffffff', rehashed))
+        self.connection.commit()
+
+        self.assertEqual(self.similar('ffff000000000000'), [])
+        self.assertEqual(self.similar('0000ffffffffffff'), [(rehashed, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""S3Storage against the in-process FakeS3Server."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from app import storage
+from app.fake_s3 import FakeS3Server
+from app.storage import FakeS3Storage, S3Storage, StorageError
+
+ACCESS_KEY = 'test-access'
+SECRET_KEY = 'test-secret'
+BUCKET = 'photos'
+
+
+class S3StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.server = FakeS3Server(self.tmp / 'bucket', ACCESS_KEY, SECRET_KEY)
+        self.endpoint_url = self.server.start()
+        self.storage = S3Storage(self.endpoint_url, BUCKET, ACCESS_KEY, SECRET_KEY)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name: str, data: bytes) -> str:
+        path = self.tmp / name
+        path.write_bytes(data)
+        return str(path)
+
+    def test_put_get_delete(self):
+        source = self.write('a.jpg', b'jpeg bytes')
+        self.storage.put_file('1/a.jpg', source)
+        self.assertTrue(self.storage.exists('1/a.jpg'))
+
+        dest = self.tmp / 'out' / 'a.jpg'
+        self.storage.get_file('1/a.jpg', str(dest))
+        self.assertEqual(dest.read_bytes(), b'jpeg bytes')
+
+        self.storage.delete('1/a.jpg')
+        self.assertFalse(self.storage.exists('1/a.jpg'))
+        # Deleting again is not an error
+        self.storage.delete('1/a.jpg')
+
+    def test_get_missing_key(self):
+        with self.assertRaises(FileNotFoundError):
+            self.storage.get_file('missing.jpg', str(self.tmp / 'missing.jpg'))
+
+    def test_put_files(self):
+        items = [(f"batch/{i}.jpg", self.write(f"{i}.jpg", bytes([i]) * 100)) for i in range(5)]
+        items.append(('batch/missing.jpg', str(self.tmp / 'does-not-exist.jpg')))
+
+        results = self.storage.put_files(items)
+        self.assertEqual(results[:5], [None] * 5)
+        self.assertIsInstance(results[5], OSError)
+        for i in range(5):
+            self.assertTrue(self.storage.exists(f"batch/{i}.jpg"))
+
+    def test_multipart_upload(self):
+        storage_ = S3Storage(
+            self.endpoint_url, BUCKET, ACCESS_KEY, SECRET_KEY,
+            multipart_threshold=1024 * 1024, part_size=1
+        )
+        # Three 5MB parts (the minimum part size), the last one short
+        data = os.urandom(1024) * (11 * 1024)
+        source = self.write('big.jpg', data)
+
+        with mock.patch.object(storage_, '_put_multipart', wraps=storage_._put_multipart) as put_multipart:
+            storage_.put_file('big.jpg', source)
+        put_multipart.assert_called_once()
+
+        dest = self.tmp / 'big-out.jpg'
+        storage_.get_file('big.jpg', str(dest))
+        self.assertEqual(dest.read_bytes(), data)
+
+    def test_multipart_upload_aborts_on_failure(self):
+        storage_ = S3Storage(
+            self.endpoint_url, BUCKET, ACCESS_KEY, SECRET_KEY,
+            multipart_threshold=1024 * 1024, part_size=1
+        )
+        # Two 5MB parts
+        source = self.write('big.jpg', b'x' * (6 * 1024 * 1024))
+        request = storage_._request
+
+        def fail_second_part(method, key, query=None, **kwargs):
+            if (query or {}).get('partNumber') == 2:
+                raise requests.ConnectionError('connection reset')
+            return request(method, key, query=query, **kwargs)
+
+        with mock.patch.object(storage_, '_request', side_effect=fail_second_part):
+            with self.assertRaises(requests.ConnectionError):
+                storage_.put_file('big.jpg', source)
+
+        self.assertFalse(storage_.exists('big.jpg'))
+        self.assertEqual(list((self.tmp / 'bucket' / '.multipart').iterdir()), [])
+
+    def test_presigned_url(self):
+        self.storage.put_file('1/a.jpg', self.write('a.jpg', b'jpeg bytes'))
+
+        response = requests.get(self.storage.presigned_url('1/a.jpg'), timeout=10)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'jpeg bytes')
+
+    def test_presigned_url_rejects_tampering(self):
+        self.storage.put_file('1/a.jpg', self.write('a.jpg', b'jpeg bytes'))
+        self.storage.put_file('1/b.jpg', self.write('b.jpg', b'other bytes'))
+
+        url = self.storage.presigned_url('1/a.jpg')
+        response = requests.get(url.replace('/1/a.jpg?', '/1/b.jpg?'), timeout=10)
+        self.assertEqual(response.status_code, 403)
+
+    def test_presigned_url_expires(self):
+        self.storage.put_file('1/a.jpg', self.write('a.jpg', b'jpeg bytes'))
+
+        url = self.storage.presigned_url('1/a.jpg', expires=1)
+        time.sleep(2)
+        response = requests.get(url, timeout=10)
+        self.assertEqual(response.status_code, 403)
+
+    def test_wrong_credentials(self):
+        storage_ = S3Storage(self.endpoint_url, BUCKET, ACCESS_KEY, 'wrong-secret')
+        with self.assertRaises(StorageError):
+            storage_.put_file('1/a.jpg', self.write('a.jpg', b'jpeg bytes'))
+
+
+class FakeS3StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_server_starts_on_first_use(self):
+        storage_ = FakeS3Storage(str(self.tmp / 'bucket'), BUCKET, ACCESS_KEY, SECRET_KEY)
+        self.assertIsNone(storage_._server)
+        self.assertFalse((self.tmp / 'bucket').exists())
+
+        source = self.tmp / 'a.jpg'
+        source.write_bytes(b'jpeg bytes')
+        storage_.put_file('1/a.jpg', str(source))
+        self.addCleanup(storage_._server.stop)
+
+        response = requests.get(storage_.presigned_url('1/a.jpg'), timeout=10)
+        self.assertEqual(response.content, b'jpeg bytes')
+
+
+class CreateStorageTest(unittest.TestCase):
+
+    def test_s3_requires_credentials(self):
+        with mock.patch.object(storage, 'S3_ACCESS_KEY_ID', ''), \
+                mock.patch.object(storage, 'S3_SECRET_ACCESS_KEY', ''):
+            with self.assertRaises(ValueError):
+                storage.create_storage('s3')
+
+    def test_s3_with_credentials(self):
+        with mock.patch.object(storage, 'S3_ACCESS_KEY_ID', ACCESS_KEY), \
+                mock.patch.object(storage, 'S3_SECRET_ACCESS_KEY', SECRET_KEY):
+            backend = storage.create_storage('s3')
+        self.assertIsInstance(backend, S3Storage)
+        self.assertEqual(backend.access_key, ACCESS_KEY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""StreamingUploadReader: incremental multipart parsing straight to disk."""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.test import encode_multipart
+
+from app.streaming_upload import StreamingUploadReader
+from app.upload_sessions import UploadError
+
+BOUNDARY = 'journitag-test-boundary'
+
+
+def multipart_body(fields=(), files=()):
+    values = MultiDict(fields)
+    for name, filename, data in files:
+        values.add(name, FileStorage(io.BytesIO(data), filename=filename))
+    _, body = encode_multipart(values, boundary=BOUNDARY)
+    return body
+
+
+class StreamingUploadReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        # A tiny read size splits boundaries and headers across reads
+        self.reader = StreamingUploadReader(chunk_size=7, max_field_bytes=64)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def read(self, body, on_file=None, choose_directory=None):
+        return self.reader.read(
+            io.BytesIO(body), BOUNDARY,
+            choose_directory or (lambda fields: str(self.tmp)),
+            on_file
+        )
+
+    def test_fields_and_files(self):
+        first = os.urandom(5000)
+        second = os.urandom(3000)
+        body = multipart_body(
+            fields=[('location_id', '42')],
+            files=[('photos', 'IMG_0001.JPG', first), ('photos', '../../b.heic', second)],
+        )
+
+        fields, files = self.read(body)
+
+        self.assertEqual(fields, {'location_id': '42'})
+        self.assertEqual([f.filename for f in files], ['IMG_0001.JPG', 'b.heic'])
+        for streamed, data in zip(files, (first, second)):
+            self.assertEqual(streamed.field_name, 'photos')
+            self.assertEqual(Path(streamed.path).parent, self.tmp)
+            self.assertEqual(Path(streamed.path).read_bytes(), data)
+            self.assertEqual(streamed.size, len(data))
+            self.assertEqual(streamed.md5, hashlib.md5(data).hexdigest())
+            self.assertEqual(streamed.sha256, hashlib.sha256(data).hexdigest())
+
+    def test_callbacks_see_preceding_fields(self):
+        body = multipart_body(
+            fields=[('location_id', '7')],
+            files=[('photos', 'a.jpg', b'a' * 100), ('photos', 'b.jpg', b'b' * 100)],
+        )
+        chosen = []
+        finished = []
+
+        def choose_directory(fields):
+            chosen.append(dict(fields))
+            return str(self.tmp)
+
+        def on_file(fields, streamed):
+            # The file is complete on disk by the time the callback fires
+            finished.append((fields['location_id'], Path(streamed.path).read_bytes()))
+
+        self.read(body, on_file=on_file, choose_directory=choose_directory)
+
+        self.assertEqual(chosen, [{'location_id': '7'}] * 2)
+        self.assertEqual(finished, [('7', b'a' * 100), ('7', b'b' * 100)])
+
+    def test_empty_file_input_is_skipped(self):
+        # What a browser sends for a file input left empty (encode_multipart
+        # omits the line break before the next boundary for empty files)
+        body = (
+            f'--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="photos"; filename=""\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+            '\r\n'
+        ).encode() + multipart_body(files=[('photos', 'a.jpg', b'data')]).lstrip(b'\r\n')
+        _, files = self.read(body)
+        self.assertEqual([f.filename for f in files], ['a.jpg'])
+
+    def test_disallowed_extension(self):
+        body = multipart_body(files=[('photos', 'a.jpg', b'ok'), ('photos', 'notes.txt', b'no')])
+        with self.assertRaises(UploadError) as raised:
+            self.read(body)
+        self.assertEqual(raised.exception.status_code, 415)
+        # The completed first file is left for the caller to clean up
+        self.assertEqual(len(list(self.tmp.iterdir())), 1)
+
+    def test_oversized_field(self):
+        body = multipart_body(fields=[('note', 'x' * 65)])
+        with self.assertRaises(UploadError) as raised:
+            self.read(body)
+        self.assertEqual(raised.exception.status_code, 413)
+
+    def test_partial_file_is_removed_when_processing_fails(self):
+        body = multipart_body(files=[('photos', 'a.jpg', b'a' * 1000)])
+
+        # Truncate the body in the middle of the file part
+        with self.assertRaises(UploadError) as raised:
+            self.read(body[:len(body) // 2])
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(list(self.tmp.iterdir()), [])
+
+    def test_rejected_by_choose_directory(self):
+        def choose_directory(fields):
+            raise UploadError('Location not found', 404)
+
+        body = multipart_body(files=[('photos', 'a.jpg', b'data')])
+        with self.assertRaises(UploadError) as raised:
+            self.read(body, choose_directory=choose_directory)
+        self.assertEqual(raised.exception.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
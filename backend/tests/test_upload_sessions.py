@@ -0,0 +1,193 @@
+"""Resumable upload sessions: chunk offsets, checksums, resume and hand-off."""
+import base64
+import fcntl
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from app.db import dict_factory
+from app.upload_sessions import UploadError, UploadSessionManager
+
+SQL_DIR = Path(__file__).resolve().parent.parent / 'sql'
+USER_ID = 1
+
+
+def sha256_header(data: bytes) -> str:
+    return 'sha256 ' + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+class FailingStream(io.BytesIO):
+    """A request body whose connection drops after the first block."""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        if self.reads > 1:
+            raise ConnectionResetError('client went away')
+        return super().read(size)
+
+
+class UploadSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.connection = sqlite3.connect(self.tmp / 'sessions.db')
+        self.connection.row_factory = dict_factory
+        self.connection.executescript((SQL_DIR / 'add_upload_sessions.sql').read_text())
+        self.manager = UploadSessionManager(str(self.tmp / 'parts'), chunk_max_bytes=256 * 1024)
+        self.data = os.urandom(300 * 1024)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def create(self, length=None):
+        return self.manager.create(self.connection, USER_ID, 'photo.jpg', length or len(self.data))
+
+    def append(self, session, offset, chunk, checksum=None):
+        session = self.manager.get(self.connection, session['id'], USER_ID)
+        return self.manager.append_chunk(self.connection, session, offset, io.BytesIO(chunk), checksum)
+
+    def part_bytes(self, session):
+        return self.manager._part_path(session['id']).read_bytes()
+
+    def test_chunks_advance_offset_until_complete(self):
+        session = self.create()
+        self.assertEqual(self.append(session, 0, self.data[:100 * 1024]), 100 * 1024)
+        self.assertEqual(self.manager.get(self.connection, session['id'], USER_ID)['status'], 'uploading')
+
+        self.assertEqual(self.append(session, 100 * 1024, self.data[100 * 1024:]), len(self.data))
+        session = self.manager.get(self.connection, session['id'], USER_ID)
+        self.assertEqual(session['status'], 'complete')
+        self.assertEqual(self.part_bytes(session), self.data)
+
+        with self.assertRaises(UploadError) as raised:
+            self.append(session, len(self.data), b'more')
+        self.assertEqual(raised.exception.status_code, 409)
+
+    def test_offset_mismatch_is_rejected(self):
+        session = self.create()
+        self.append(session, 0, self.data[:1000])
+
+        # A retried chunk the server already has
+        with self.assertRaises(UploadError) as raised:
+            self.append(session, 0, self.data[:1000])
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertIn('1000', str(raised.exception))
+        self.assertEqual(self.part_bytes(session), self.data[:1000])
+
+    def test_interrupted_chunk_resumes_from_last_good_offset(self):
+        session = self.create()
+        self.append(session, 0, self.data[:1000])
+
+        session = self.manager.get(self.connection, session['id'], USER_ID)
+        with self.assertRaises(ConnectionResetError):
+            self.manager.append_chunk(self.connection, session, 1000, FailingStream(self.data[1000:200 * 1024]))
+
+        session = self.manager.get(self.connection, session['id'], USER_ID)
+        self.assertEqual(session['upload_offset'], 1000)
+        self.assertEqual(self.part_bytes(session), self.data[:1000])
+
+        self.append(session, 1000, self.data[1000:200 * 1024])
+        self.append(session, 200 * 1024, self.data[200 * 1024:])
+        self.assertEqual(self.part_bytes(session), self.data)
+
+    def test_checksum_mismatch_discards_chunk(self):
+        session = self.create()
+        chunk = self.data[:1000]
+
+        with self.assertRaises(UploadError) as raised:
+            self.append(session, 0, chunk, checksum=sha256_header(b'something else'))
+        self.assertEqual(raised.exception.status_code, 460)
+        self.assertEqual(self.part_bytes(session), b'')
+
+        self.assertEqual(self.append(session, 0, chunk, checksum=sha256_header(chunk)), 1000)
+
+    def test_chunk_limits(self):
+        session = self.create(length=1000)
+        with self.assertRaises(UploadError) as raised:
+            self.append(session, 0, self.data[:1001])
+        self.assertEqual(raised.exception.status_code, 413)
+
+        session = self.create()
+        with self.assertRaises(UploadError) as raised:
+            self.append(session, 0, self.data[:257 * 1024])
+        self.assertEqual(raised.exception.status_code, 413)
+        self.assertEqual(self.part_bytes(session), b'')
+
+    def test_concurrent_chunk_is_rejected(self):
+        session = self.create()
+        with open(self.manager._part_path(session['id']), 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            with self.assertRaises(UploadError) as raised:
+                self.append(session, 0, self.data[:1000])
+        self.assertEqual(raised.exception.status_code, 409)
+
+    def test_take_completed(self):
+        session = self.create()
+        incomplete = self.create()
+        self.append(session, 0, self.data[:200 * 1024])
+        self.append(session, 200 * 1024, self.data[200 * 1024:])
+        batch_dir = self.tmp / 'batch'
+        batch_dir.mkdir()
+
+        with self.assertRaises(UploadError) as raised:
+            self.manager.take_completed(self.connection, [session['id'], incomplete['id']], USER_ID, str(batch_dir))
+        self.assertEqual(raised.exception.status_code, 409)
+
+        files = self.manager.take_completed(self.connection, [session['id']], USER_ID, str(batch_dir))
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0]['original_filename'], 'photo.jpg')
+        self.assertEqual(Path(files[0]['path']).read_bytes(), self.data)
+        self.assertIsNone(self.manager.get(self.connection, session['id'], USER_ID))
+
+    def test_uncommitted_take_can_be_restored(self):
+        session = self.create(length=1000)
+        self.append(session, 0, self.data[:1000])
+        batch_dir = self.tmp / 'batch'
+        batch_dir.mkdir()
+
+        files = self.manager.take_completed(
+            self.connection, [session['id']], USER_ID, str(batch_dir), commit=False
+        )
+        self.connection.rollback()
+        self.manager.restore(files)
+
+        self.assertEqual(self.manager.get(self.connection, session['id'], USER_ID)['status'], 'complete')
+        files = self.manager.take_completed(self.connection, [session['id']], USER_ID, str(batch_dir))
+        self.assertEqual(Path(files[0]['path']).read_bytes(), self.data[:1000])
+
+    def test_expired_sessions_are_discarded(self):
+        session = self.create()
+        self.connection.execute(
+            "UPDATE UploadSessions SET expires_at = ? WHERE id = ?",
+            (int(time.time()) - 1, session['id'])
+        )
+        self.connection.commit()
+
+        self.assertIsNone(self.manager.get(self.connection, session['id'], USER_ID))
+        self.assertEqual(self.manager.cleanup_expired(self.connection), 1)
+        self.assertFalse(self.manager._part_path(session['id']).exists())
+
+    def test_create_validation(self):
+        for filename, length, status_code in (
+            ('notes.txt', 10, 415),
+            ('photo.jpg', 0, 400),
+            ('photo.jpg', self.manager.file_max_bytes + 1, 413),
+        ):
+            with self.assertRaises(UploadError) as raised:
+                self.manager.create(self.connection, USER_ID, filename, length)
+            self.assertEqual(raised.exception.status_code, status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
-from app import app
+from app import app, start_background_services
+
+start_background_services()
 
 if __name__ == "__main__":
     app.run()
@@ -10,6 +10,7 @@ import L, { MarkerClusterGroup } from 'leaflet'
 import { divIcon } from 'leaflet'
 import 'leaflet.markercluster'
 import type { Photo } from '@/types'
+import { placeholderStyleAttr } from '@/lib/utils'
 
 interface ClusterLayerProps {
   children: ReactElement | ReactElement[]
@@ -71,6 +72,7 @@ export function ClusterLayer({
               src="${photo.file_url}"
               alt="${photo.original_filename}"
               class="photo-marker-img"
+              style="${placeholderStyleAttr(photo)}"
             />
           </div>
         `,
@@ -90,6 +92,7 @@ export function ClusterLayer({
             src="${photo.file_url}"
             alt="${photo.original_filename}"
             class="w-full h-32 object-cover rounded-md mb-2"
+            style="${placeholderStyleAttr(photo)}"
           />
           <p class="text-sm font-medium">
             ${photo.location?.name || 'Unknown Location'}
@@ -6,6 +6,7 @@
 import { Marker, Popup } from 'react-leaflet'
 import { divIcon } from 'leaflet'
 import type { Photo } from '@/types'
+import { placeholderStyle, placeholderStyleAttr } from '@/lib/utils'
 
 const API_BASE_URL = ''
 
@@ -30,6 +31,7 @@ export function PhotoMarker({ photo, onClick }: PhotoMarkerProps) {
           src="${photoUrl}"
           alt="${photo.original_filename}"
           class="photo-marker-img"
+          style="${placeholderStyleAttr(photo)}"
         />
       </div>
     `,
@@ -53,6 +55,7 @@ export function PhotoMarker({ photo, onClick }: PhotoMarkerProps) {
             src={photoUrl}
             alt={photo.original_filename}
             className="w-full h-32 object-cover rounded-md mb-2"
+            style={placeholderStyle(photo)}
           />
           <div className="flex items-start justify-between gap-2 mb-1">
             <p className="text-sm font-medium truncate">
@@ -8,7 +8,7 @@ import { Input } from '@/components/ui/input'
 import { Avatar, AvatarFallback } from '@/components/ui/avatar'
 import { Button } from '@/components/ui/button'
 import type { Trip } from '@/types'
-import { cn } from '@/lib/utils'
+import { cn, placeholderStyle } from '@/lib/utils'
 
 const API_BASE_URL = ''
 
@@ -168,6 +168,7 @@ function TripCard({ trip, onClick }: TripCardProps) {
             src={`${API_BASE_URL}${trip.cover_photo.file_url}`}
             alt={trip.title}
             className="absolute inset-0 w-full h-full object-cover"
+            style={placeholderStyle(trip.cover_photo)}
           />
         ) : (
           <div className="absolute inset-0 flex items-center justify-center text-white/20 text-xs">
@@ -9,7 +9,7 @@ import { Button } from '@/components/ui/button'
 import { Separator } from '@/components/ui/separator'
 import { ShareTripModal } from '@/components/trip/ShareTripModal'
 import type { Trip, Location } from '@/types'
-import { cn } from '@/lib/utils'
+import { cn, placeholderStyle } from '@/lib/utils'
 
 const API_BASE_URL = ''
 
@@ -104,6 +104,7 @@ export function TripDetailView({ trip, onBack, onLocationClick, locations }: Tri
             src={`${API_BASE_URL}${trip.cover_photo.file_url}`}
             alt={trip.title}
             className="absolute inset-0 w-full h-full object-cover"
+            style={placeholderStyle(trip.cover_photo)}
           />
         ) : (
           <div className="absolute inset-0 flex items-center justify-center text-white/20 text-xs">
@@ -8,7 +8,7 @@ import { ArrowLeft, Search, User, Star } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import { Input } from '@/components/ui/input'
 import type { Trip } from '@/types'
-import { cn } from '@/lib/utils'
+import { cn, placeholderStyle } from '@/lib/utils'
 
 const API_BASE_URL = ''
 
@@ -208,6 +208,7 @@ function TripCard({ trip, onClick, isShared }: TripCardProps) {
             src={`${API_BASE_URL}${trip.cover_photo.file_url}`}
             alt={trip.title}
             className="absolute inset-0 w-full h-full object-cover"
+            style={placeholderStyle(trip.cover_photo)}
           />
         ) : (
           <div className="absolute inset-0 flex items-center justify-center text-white/20 text-xs">
@@ -2,6 +2,7 @@ import React, { useState, useCallback, useRef, useEffect } from 'react'
 import { Button } from '@/components/ui/button'
 import { Upload, X, MapPin } from 'lucide-react'
 import { UploadState } from '@/types'
+import { photoAPI } from '@/services/api'
 
 interface FileSelectStepProps {
   onFilesSelected: (files: File[], previews: UploadState['previews']) => void
@@ -38,31 +39,13 @@ export function FileSelectStep({ onFilesSelected, onClose }: FileSelectStepProps
 
     try {
       // Send files to backend for EXIF extraction
-      const formData = new FormData()
-      imageFiles.forEach(file => {
-        formData.append('files', file)
-      })
-
       console.log('Sending files to backend for EXIF extraction...')
-      const response = await fetch('/api/photos/extract-exif', {
-        method: 'POST',
-        body: formData,
-      })
-
-      if (!response.ok) {
-        throw new Error(`Backend error: ${response.statusText}`)
-      }
-
-      const data = await response.json()
-      console.log('EXIF data from backend:', data)
-
-      if (!data.success) {
-        throw new Error(data.error || 'Failed to extract EXIF data')
-      }
+      const photos = await photoAPI.extractExif(imageFiles)
+      console.log('EXIF data from backend:', photos)
 
       // Merge backend EXIF data and previews
       const mergedPreviews = imageFiles.map((file, index) => {
-        const exifResult = data.photos[index]
+        const exifResult = photos[index]
         const coordinates = exifResult?.coordinates?.latitude && exifResult?.coordinates?.longitude
           ? {
               x: exifResult.coordinates.longitude,
@@ -70,9 +53,10 @@ export function FileSelectStep({ onFilesSelected, onClose }: FileSelectStepProps
             }
           : undefined
 
-        // Prefer backend-generated JPEG preview (works for HEIC), fall back to object URL
+        // Prefer backend-generated JPEG preview (works for HEIC, cached by content hash),
+        // fall back to object URL
         const preview =
-          exifResult?.preview_data_url ||
+          exifResult?.preview_url ||
           URL.createObjectURL(file)
 
         return {
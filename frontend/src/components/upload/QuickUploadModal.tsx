@@ -198,21 +198,16 @@ export function QuickUploadModal({ isOpen, onClose, onUploadComplete }: QuickUpl
     setFiles(newFiles)
     setIsProcessing(true)
     try {
-      const form = new FormData()
-      imgs.forEach(f => form.append('files', f))
-      const r = await fetch('/api/photos/extract-exif', { method: 'POST', body: form })
-      if (!r.ok) throw new Error('EXIF request failed')
-      const data = await r.json()
-      if (!data?.success) throw new Error(data?.error || 'EXIF parse failed')
+      const photos = await photoAPI.extractExif(imgs)
 
       const merged: PreviewItem[] = imgs.map((file, index) => {
-        const ex = data.photos[index]
+        const ex = photos[index]
         const coords =
           ex?.coordinates?.latitude && ex?.coordinates?.longitude
             ? { x: ex.coordinates.longitude, y: ex.coordinates.latitude }
             : undefined
         const preview: string =
-          ex?.preview_data_url ||
+          ex?.preview_url ||
           URL.createObjectURL(file)
         return { file, preview, coordinates: coords, exifData: ex }
       })
@@ -274,6 +269,8 @@ export function QuickUploadModal({ isOpen, onClose, onUploadComplete }: QuickUpl
       const requests: UploadPhotoRequest[] = previews.map(p => ({
         file: p.file,
         location_id: finalLocationId,
+        upload_token: p.exifData?.upload_token,
+        content_hash: p.exifData?.content_hash,
         x: p.coordinates?.x,
         y: p.coordinates?.y,
         is_cover_photo: false,
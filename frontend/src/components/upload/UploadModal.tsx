@@ -167,6 +167,8 @@ export function UploadModal({ isOpen, onClose, onUploadComplete }: UploadModalPr
       const uploadRequests: UploadPhotoRequest[] = uploadState.previews.map(preview => ({
         file: preview.file,
         location_id: finalLocationId!,
+        upload_token: preview.exifData?.upload_token,
+        content_hash: preview.exifData?.content_hash,
         x: preview.coordinates?.x,
         y: preview.coordinates?.y,
         is_cover_photo: false,
@@ -1,6 +1,25 @@
+import type { CSSProperties } from "react"
 import { clsx, type ClassValue } from "clsx"
 import { twMerge } from "tailwind-merge"
 
 export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs))
 }
+
+type PlaceholderPhoto = { placeholder?: string | null } | null | undefined
+
+/** Style that paints a photo's inline placeholder behind an <img> until it loads */
+export function placeholderStyle(photo: PlaceholderPhoto): CSSProperties | undefined {
+  if (!photo?.placeholder) return undefined
+  return {
+    backgroundImage: `url("${photo.placeholder}")`,
+    backgroundSize: "cover",
+    backgroundPosition: "center",
+  }
+}
+
+/** Same as placeholderStyle, as an inline style string for HTML map markers */
+export function placeholderStyleAttr(photo: PlaceholderPhoto): string {
+  if (!photo?.placeholder) return ""
+  return `background-image:url('${photo.placeholder}');background-size:cover;background-position:center;`
+}
@@ -2,6 +2,33 @@ import { Trip, Location, Photo, CreateTripRequest, CreateLocationRequest, Upload
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || '/api'
 
+// Batches bigger than this go through the resumable chunked upload API
+const RESUMABLE_UPLOAD_THRESHOLD = 24 * 1024 * 1024
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+const UPLOAD_CHUNK_RETRIES = 5
+
+async function chunkChecksum(chunk: Blob): Promise<string | null> {
+  // crypto.subtle is only available in secure contexts (https / localhost)
+  if (!globalThis.crypto?.subtle) {
+    return null
+  }
+  const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer())
+  const bytes = new Uint8Array(digest)
+  let binary = ''
+  bytes.forEach((byte) => {
+    binary += String.fromCharCode(byte)
+  })
+  return `sha256 ${btoa(binary)}`
+}
+
+async function fileSha256Hex(file: Blob): Promise<string | null> {
+  if (!globalThis.crypto?.subtle) {
+    return null
+  }
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer())
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('')
+}
+
 export const tripAPI = {
   async getAllTrips(): Promise<Trip[]> {
     // Use /all endpoint to get both owned and shared trips with access control info
@@ -110,17 +137,192 @@ export const photoAPI = {
     return data.photos || []
   },
 
+  async extractExif(files: File[]): Promise<any[]> {
+    // Files the server already stores are described by the preflight,
+    // so only the rest are sent to extract-exif
+    const photos: any[] = files.map(() => null)
+    const hashes = await Promise.all(files.map((file) => fileSha256Hex(file)))
+    if (hashes.every((hash) => hash !== null)) {
+      try {
+        const response = await fetch(`${API_BASE_URL}/photos/preflight`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          credentials: 'include',
+          body: JSON.stringify({
+            files: files.map((file, index) => ({
+              content_hash: hashes[index],
+              size: file.size,
+              original_filename: file.name,
+            })),
+          }),
+        })
+        const data = await response.json()
+        if (response.ok && data.success) {
+          data.results.forEach((result: { stored: string | null; content_hash: string; photo?: any }, index: number) => {
+            if (result.stored && result.photo) {
+              photos[index] = { ...result.photo, content_hash: result.content_hash }
+            }
+          })
+        }
+      } catch (error) {
+        console.warn('Upload preflight failed, sending all files:', error)
+      }
+    }
+
+    const pending = files.filter((_, index) => photos[index] === null)
+    if (pending.length > 0) {
+      const formData = new FormData()
+      pending.forEach((file) => {
+        formData.append('files', file)
+      })
+
+      const response = await fetch(`${API_BASE_URL}/photos/extract-exif`, {
+        method: 'POST',
+        credentials: 'include',
+        body: formData,
+      })
+      const data = await response.json().catch(() => ({ error: response.statusText }))
+      if (!response.ok || !data.success) {
+        throw new Error(data.error || 'Failed to extract EXIF data')
+      }
+
+      let next = 0
+      photos.forEach((photo, index) => {
+        if (photo === null) {
+          photos[index] = data.photos[next++]
+        }
+      })
+    }
+
+    return photos
+  },
+
   async uploadPhotos(requests: UploadPhotoRequest[]): Promise<Photo[]> {
     if (requests.length === 0) {
       return []
     }
 
-    // All photos should go to the same location
+    const photos: Photo[] = []
+    const unchecked: UploadPhotoRequest[] = []
+    const toUpload: UploadPhotoRequest[] = []
+
+    // Files the preflight in extractExif() found stored are linked by content hash
+    const stored = requests.filter((request) => request.content_hash)
+    if (stored.length > 0) {
+      const { photos: linkedPhotos, remaining } = await this.linkStoredPhotos(
+        stored,
+        stored.map((request) => request.content_hash as string)
+      )
+      photos.push(...linkedPhotos)
+      toUpload.push(...remaining)
+    }
+
+    // Files staged during EXIF extraction are committed by token, without re-sending bytes
+    const staged = requests.filter((request) => !request.content_hash && request.upload_token)
+    if (staged.length > 0) {
+      const committed = await this.commitStagedPhotos(staged)
+      if (committed) {
+        photos.push(...committed)
+      } else {
+        unchecked.push(...staged)
+      }
+    }
+
+    // Anything else is checked against the server's stored files before its bytes are sent
+    unchecked.push(...requests.filter((request) => !request.content_hash && !request.upload_token))
+    if (unchecked.length > 0) {
+      const { photos: linkedPhotos, remaining } = await this.linkStoredPhotos(unchecked)
+      photos.push(...linkedPhotos)
+      toUpload.push(...remaining)
+    }
+
+    if (toUpload.length > 0) {
+      photos.push(...(await this.uploadPhotoFiles(toUpload)))
+    }
+    return photos
+  },
+
+  async linkStoredPhotos(
+    requests: UploadPhotoRequest[],
+    contentHashes?: string[]
+  ): Promise<{ photos: Photo[]; remaining: UploadPhotoRequest[] }> {
+    // With contentHashes the caller already knows the files are stored; skip the preflight
+    const hashes = contentHashes ?? await Promise.all(requests.map((request) => fileSha256Hex(request.file)))
+    if (hashes.some((hash) => hash === null)) {
+      return { photos: [], remaining: requests }
+    }
+
+    const files = requests.map((request, index) => ({
+      content_hash: hashes[index] as string,
+      size: request.file.size,
+      original_filename: request.file.name,
+    }))
+
+    try {
+      const storedIndexes = new Set<number>()
+      if (contentHashes) {
+        requests.forEach((_, index) => storedIndexes.add(index))
+      } else {
+        const preflight = await fetch(`${API_BASE_URL}/photos/preflight`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          credentials: 'include',
+          body: JSON.stringify({ files }),
+        })
+        const preflightData = await preflight.json()
+        if (!preflight.ok || !preflightData.success) {
+          return { photos: [], remaining: requests }
+        }
+
+        preflightData.results.forEach((result: { stored: string | null }, index: number) => {
+          if (result.stored) {
+            storedIndexes.add(index)
+          }
+        })
+      }
+      if (storedIndexes.size === 0) {
+        return { photos: [], remaining: requests }
+      }
+
+      const response = await fetch(`${API_BASE_URL}/photos/link`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'include',
+        body: JSON.stringify({
+          location_id: requests[0].location_id,
+          files: files.filter((_, index) => storedIndexes.has(index)),
+        }),
+      })
+      const data = await response.json()
+      if (!response.ok || !data.success) {
+        return { photos: [], remaining: requests }
+      }
+
+      // Anything that vanished between preflight and link is uploaded normally
+      const missing = new Set((data.missing || []).map((item: { content_hash: string }) => item.content_hash))
+      return {
+        photos: data.photos || [],
+        remaining: requests.filter((_, index) => !storedIndexes.has(index) || missing.has(files[index].content_hash)),
+      }
+    } catch (error) {
+      console.warn('Upload preflight failed, uploading all files:', error)
+      return { photos: [], remaining: requests }
+    }
+  },
+
+  async uploadPhotoFiles(requests: UploadPhotoRequest[]): Promise<Photo[]> {
     const locationId = requests[0].location_id
 
+    const totalBytes = requests.reduce((sum, request) => sum + request.file.size, 0)
+    if (totalBytes > RESUMABLE_UPLOAD_THRESHOLD) {
+      return this.uploadPhotosResumable(requests)
+    }
+
     // Create FormData for batch upload
     const formData = new FormData()
     formData.append('location_id', locationId.toString())
+    // Let the backend process the batch in the background and poll for the result
+    formData.append('async', 'true')
 
     // Add all files to the FormData
     requests.forEach((request) => {
@@ -152,9 +354,159 @@ export const photoAPI = {
       throw new Error(data.error || 'Upload failed')
     }
 
+    if (response.status === 202 && data.job_id) {
+      const result = await this.waitForJob(data.job_id)
+      return result.photos || []
+    }
+
     return data.photos || []
   },
 
+  async commitStagedPhotos(requests: UploadPhotoRequest[]): Promise<Photo[] | null> {
+    const response = await fetch(`${API_BASE_URL}/photos/batch-upload`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'include',
+      body: JSON.stringify({
+        location_id: requests[0].location_id,
+        upload_tokens: requests.map((request) => request.upload_token),
+        async: true,
+      }),
+    })
+
+    // Staged files expired: fall back to uploading the bytes
+    if (response.status === 410) {
+      return null
+    }
+
+    const data = await response.json().catch(() => ({ error: 'Upload failed' }))
+    if (!response.ok || !data.success) {
+      throw new Error(data.error || 'Failed to upload photos')
+    }
+
+    const result = await this.waitForJob(data.job_id)
+    return result.photos || []
+  },
+
+  async uploadPhotosResumable(requests: UploadPhotoRequest[]): Promise<Photo[]> {
+    const locationId = requests[0].location_id
+    const uploadIds: string[] = []
+
+    for (const request of requests) {
+      uploadIds.push(await this.uploadFileInChunks(request.file, locationId))
+    }
+
+    const response = await fetch(`${API_BASE_URL}/uploads/finalize`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'include',
+      body: JSON.stringify({ location_id: locationId, upload_ids: uploadIds }),
+    })
+
+    const data = await response.json().catch(() => ({ error: 'Upload failed' }))
+    if (!response.ok || !data.success) {
+      throw new Error(data.error || 'Failed to upload photos')
+    }
+
+    const result = await this.waitForJob(data.job_id)
+    return result.photos || []
+  },
+
+  async uploadFileInChunks(file: File, locationId: UploadPhotoRequest['location_id']): Promise<string> {
+    const createResponse = await fetch(`${API_BASE_URL}/uploads`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      credentials: 'include',
+      body: JSON.stringify({ filename: file.name, length: file.size, location_id: locationId }),
+    })
+
+    const created = await createResponse.json().catch(() => ({ error: 'Upload failed' }))
+    if (!createResponse.ok || !created.success) {
+      throw new Error(created.error || `Failed to start upload of ${file.name}`)
+    }
+
+    const uploadUrl = `${API_BASE_URL}/uploads/${created.upload.id}`
+    let offset = 0
+    let failures = 0
+
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+      const headers: Record<string, string> = {
+        'Content-Type': 'application/offset+octet-stream',
+        'Upload-Offset': offset.toString(),
+      }
+      const checksum = await chunkChecksum(chunk)
+      if (checksum) {
+        headers['Upload-Checksum'] = checksum
+      }
+
+      try {
+        const response = await fetch(uploadUrl, {
+          method: 'PATCH',
+          headers,
+          credentials: 'include',
+          body: chunk,
+        })
+
+        const serverOffset = response.headers.get('Upload-Offset')
+        if (response.ok) {
+          offset = Number(serverOffset)
+          failures = 0
+          continue
+        }
+        // 409/460: resume from wherever the server says it is
+        if ((response.status === 409 || response.status === 460) && serverOffset !== null) {
+          offset = Number(serverOffset)
+        } else {
+          const error = await response.json().catch(() => ({ error: 'Upload failed' }))
+          throw new Error(error.error || `Failed to upload ${file.name}`)
+        }
+      } catch (error) {
+        if (error instanceof Error && !(error instanceof TypeError)) {
+          throw error
+        }
+        // Network drop: ask the server how much it has before retrying
+        const head = await fetch(uploadUrl, { method: 'HEAD', credentials: 'include' }).catch(() => null)
+        if (head?.ok) {
+          offset = Number(head.headers.get('Upload-Offset'))
+        }
+      }
+
+      failures += 1
+      if (failures > UPLOAD_CHUNK_RETRIES) {
+        throw new Error(`Failed to upload ${file.name} after ${UPLOAD_CHUNK_RETRIES} retries`)
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** (failures - 1)))
+    }
+
+    return created.upload.id
+  },
+
+  async waitForJob(jobId: number, intervalMs = 1000): Promise<any> {
+    // Poll the job status endpoint until the upload job finishes
+    while (true) {
+      const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`, {
+        credentials: 'include',
+      })
+
+      if (!response.ok) {
+        throw new Error('Failed to check upload status')
+      }
+
+      const data = await response.json()
+      const job = data.job
+
+      if (job.status === 'succeeded') {
+        return job.result || {}
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Upload processing failed')
+      }
+
+      await new Promise((resolve) => setTimeout(resolve, intervalMs))
+    }
+  },
+
   async getPhotosByLocation(locationId: string): Promise<Photo[]> {
     const response = await fetch(`${API_BASE_URL}/photos/location/${locationId}`, {
       credentials: 'include'
@@ -64,6 +64,9 @@ export interface Photo {
   original_filename: string
   taken_at?: string // from EXIF data
   is_cover_photo: boolean
+  width?: number | null // as displayed, after EXIF orientation
+  height?: number | null
+  placeholder?: string | null // tiny JPEG data URI shown while the image loads
   // Additional fields
   location?: Location
   location_name?: string
@@ -144,6 +147,8 @@ export interface UpdateLocationRequest extends Partial<CreateLocationRequest> {
 export interface UploadPhotoRequest {
   location_id?: string // Optional if creating new location
   file: File
+  upload_token?: string // Set when extract-exif already staged the file
+  content_hash?: string // Set when the preflight found the file already stored
   x?: number // From EXIF or manual selection
   y?: number
   is_cover_photo?: boolean
@@ -187,6 +192,8 @@ export interface ExifData {
   dateTaken?: string
   camera?: string
   location?: string
+  upload_token?: string // Commits the file staged during EXIF extraction
+  content_hash?: string // Links a file the server already stores
 }
 
 // ============================================